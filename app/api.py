@@ -1,41 +1,168 @@
-from flask import Flask, request, jsonify
-from src.account import AccountRegistry, Account
-from src.accounts_repository import create_mongo_repo_from_env
+import json
+import math
+from flask import Flask, Response, request, jsonify
+from src.account import Account, account_key
+from src.account_import import prepare_accounts
+from src.sharded_registry import ShardedAccountRegistry
+from src.accounts_repository import create_repo_from_env, use_repository_cache_from_env
+from src.idempotency import create_idempotency_cache_from_env
+from src.jobs import JobManager
+from src.journal import create_journal_from_env
+from src.log_pipeline import mask_pesel, route_logger, start_log_pipeline_from_env
+from src.write_behind import create_write_behind_from_env
 
 app = Flask(__name__)
-registry = AccountRegistry()
+# Request threads only queue log records; a listener thread writes them
+log_listener = start_log_pipeline_from_env()
+registry = ShardedAccountRegistry()
+# With a cache the repository holds every account and is what survives a
+# restart, so no journal is kept
+cache_repository = use_repository_cache_from_env(registry)
+journal = create_journal_from_env(registry) if cache_repository is None else None
+write_behind = create_write_behind_from_env(registry, lambda: cache_repository or create_repo_from_env())
+# Save and load run here, one at a time, off the request threads
+jobs = JobManager()
+
+# Responses of transfers sent with an Idempotency-Key, by key and PESEL
+idempotency_cache = create_idempotency_cache_from_env()
+
+MAX_PAGE_SIZE = 1000
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+MAX_BATCH_SIZE = 10000
+MAX_BULK_ACCOUNTS = 100000
+TRANSFER_TYPES = ('incoming', 'outgoing', 'express')
+
+
+def record_change(record, *accounts):
+    # Called under the accounts' locks after every change, so an account's
+    # records are journaled in the order its changes were applied
+    if write_behind is not None:
+        write_behind.mark(*(account.pesel for account in accounts))
+    if journal is None:
+        return 0
+    seq = journal.append(record)
+    for account in accounts:
+        account.journal_seq = seq
+    return seq
+
+
+def log_request(message, *args):
+    # Logged as bank_app.api.<endpoint>, so each route has its own level and sample rate
+    route_logger(request.endpoint).info(message, *args)
+
+
+def journal_commit(seq):
+    # Called after the lock is released, so concurrent requests can share
+    # one fsync before they answer
+    if journal is not None and journal.sync and seq:
+        journal.wait_durable(seq)
+
 
 @app.route("/api/accounts", methods=['POST'])
 def create_account():
     data = request.get_json()
-    print(f"Create account request: {data}")
-    
     if not data or 'name' not in data or 'surname' not in data or 'pesel' not in data:
+        log_request("Create account request without required fields")
         return jsonify({"error": "Missing required fields"}), 400
+    log_request("Create account request: %s", mask_pesel(data["pesel"]))
     
     if registry.find_account_by_pesel(data["pesel"]) is not None:
         return jsonify({"error": "Account with this PESEL already exists"}), 409
     
     account = Account(data["name"], data["surname"], data["pesel"])
-    registry.add_account(account)
+    with registry.locked(account.pesel):
+        if not registry.add_account_if_absent(account):
+            return jsonify({"error": "Account with this PESEL already exists"}), 409
+        seq = record_change({"op": "create", "account": account.to_dict()}, account)
+    journal_commit(seq)
     return jsonify({"message": "Account created"}), 201
 
+def read_bulk_rows():
+    if request.mimetype == 'application/x-ndjson':
+        rows = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+    return request.get_json(silent=True)
+
+
+@app.route("/api/accounts/bulk", methods=['POST'])
+def create_accounts_bulk():
+    rows = read_bulk_rows()
+    log_request("Bulk create request with %d rows", len(rows) if isinstance(rows, list) else 0)
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"error": "Expected a non-empty JSON array or NDJSON body"}), 400
+    if len(rows) > MAX_BULK_ACCOUNTS:
+        return jsonify({"error": f"At most {MAX_BULK_ACCOUNTS} accounts per request"}), 400
+
+    results, accounts, positions = prepare_accounts(rows)
+    seqs = [0]
+    added = registry.add_accounts_if_absent(
+        accounts, lambda account: seqs.append(record_change({"op": "create", "account": account.to_dict()}, account)))
+    journal_commit(max(seqs))
+    for account, position, was_added in zip(accounts, positions, added):
+        if was_added:
+            results[position] = {"pesel": account.pesel, "status": 201}
+        else:
+            results[position] = {"pesel": account.pesel, "status": 409, "error": "Account with this PESEL already exists"}
+
+    return jsonify({"created": sum(added), "results": results}), 200
+
+
+def account_summary(acc):
+    return {"name": acc.first_name, "surname": acc.last_name, "pesel": acc.pesel, "balance": acc.balance}
+
+
+def stream_accounts():
+    for acc in registry.iter_accounts():
+        yield json.dumps(account_summary(acc)) + "\n"
+
+
 @app.route("/api/accounts", methods=['GET'])
 def get_all_accounts():
-    print("Get all accounts request received")
+    log_request("Get all accounts request received")
+    if cache_repository is not None:
+        # Only the cached accounts could be listed, which would disagree
+        # with the count taken from the repository
+        return jsonify({"error": "Listing accounts is not available while accounts are cached from a repository"}), 501
+
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_accounts(), mimetype='application/x-ndjson'), 200
+
+    if 'limit' in request.args or 'after' in request.args:
+        try:
+            limit = int(request.args.get('limit', 100))
+            after = request.args.get('after')
+            after = int(after) if after is not None else None
+        except ValueError:
+            return jsonify({"error": "limit and after must be integers"}), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+        accounts, next_cursor = registry.get_accounts_page(after, limit)
+        return jsonify({
+            "accounts": [account_summary(acc) for acc in accounts],
+            "next": str(next_cursor) if next_cursor is not None else None
+        }), 200
+
     accounts = registry.get_all_accounts()
-    accounts_data = [{"name": acc.first_name, "surname": acc.last_name, "pesel": acc.pesel, "balance": acc.balance} for acc in accounts]
+    accounts_data = [account_summary(acc) for acc in accounts]
     return jsonify(accounts_data), 200
 
 @app.route("/api/accounts/count", methods=['GET'])
 def get_account_count():
-    print("Get account count request received")
+    log_request("Get account count request received")
     count = registry.get_accounts_count()
     return jsonify({"count": count}), 200
 
 @app.route("/api/accounts/<pesel>", methods=['GET'])
 def get_account_by_pesel(pesel):
-    print(f"Get account by pesel request: {pesel}")
+    log_request("Get account by pesel request: %s", mask_pesel(pesel))
     account = registry.find_account_by_pesel(pesel)
     if account is None:
         return jsonify({"error": "Account not found"}), 404
@@ -49,37 +176,49 @@ def get_account_by_pesel(pesel):
 
 @app.route("/api/accounts/<pesel>", methods=['PATCH'])
 def update_account(pesel):
-    print(f"Update account request: {pesel}")
-    account = registry.find_account_by_pesel(pesel)
-    if account is None:
+    log_request("Update account request: %s", mask_pesel(pesel))
+    if registry.find_account_by_pesel(pesel) is None:
         return jsonify({"error": "Account not found"}), 404
     
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    fields = {}
     if 'name' in data:
-        account.first_name = data['name']
+        fields['first_name'] = data['name']
     if 'surname' in data:
-        account.last_name = data['surname']
+        fields['last_name'] = data['surname']
+    with registry.locked(pesel):
+        # Looked up again under the lock: a cached account can be evicted
+        # between the check above and this point
+        account = registry.find_account_by_pesel(pesel)
+        if account is None:
+            return jsonify({"error": "Account not found"}), 404
+        for field, value in fields.items():
+            setattr(account, field, value)
+        account.mark_dirty()
+        seq = record_change({"op": "update", "pesel": pesel, "fields": fields}, account)
+    journal_commit(seq)
     
     return jsonify({"message": "Account updated"}), 200
 
 @app.route("/api/accounts/<pesel>", methods=['DELETE'])
 def delete_account(pesel):
-    print(f"Delete account request: {pesel}")
-    account = registry.find_account_by_pesel(pesel)
-    if account is None:
-        return jsonify({"error": "Account not found"}), 404
-    
-    registry.accounts.remove(account)
+    log_request("Delete account request: %s", mask_pesel(pesel))
+    with registry.locked(pesel):
+        account = registry.find_account_by_pesel(pesel)
+        if account is None:
+            return jsonify({"error": "Account not found"}), 404
+        registry.remove_account(account)
+        seq = record_change({"op": "delete", "pesel": pesel}, account)
+    journal_commit(seq)
     return jsonify({"message": "Account deleted"}), 200
 
 @app.route("/api/accounts/<pesel>/transfer", methods=['POST'])
 def transfer(pesel):
-    print(f"Transfer request for pesel: {pesel}")
-    account = registry.find_account_by_pesel(pesel)
-    if account is None:
+    log_request("Transfer request for pesel: %s", mask_pesel(pesel))
+    if registry.find_account_by_pesel(pesel) is None:
         return jsonify({"error": "Account not found"}), 404
     
     data = request.get_json()
@@ -89,60 +228,257 @@ def transfer(pesel):
     transfer_type = data['type']
     amount = data['amount']
     
-    if transfer_type not in ['incoming', 'outgoing', 'express']:
+    if transfer_type not in TRANSFER_TYPES:
         return jsonify({"error": "Invalid transfer type"}), 400
+
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        return jsonify({"error": f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}), 400
     
+    with registry.locked(pesel):
+        # Retries with the same key wait here for the first attempt, then
+        # get its response without the account being touched again
+        if idempotency_key is not None:
+            stored = idempotency_cache.get((idempotency_key, pesel))
+            if stored is not None:
+                return replayed_response(stored, (transfer_type, amount))
+        account = registry.find_account_by_pesel(pesel)
+        if account is None:
+            return jsonify({"error": "Account not found"}), 404
+        body, status = apply_transfer(account, transfer_type, amount)
+        seq = record_transfer(account, pesel, transfer_type, amount, status)
+        if idempotency_key is not None:
+            idempotency_cache.put((idempotency_key, pesel), (transfer_type, amount), (body, status))
+    journal_commit(seq)
+    return jsonify(body), status
+
+
+def replayed_response(stored, fingerprint):
+    stored_fingerprint, (body, status) = stored
+    if stored_fingerprint != fingerprint:
+        return jsonify({"error": "Idempotency-Key was already used for a different transfer"}), 422
+    response = jsonify(body)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response, status
+
+
+def record_transfer(account, pesel, transfer_type, amount, status):
+    # Rejected transfers leave the account unchanged and are not journaled
+    if status != 200:
+        return 0
+    return record_change({"op": "transfer", "pesel": pesel, "type": transfer_type, "amount": amount}, account)
+
+
+@app.route("/api/transfers/internal", methods=['POST'])
+def internal_transfer():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'from' not in data or 'to' not in data or 'amount' not in data:
+        log_request("Internal transfer request without required fields")
+        return jsonify({"error": "Missing required fields"}), 400
+    source_pesel, target_pesel, amount = data['from'], data['to'], data['amount']
+    if not isinstance(source_pesel, str) or not isinstance(target_pesel, str):
+        log_request("Internal transfer request with a non-string PESEL")
+        return jsonify({"error": "PESEL must be a string"}), 400
+    log_request("Internal transfer request: %s -> %s, %s", mask_pesel(source_pesel), mask_pesel(target_pesel), amount)
+    if source_pesel == target_pesel:
+        return jsonify({"error": "Source and target accounts must differ"}), 400
+    # The JSON parser accepts NaN and Infinity
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount <= 0:
+        return jsonify({"error": "Amount must be a positive number"}), 400
+
+    # Both accounts stay locked from the balance check to the credit, so no
+    # other request sees the money on both accounts or on neither
+    with registry.locked_for_transfer(source_pesel, target_pesel):
+        source = registry.find_account_by_pesel(source_pesel)
+        target = registry.find_account_by_pesel(target_pesel)
+        if source is None or target is None:
+            return jsonify({"error": "Account not found"}), 404
+        # Refused up front: once the source is debited the credit must not fail
+        if not source.accepts_amount(amount) or not target.accepts_amount(amount):
+            return jsonify({"error": "Amount must be at least 0.01"}), 400
+        if not source.outgoing_transfer(amount):
+            return jsonify({"error": "Insufficient funds"}), 422
+        target.incoming_transfer(amount)
+        seq = record_change({"op": "internal_transfer", "from": source_pesel, "to": target_pesel, "amount": amount},
+                            source, target)
+    journal_commit(seq)
+    return jsonify({"message": "Zlecenie przyjęto do realizacji"}), 200
+
+
+def apply_transfer(account, transfer_type, amount):
     try:
         if transfer_type == 'incoming':
             account.incoming_transfer(amount)
-            return jsonify({"message": "Zlecenie przyjęto do realizacji"}), 200
+            return {"message": "Zlecenie przyjęto do realizacji"}, 200
         elif transfer_type == 'outgoing':
             success = account.outgoing_transfer(amount)
-            if not success:
-                return jsonify({"error": "Insufficient funds"}), 422
-            return jsonify({"message": "Zlecenie przyjęto do realizacji"}), 200
-        elif transfer_type == 'express':
+        else:
             success = account.express_transfer(amount)
-            if not success:
-                return jsonify({"error": "Insufficient funds"}), 422
-            return jsonify({"message": "Zlecenie przyjęto do realizacji"}), 200
+        if not success:
+            return {"error": "Insufficient funds"}, 422
+        return {"message": "Zlecenie przyjęto do realizacji"}, 200
     except Exception as e:
-        return jsonify({"error": str(e)}), 422
+        return {"error": str(e)}, 422
+
+
+@app.route("/api/transfers/batch", methods=['POST'])
+def batch_transfer():
+    items = request.get_json()
+    log_request("Batch transfer request with %d items", len(items) if isinstance(items, list) else 0)
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty list of transfers"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} transfers per batch"}), 400
+
+    results = [None] * len(items)
+    positions_by_pesel = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or 'pesel' not in item or 'amount' not in item or 'type' not in item:
+            results[position] = {"status": 400, "error": "Missing required fields"}
+        elif not isinstance(item['pesel'], str):
+            results[position] = {"status": 400, "error": "PESEL must be a string"}
+        elif item['type'] not in TRANSFER_TYPES:
+            results[position] = {"status": 400, "error": "Invalid transfer type"}
+        else:
+            positions_by_pesel.setdefault(item['pesel'], []).append(position)
+
+    # One lookup and one lock per account; its transfers keep their request order
+    last_seq = 0
+    for pesel, positions in positions_by_pesel.items():
+        with registry.locked(pesel):
+            account = registry.find_account_by_pesel(pesel)
+            for position in positions:
+                if account is None:
+                    results[position] = {"status": 404, "error": "Account not found"}
+                    continue
+                body, status = apply_transfer(account, items[position]['type'], items[position]['amount'])
+                results[position] = {"status": status, **body}
+                last_seq = record_transfer(account, pesel, items[position]['type'], items[position]['amount'],
+                                            status) or last_seq
+    journal_commit(last_seq)
+
+    return jsonify({"results": results}), 200
+
+
+def estimated_size(account):
+    # Rough size of the account as stored: the document without its history
+    # plus eight bytes per entry, so lazily loaded histories stay unloaded
+    return len(json.dumps(account.to_dict(include_history=False))) + 8 * len(account.transaction_history)
+
+
+def detach_for_save(account):
+    # Runs under the account's shard lock: the copy is what gets saved, and
+    # a change made after this point marks the account dirty again
+    saved = account.detached_copy()
+    account.mark_clean()
+    return account, saved
+
+
+def recopy_for_save(pairs, key):
+    with registry.locked(key):
+        account = registry.find_account_by_pesel(key)
+        if account is None:
+            pairs.pop(key, None)
+            return
+        _, saved = detach_for_save(account)
+        if key in pairs and pairs[key][1].is_dirty:
+            # The first copy already took the account's dirty flag
+            saved.mark_dirty()
+        pairs[key] = (account, saved)
+
+
+def job_accepted(job, message):
+    response = jsonify({"message": message, "job_id": job.id, "status_url": f"/api/jobs/{job.id}"})
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response, 202
 
 
 @app.route("/api/accounts/save", methods=['POST'])
 def save_accounts_to_db():
+    if cache_repository is not None:
+        # Only the changed cached accounts differ from the repository
+        def write_back(job):
+            written = registry.accounts.write_back()
+            job.advance(written)
+            return {"count": registry.get_accounts_count(), "written": written, "deleted": 0}
+
+        return job_accepted(jobs.submit("save", write_back), "Save started")
+
     try:
-        repo = create_mongo_repo_from_env()
+        repo = create_repo_from_env()
     except Exception as e:
         return jsonify({"error": "DB driver not available or connection failed", "details": str(e)}), 500
 
-    try:
-        accounts = registry.get_all_accounts()
-        repo.save_all(accounts)
-        return jsonify({"message": "Saved accounts to DB", "count": len(accounts)}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    def save(job):
+        pairs = {}
+        # Copied while transfers go on; the accounts an internal transfer
+        # touched meanwhile are copied again with transfers paused, so the
+        # pause lasts for those accounts only
+        with registry.tracking_transfers() as touched:
+            for account, saved in registry.export(detach_for_save):
+                pairs[account_key(account)] = (account, saved)
+                job.advance(1, estimated_size(saved) if saved.is_dirty else 0)
+            with registry.transfers_paused():
+                for key in touched:
+                    recopy_for_save(pairs, key)
+        try:
+            written = repo.save_all([saved for _, saved in pairs.values()])
+        except Exception:
+            for account, saved in pairs.values():
+                if saved.is_dirty:
+                    account.mark_dirty()
+            raise
+        result = {"count": len(pairs)}
+        if isinstance(written, dict):
+            result.update(written)
+        return result
+
+    return job_accepted(jobs.submit("save", save), "Save started")
 
 
 @app.route("/api/accounts/load", methods=['POST'])
 def load_accounts_from_db():
+    if cache_repository is not None:
+        # Dropping the cache makes every account come from the repository again
+        def drop_cache(job):
+            registry.accounts.clear()
+            return {"count": registry.get_accounts_count()}
+
+        return job_accepted(jobs.submit("load", drop_cache), "Load started")
+
     try:
-        repo = create_mongo_repo_from_env()
+        repo = create_repo_from_env()
     except Exception as e:
         return jsonify({"error": "DB driver not available or connection failed", "details": str(e)}), 500
 
-    try:
-        accounts = repo.load_all()
-        registry.accounts.clear()
-        for acc in accounts:
-            registry.add_account(acc)
-        return jsonify({"message": "Loaded accounts from DB", "count": len(accounts)}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    def load(job):
+        def counted(accounts):
+            for account in accounts:
+                job.advance(1, estimated_size(account))
+                yield account
+
+        count = registry.replace_accounts(counted(repo.load_all()))
+        if journal is not None:
+            # The loaded accounts replace everything the journal describes
+            journal.write_snapshot(registry)
+        return {"count": count}
+
+    return job_accepted(jobs.submit("load", load), "Load started")
+
 
+@app.route("/api/write-behind", methods=['GET'])
+def get_write_behind_stats():
+    if write_behind is None:
+        return jsonify({"error": "Write-behind persistence is not enabled"}), 404
+    return jsonify(write_behind.stats()), 200
 
 
+@app.route("/api/jobs/<job_id>", methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
 
 
 if __name__ == '__main__':
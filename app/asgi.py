@@ -0,0 +1,196 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from werkzeug.exceptions import HTTPException
+
+import app.api as api
+
+# Only read or change accounts held in memory, so they stay on the event loop
+INLINE_READS = {'get_account_by_pesel', 'get_account_count', 'get_job', 'get_write_behind_stats'}
+# Change the account in their path; inline unless they have to wait for a journal fsync
+INLINE_WRITES = {'update_account', 'delete_account', 'transfer'}
+# Streamed bodies are handed to the server in pieces of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+def runs_inline(endpoint):
+    if endpoint is None:
+        # Unknown routes and methods; Flask answers them right away
+        return True
+    if api.cache_repository is not None:
+        # A cache miss reads the repository
+        return False
+    if endpoint in INLINE_READS:
+        return True
+    if endpoint in INLINE_WRITES:
+        return api.journal is None or not api.journal.sync
+    return False
+
+
+class _NoLock:
+    # Routes without an account in their path take no shard lock up front
+    def release(self):
+        pass
+
+
+_NO_LOCK = _NoLock()
+
+
+def try_lock_account(args):
+    """Take the shard lock of the account in the request path if nobody holds it.
+
+    Returns the lock, which the handler then takes again without waiting
+    (shard locks are reentrant), or None when it is busy: bulk creates,
+    batches, save exports and write-behind flushes hold shard locks for
+    long stretches, and waiting for one on the event loop would stall
+    every connection.
+    """
+    if 'pesel' not in args:
+        return _NO_LOCK
+    lock = api.registry.locked(args['pesel'])
+    return lock if lock.acquire(blocking=False) else None
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Call ``wsgi_app``; return the status code, the headers and the body iterable."""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+    body = wsgi_app(environ, start_response)
+    return started[0], started[1], body
+
+
+def read_chunks(body):
+    """Collect about ``CHUNK_SIZE`` bytes from the ``body`` iterator; return them and whether it is finished."""
+    chunks, size = [], 0
+    for chunk in body:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            return b''.join(chunks), False
+    return b''.join(chunks), True
+
+
+class AsgiApp:
+    """Serves the Flask routes of ``app.api`` to an ASGI server such as uvicorn.
+
+    The request body is received on the event loop, then the Flask app
+    handles the request as WSGI. Requests that ``runs_inline`` allows are
+    handled right on the event loop as long as the lock of their account
+    is free; the rest (busy accounts, account creation, repository and
+    journal waits, save and load, whole-registry reads) go to a pool of
+    ``workers`` threads, so no more than that many requests are blocked
+    at once and the loop keeps accepting and answering the others.
+    """
+
+    def __init__(self, wsgi_app, workers=32):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self._url_map = wsgi_app.url_map
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        parts = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            parts.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        environ = wsgi_environ(scope, b''.join(parts))
+
+        endpoint, args = self.endpoint(environ)
+        lock = try_lock_account(args) if runs_inline(endpoint) else None
+        if lock is not None:
+            async def run(function, *args):
+                return function(*args)
+
+            try:
+                status, headers, body = call_wsgi(self.wsgi_app, environ)
+            finally:
+                lock.release()
+        else:
+            loop = asyncio.get_running_loop()
+
+            async def run(function, *args):
+                return await loop.run_in_executor(self._executor, function, *args)
+
+            status, headers, body = await run(call_wsgi, self.wsgi_app, environ)
+        chunks = iter(body)
+        try:
+            chunk, finished = await run(read_chunks, chunks)
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+            while not finished:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk, finished = await run(read_chunks, chunks)
+            await send({'type': 'http.response.body', 'body': chunk})
+        finally:
+            if hasattr(body, 'close'):
+                await run(body.close)
+
+    def endpoint(self, environ):
+        """Return the endpoint and path arguments of the request; ``(None, {})`` when no route matches."""
+        try:
+            return self._url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None, {}
+
+
+asgi_app = AsgiApp(api.app, workers=int(os.environ.get('BANK_APP_ASGI_WORKERS', 32)))
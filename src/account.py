@@ -1,15 +1,148 @@
 from src.operations import Transfer_operations
-import requests
+from src.nip_cache import nip_validation_cache
+from src.mf_client import get_mf_client
+import bisect
+import contextlib
+import itertools
+import logging
 from datetime import datetime
-import os
 try:
     from lib.smtp import SMTPClient
 except Exception:
     from smtp.smtp import SMTPClient
 
+logger = logging.getLogger('bank_app.account')
+
+def account_key(account):
+    # Personal accounts are keyed by PESEL, company accounts by NIP
+    key = getattr(account, 'pesel', None)
+    if key is None:
+        key = getattr(account, 'NIP', None)
+    return key
+
+
+class AccountStore:
+    """Insertion-ordered account storage with a hash index on PESEL/NIP.
+
+    Behaves like the list the registry used to keep (iteration order,
+    ``clear``, ``remove``, ``count``, indexing), but lookups and removals
+    go through the index instead of scanning every account.
+    """
+
+    def __init__(self, accounts=(), slots=None):
+        self._slots = {}
+        self._index = {}
+        # Slots in ascending order for cursor paging; removed slots stay
+        # here until they outnumber the live ones
+        self._order = []
+        self._removed = 0
+        # Set once insert() adds a slot below the newest one; _slots then
+        # no longer iterates in slot order
+        self._out_of_order = False
+        # Slot numbers only need to grow; stores sharing one counter can be
+        # merged back into a single insertion order
+        self._slot_counter = slots if slots is not None else itertools.count()
+        for account in accounts:
+            self.append(account)
+
+    def append(self, account):
+        slot = next(self._slot_counter)
+        self._slots[slot] = account
+        self._order.append(slot)
+        self._index.setdefault(account_key(account), []).append(slot)
+
+    def insert(self, slot, account):
+        # For slots handed out before the account was built, e.g. accounts
+        # materialized on demand from a snapshot
+        if self._order and slot < self._order[-1]:
+            self._out_of_order = True
+        self._slots[slot] = account
+        bisect.insort(self._order, slot)
+        bisect.insort(self._index.setdefault(account_key(account), []), slot)
+
+    def first(self, key):
+        slots = self._index.get(key)
+        if not slots:
+            return None
+        return self._slots[slots[0]]
+
+    def remove(self, account):
+        key = account_key(account)
+        slots = self._index.get(key, [])
+        for position, slot in enumerate(slots):
+            if self._slots[slot] == account:
+                del self._slots[slot]
+                del slots[position]
+                if not slots:
+                    del self._index[key]
+                self._removed += 1
+                if self._removed > len(self._slots):
+                    self._order = [live for live in self._order if live in self._slots]
+                    self._removed = 0
+                return
+        raise ValueError("account not in registry")
+
+    def clear(self):
+        self._slots.clear()
+        self._index.clear()
+        self._order = []
+        self._removed = 0
+        self._out_of_order = False
+
+    def page(self, after=None, limit=None):
+        """Return up to ``limit`` ``(slot, account)`` pairs added after slot ``after``."""
+        position = 0 if after is None else bisect.bisect_right(self._order, after)
+        items = []
+        while position < len(self._order) and (limit is None or len(items) < limit):
+            slot = self._order[position]
+            position += 1
+            if slot in self._slots:
+                items.append((slot, self._slots[slot]))
+        return items
+
+    def export_chunks(self, fn, chunk_size=1000):
+        after = None
+        while True:
+            items = self.page(after, chunk_size)
+            if items:
+                yield [fn(account) for _, account in items]
+            if len(items) < chunk_size:
+                return
+            after = items[-1][0]
+
+    def count(self, account):
+        slots = self._index.get(account_key(account), [])
+        return sum(1 for slot in slots if self._slots[slot] == account)
+
+    def copy(self):
+        if self._out_of_order:
+            return [account for _, account in self.page()]
+        return list(self._slots.values())
+
+    def slot_items(self):
+        if self._out_of_order:
+            return self.page()
+        return list(self._slots.items())
+
+    def __contains__(self, account):
+        return self.count(account) > 0
+
+    def __iter__(self):
+        return iter(self.copy())
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __getitem__(self, position):
+        return self.copy()[position]
+
+    def __eq__(self, other):
+        return self.copy() == other
+
+
 class AccountRegistry:
     def __init__(self):
-        self.accounts = []
+        self.accounts = AccountStore()
     
     def __iter__(self):
         return iter(self.accounts)
@@ -20,22 +153,121 @@ class AccountRegistry:
             self.accounts.append(account)
             return True
         return False
-        
+
+    def add_account_if_absent(self, account):
+        if self.find_account_by_pesel(getattr(account, 'pesel', None)) is not None:
+            return False
+        return self.add_account(account)
+
+    def add_accounts_if_absent(self, accounts, on_added=None):
+        added = []
+        for account in accounts:
+            added.append(self.add_account_if_absent(account))
+            if added[-1] and on_added is not None:
+                on_added(account)
+        return added
+
+    def locked(self, pesel):
+        # The plain registry is not shared between threads, so there is nothing to lock
+        return contextlib.nullcontext()
+
+    def locked_for_transfer(self, source, target):
+        # Held while money moves from one account to another
+        return contextlib.nullcontext()
+
+    def transfers_paused(self):
+        # Held while the accounts touched by transfers during a save are
+        # copied again, so no transfer between two accounts shows up in
+        # the copies on one side only
+        return contextlib.nullcontext()
+
+    def tracking_transfers(self):
+        # Yields the set of PESELs internal transfers touch while it is held
+        return contextlib.nullcontext(set())
+
+    def remove_account(self, account):
+        try:
+            self.accounts.remove(account)
+        except ValueError:
+            return False
+        return True
     
     def find_account_by_pesel(self, pesel):
-        for account in self.accounts:
-            if account.pesel == pesel:
-                return account
-        return None
+        return self.accounts.first(pesel)
 
     def get_all_accounts(self):
         return self.accounts.copy()
+
+    def _new_store(self):
+        return AccountStore()
+
+    def replace_accounts(self, accounts):
+        # Fill a fresh store and swap it in at the end, so requests keep
+        # seeing the old accounts until the new set is complete
+        store = self._new_store()
+        for account in accounts:
+            if hasattr(account, 'pesel'):
+                store.append(account)
+        self.accounts = store
+        return len(store)
+
+    def load_snapshot(self, snapshot):
+        return self.replace_accounts(snapshot.accounts())
+
+    def get_accounts_page(self, after=None, limit=100):
+        # The cursor is the slot of the last account returned; slots only
+        # grow, so pages stay stable while accounts are added or removed
+        items = self.accounts.page(after, limit)
+        next_cursor = items[-1][0] if len(items) == limit else None
+        return [account for _, account in items], next_cursor
+
+    def iter_accounts(self, chunk_size=500):
+        after = None
+        while True:
+            accounts, after = self.get_accounts_page(after, chunk_size)
+            yield from accounts
+            if after is None:
+                return
     
+    def export(self, fn, chunk_size=1000):
+        """Yield ``fn(account)`` for every account.
+
+        The store is read ``chunk_size`` accounts at a time, without any
+        lock: the plain registry is not shared between threads. A store
+        that is shared decides in ``export_chunks`` what each chunk is
+        read under.
+        """
+        for chunk in self.accounts.export_chunks(fn, chunk_size):
+            yield from chunk
+
     def get_accounts_count(self):
         return len(self.accounts)
 
 
+def birth_year_from_pesel(pesel):
+    if pesel == "Invalid" or len(pesel) != 11:
+        return None
+    
+    year_digits = int(pesel[:2])
+    month_digits = int(pesel[2:4])
+    
+    if 1 <= month_digits <= 12:
+        return 1900 + year_digits
+    elif 21 <= month_digits <= 32:
+        return 2000 + year_digits
+    elif 41 <= month_digits <= 52:
+        return 2100 + year_digits
+    elif 61 <= month_digits <= 72:
+        return 2200 + year_digits
+    elif 81 <= month_digits <= 92:
+        return 1800 + year_digits
+    else:
+        return None
+
+
 class Account(Transfer_operations):
+    __slots__ = ('first_name', 'last_name', 'pesel', 'promocode')
+
     def __init__(self, first_name, last_name, pesel, promocode=None, fee=1):
         super().__init__()
         self.first_name = first_name
@@ -45,12 +277,28 @@ class Account(Transfer_operations):
         self.fee = fee
         if self.is_promocode_valid(promocode) and self.is_eligible_for_promotion():
             self.balance += 50
-            self.transaction_history.append(50)
-        
-        
+            self._record(50)
+
+    @classmethod
+    def from_validated(cls, first_name, last_name, pesel, promocode=None, promotion=False, fee=1):
+        # For callers that already checked the PESEL and promo code for a
+        # whole batch; skips the per-account checks done by __init__
+        acc = cls.__new__(cls)
+        Transfer_operations.__init__(acc)
+        acc.first_name = first_name
+        acc.last_name = last_name
+        acc.pesel = pesel
+        acc.promocode = promocode
+        acc.fee = fee
+        if promotion:
+            acc.balance += 50
+            acc._record(50)
+        return acc
         
     def is_pesel_valid(self, pesel):
-        if len(pesel) == 11 and pesel.isdigit():
+        # isdigit alone also takes digits of other scripts, which no PESEL
+        # has and the snapshot's ASCII keys cannot hold
+        if len(pesel) == 11 and pesel.isascii() and pesel.isdigit():
             return True
         return False
     
@@ -62,25 +310,7 @@ class Account(Transfer_operations):
         return False
     
     def get_birth_year_from_pesel(self):
-        
-        if self.pesel == "Invalid" or len(self.pesel) != 11:
-            return None
-        
-        year_digits = int(self.pesel[:2])
-        month_digits = int(self.pesel[2:4])
-        
-        if 1 <= month_digits <= 12:
-            return 1900 + year_digits
-        elif 21 <= month_digits <= 32:
-            return 2000 + year_digits
-        elif 41 <= month_digits <= 52:
-            return 2100 + year_digits
-        elif 61 <= month_digits <= 72:
-            return 2200 + year_digits
-        elif 81 <= month_digits <= 92:
-            return 1800 + year_digits
-        else:
-            return None
+        return birth_year_from_pesel(self.pesel)
 
     def is_eligible_for_promotion(self):
         birth_year = self.get_birth_year_from_pesel()
@@ -90,21 +320,19 @@ class Account(Transfer_operations):
     
     
     def submit_for_loan(self, amount):
+        amount = self._amount(amount)
         if amount <= 0:
             return False
         
-        if len(self.transaction_history) >= 3:
-            last_three_transactions = self.transaction_history[-3:]
-            if all(tx > 0 for tx in last_three_transactions):
-                self.balance += amount
-                self.transaction_history.append(amount)
-                return True
+        if self._positive_streak >= 3:
+            self._add_to_balance(amount)
+            self._record(amount)
+            return True
             
         if len(self.transaction_history) >= 5:
-            last_five_transactions = self.transaction_history[-5:]
-            if sum(last_five_transactions) > amount:
-                self.balance += amount
-                self.transaction_history.append(amount)
+            if self._last_five_sum > amount:
+                self._add_to_balance(amount)
+                self._record(amount)
                 return True
             else: 
                 return False
@@ -118,14 +346,16 @@ class Account(Transfer_operations):
         smtp_client = SMTPClient()
         return smtp_client.send(subject, text, emial)
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_history=True):
+        data = {
             "first_name": self.first_name,
             "last_name": self.last_name,
             "pesel": self.pesel,
             "balance": self.balance,
-            "transaction_history": list(self.transaction_history),
         }
+        if include_history:
+            data["transaction_history"] = list(self.transaction_history)
+        return data
 
     @classmethod
     def from_dict(cls, data: dict):
@@ -134,11 +364,27 @@ class Account(Transfer_operations):
         pesel = data.get('pesel')
         acc = cls(name, last, pesel)
         acc.balance = data.get('balance', 0)
-        acc.transaction_history = list(data.get('transaction_history', []))
+        acc.transaction_history = cls.history_factory(data.get('transaction_history', []))
+        # Built from a stored document, so there is nothing new to save
+        acc.mark_clean()
+        return acc
+
+    @classmethod
+    def from_stored(cls, data: dict):
+        # Trusted hydration for documents written by to_dict: the PESEL was
+        # validated when the account was created, so __init__ is skipped
+        acc = cls.from_validated(data.get('first_name') or data.get('name'),
+                                 data.get('last_name') or data.get('surname'),
+                                 data.get('pesel'))
+        acc.balance = data.get('balance', 0)
+        acc.transaction_history = cls.history_factory(data.get('transaction_history', []))
+        acc.mark_clean()
         return acc
         
     
 class Company_Account(Transfer_operations):
+    __slots__ = ('company_name', 'NIP')
+
     def __init__(self, company_name, NIP, fee =5):
         super().__init__()
         self.company_name = company_name
@@ -149,43 +395,48 @@ class Company_Account(Transfer_operations):
             raise ValueError("Company not registered!!")
 
     def is_NIP_valid(self, NIP):
-        if len(NIP) == 10 and NIP.isdigit():
+        if len(NIP) == 10 and NIP.isascii() and NIP.isdigit():
             return True
         return False
     
     
             
     def take_loan(self, amount):
+        amount = self._amount(amount)
         if amount <= 0:
             return False
 
         if self.balance < amount *2:
             return False
-        if -1775 not in self.transaction_history:
+        if not self._zus_payments:
             return False
-        self.balance += amount
-        self.transaction_history.append(amount)
+        self._add_to_balance(amount)
+        self._record(amount)
         return True
 
     def validate_nip(self, NIP):
-        base_url = os.getenv('BANK_APP_MF_URL', 'https://wl-test.mf.gov.pl/')
-        today = datetime.now().strftime('%Y-%m-%d')
-        url = f"{base_url}api/search/nip/{NIP}?date={today}"
-        
+        cached = nip_validation_cache.get(NIP)
+        if cached is not None:
+            return cached
+
         try:
-            response = requests.get(url)
-            print(f"MF API Response for NIP {NIP}: {response.json()}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'result' in data and 'subject' in data['result']:
-                    status_vat = data['result']['subject'].get('statusVat')
-                    return status_vat == 'Czynny'
+            status_code, data = get_mf_client().search_nip(NIP)
+            logger.debug("MF API response for NIP %s: %s", NIP, data)
             
-            return False
+            if status_code != 200:
+                # Not an answer about the NIP itself, so it is not cached
+                return False
+
+            valid = False
+            if 'result' in data and 'subject' in data['result']:
+                status_vat = data['result']['subject'].get('statusVat')
+                valid = status_vat == 'Czynny'
         except Exception as e:
-            print(f"Error validating NIP {NIP}: {e}")
+            logger.warning("Error validating NIP %s: %s", NIP, e)
             return False
+
+        nip_validation_cache.put(NIP, valid)
+        return valid
     
     def send_history_via_email(self, emial):
         today = datetime.now().strftime('%Y-%m-%d')
@@ -194,13 +445,15 @@ class Company_Account(Transfer_operations):
         smtp_client = SMTPClient()
         return smtp_client.send(subject, text, emial)
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_history=True):
+        data = {
             "company_name": self.company_name,
             "NIP": self.NIP,
             "balance": self.balance,
-            "transaction_history": list(self.transaction_history),
         }
+        if include_history:
+            data["transaction_history"] = list(self.transaction_history)
+        return data
 
     @classmethod
     def from_dict(cls, data: dict):
@@ -208,7 +461,23 @@ class Company_Account(Transfer_operations):
         nip = data.get('NIP') or data.get('nip')
         acc = cls(company_name, nip)
         acc.balance = data.get('balance', 0)
-        acc.transaction_history = list(data.get('transaction_history', []))
+        acc.transaction_history = cls.history_factory(data.get('transaction_history', []))
+        # Built from a stored document, so there is nothing new to save
+        acc.mark_clean()
+        return acc
+
+    @classmethod
+    def from_stored(cls, data: dict):
+        # Trusted hydration for documents written by to_dict: skips __init__
+        # and with it the MF whitelist lookup
+        acc = cls.__new__(cls)
+        Transfer_operations.__init__(acc)
+        acc.company_name = data.get('company_name') or data.get('name')
+        acc.NIP = data.get('NIP') or data.get('nip')
+        acc.fee = 5
+        acc.balance = data.get('balance', 0)
+        acc.transaction_history = cls.history_factory(data.get('transaction_history', []))
+        acc.mark_clean()
         return acc
         
             
@@ -0,0 +1,49 @@
+from src.account import Account, birth_year_from_pesel
+
+
+def _promotion_prefixes():
+    # Promotion eligibility depends only on the YYMM part of a PESEL, so
+    # it is worked out once for all 10000 prefixes instead of per account
+    prefixes = set()
+    for prefix in range(10000):
+        digits = f"{prefix:04d}"
+        birth_year = birth_year_from_pesel(digits + "0000000")
+        if birth_year is not None and birth_year > 1960:
+            prefixes.add(digits)
+    return frozenset(prefixes)
+
+
+PROMOTION_PREFIXES = _promotion_prefixes()
+
+
+def prepare_accounts(rows):
+    """Validate a batch of account rows in one pass.
+
+    Returns ``(results, accounts, positions)``: a result dict per row
+    (``None`` for rows that passed validation), the accounts built for the
+    valid rows and the row position of each of those accounts.
+    """
+    results = [None] * len(rows)
+    accounts = []
+    positions = []
+    seen = set()
+    for position, row in enumerate(rows):
+        if not isinstance(row, dict) or 'name' not in row or 'surname' not in row or 'pesel' not in row:
+            results[position] = {"status": 400, "error": "Missing required fields"}
+            continue
+
+        pesel = row['pesel']
+        if not isinstance(pesel, str) or len(pesel) != 11 or not pesel.isascii() or not pesel.isdigit():
+            results[position] = {"pesel": pesel, "status": 400, "error": "Invalid PESEL"}
+            continue
+        if pesel in seen:
+            results[position] = {"pesel": pesel, "status": 409, "error": "Duplicate PESEL in batch"}
+            continue
+        seen.add(pesel)
+
+        promocode = row.get('promocode')
+        promotion = (isinstance(promocode, str) and promocode.startswith("PROM_") and len(promocode) == 8
+                     and pesel[:4] in PROMOTION_PREFIXES)
+        accounts.append(Account.from_validated(row['name'], row['surname'], pesel, promocode, promotion))
+        positions.append(position)
+    return results, accounts, positions
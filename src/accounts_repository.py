@@ -1,49 +1,531 @@
-from typing import List
+from functools import partial
+from typing import Iterator, List, Optional
+import atexit
 import os
+import sqlite3
+import threading
 import pymongo
-from src.account import Account, Company_Account
+import pymongo.errors
+from src.account import Account, Company_Account, account_key
+from src.history import LazyHistory
+from src.history_codec import decode_history, encode_history
+
+
+LOAD_PROJECTION = {
+    "_id": 0, "first_name": 1, "last_name": 1, "name": 1, "surname": 1, "pesel": 1,
+    "company_name": 1, "NIP": 1, "nip": 1, "balance": 1, "transaction_history": 1,
+    "encoded_history": 1,
+    "history_length": 1, "history_recent": 1, "positive_streak": 1, "zus_payments": 1,
+}
+
+DUPLICATE_KEY = 11000
 
 
 class AccountsRepository:
     def save_all(self, accounts: List[Account]):
         raise NotImplementedError()
 
-    def load_all(self) -> List[Account]:
+    def load_all(self) -> Iterator[Account]:
+        raise NotImplementedError()
+
+    # Single-account access, used when the registry caches the repository
+    def find(self, key) -> Optional[Account]:
+        raise NotImplementedError()
+
+    def save(self, accounts: List[Account]):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def count(self) -> int:
         raise NotImplementedError()
 
 
 class MongoAccountsRepository(AccountsRepository):
-    def __init__(self, collection):
+    """Accounts stored as Mongo documents.
+
+    With a ``history_collection`` the account documents keep only summary
+    fields and histories go to that collection in append-only buckets of
+    ``bucket_size`` entries; loaded accounts fetch their buckets on first
+    read. Without one, histories are embedded in the account documents.
+    Either way entries are written with ``history_codec``; documents with
+    plain ``transaction_history`` arrays still load.
+    """
+
+    def __init__(self, collection, batch_size=1000, history_collection=None, bucket_size=1000):
         self._collection = collection
+        self._batch_size = batch_size
+        self._history = history_collection
+        self._bucket_size = bucket_size
+
+    @staticmethod
+    def _selector_field(account):
+        return "NIP" if isinstance(account, Company_Account) else "pesel"
+
+    def create_indexes(self):
+        """Create the indexes saves and lookups rely on; a no-op on the server when they exist.
+
+        Every account upsert and ``find`` matches on ``pesel`` or ``NIP``, so
+        without these each one scans the collection. Sparse, because a
+        document only has one of the two fields.
+        """
+        self._collection.create_index([("pesel", 1)], sparse=True)
+        self._collection.create_index([("NIP", 1)], sparse=True)
+        if self._history is not None:
+            self._history.create_index([("owner", 1), ("bucket", 1)], unique=True)
+
+    def _keyed(self, accounts):
+        return {(self._selector_field(account), account_key(account)): account for account in accounts}
+
+    def _stored_keys(self, query=None):
+        # Maps every stored account matching ``query`` to its bucketed
+        # history length, if any
+        stored = {}
+        for doc in self._collection.find(query or {}, {"_id": 0, "pesel": 1, "NIP": 1, "history_length": 1}):
+            if 'pesel' in doc:
+                stored[("pesel", doc["pesel"])] = doc.get("history_length")
+            elif 'NIP' in doc:
+                stored[("NIP", doc["NIP"])] = doc.get("history_length")
+        return stored
+
+    def _account_update(self, account):
+        if self._history is None:
+            return {"$set": {**account.to_dict(include_history=False),
+                             "encoded_history": encode_history(account.transaction_history)},
+                    "$unset": {"transaction_history": ""}}
+        return {"$set": {**account.to_dict(include_history=False), **account.history_summary()},
+                "$unset": {"transaction_history": ""}}
+
+    def _bucket_appends(self, key, history, start):
+        # Each bucket only matches while it holds exactly the entries stored
+        # before this save, so repeating a save cannot append twice. A save
+        # pushes its new entries to a bucket as one encoded chunk. Each
+        # operation comes with what _missing_append needs to redo it
+        appends = []
+        position, length = start, len(history)
+        new_entries = history[start:length]
+        while position < length:
+            bucket = position // self._bucket_size
+            end = min((bucket + 1) * self._bucket_size, length)
+            appends.append((self._bucket_append(key, bucket, position, new_entries[position - start:end - start]),
+                            (key, history, bucket, end)))
+            position = end
+        return appends
+
+    def _bucket_append(self, key, bucket, position, entries):
+        return pymongo.UpdateOne(
+            {"owner": key, "bucket": bucket, "count": position - bucket * self._bucket_size},
+            {"$push": {"chunks": {"$each": [encode_history(entries)]}}, "$inc": {"count": len(entries)}},
+            upsert=True)
+
+    def _missing_append(self, key, history, bucket, end):
+        # The bucket holds entries the account document does not count, e.g.
+        # after a save wrote its histories and then failed to write the
+        # accounts; only what the bucket still lacks is appended
+        doc = self._history.find_one({"owner": key, "bucket": bucket}, {"_id": 0, "count": 1})
+        position = bucket * self._bucket_size + doc["count"]
+        if position >= end:
+            return None
+        return self._bucket_append(key, bucket, position, history[position:end]), (key, history, bucket, end)
+
+    def _append_to_buckets(self, appends, retry=True):
+        try:
+            self._history.bulk_write([operation for operation, _ in appends], ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # A bucket whose count does not match fails its upsert on the
+            # unique index; the bucket's stored count says what is missing
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            if retry:
+                missing = [self._missing_append(*appends[error["index"]][1]) for error in errors]
+                missing = [append for append in missing if append is not None]
+                if missing:
+                    self._append_to_buckets(missing, retry=False)
+
+    def _save_histories(self, chunk, stored):
+        rewritten, appends = [], []
+        for selector, account in chunk:
+            key = selector[1]
+            history = account.transaction_history
+            start = stored.get(selector) or 0
+            if len(history) < start:
+                rewritten.append(key)
+                start = 0
+            appends.extend(self._bucket_appends(key, history, start))
+        if rewritten:
+            self._history.delete_many({"owner": {"$in": rewritten}})
+        if appends:
+            self._append_to_buckets(appends)
+
+    def save_all(self, accounts: List[Account]):
+        """Make the collection match ``accounts`` with as few round-trips as possible.
+
+        Only accounts that changed since they were last stored (or are
+        missing from the collection) are written, in unordered bulk batches,
+        and only documents whose account is gone are deleted. Bucketed
+        histories only get the entries added since the last save.
+        """
+        current = self._keyed(accounts)
+        stored = self._stored_keys()
+        changed = [(key, account) for key, account in current.items() if account.is_dirty or key not in stored]
+        self._write(changed, stored)
+
+        stale = sorted(stored.keys() - current.keys())
+        for field in ("pesel", "NIP"):
+            values = [value for stale_field, value in stale if stale_field == field]
+            for start in range(0, len(values), self._batch_size):
+                self._collection.delete_many({field: {"$in": values[start:start + self._batch_size]}})
+                if self._history is not None:
+                    self._history.delete_many({"owner": {"$in": values[start:start + self._batch_size]}})
+
+        return {"written": len(changed), "deleted": len(stale)}
+
+    def _write(self, changed, stored):
+        for start in range(0, len(changed), self._batch_size):
+            chunk = changed[start:start + self._batch_size]
+            if self._history is not None:
+                # Histories first: the stored length only moves once its entries are in
+                self._save_histories(chunk, stored)
+            self._collection.bulk_write(
+                [pymongo.UpdateOne({field: value}, self._account_update(account), upsert=True)
+                 for (field, value), account in chunk],
+                ordered=False,
+            )
+            for _, account in chunk:
+                account.mark_clean()
+
+    def save(self, accounts: List[Account]):
+        """Write ``accounts`` whether or not they changed, leaving other documents alone."""
+        current = self._keyed(accounts)
+        if not current:
+            return
+        query = {"$or": [{field: {"$in": [value for key_field, value in current if key_field == field]}}
+                         for field in {field for field, _ in current}]}
+        self._write(list(current.items()), self._stored_keys(query))
+
+    def find(self, key) -> Optional[Account]:
+        # Served by the pesel and NIP indexes from create_indexes
+        doc = self._collection.find_one({"$or": [{"pesel": key}, {"NIP": key}]}, LOAD_PROJECTION)
+        return self._hydrate(doc) if doc is not None else None
+
+    def delete(self, key):
+        self._collection.delete_many({"$or": [{"pesel": key}, {"NIP": key}]})
+        if self._history is not None:
+            self._history.delete_many({"owner": key})
+
+    def count(self) -> int:
+        # Read from the collection metadata: count_documents would scan the
+        # whole collection on every count request
+        return self._collection.estimated_document_count()
+
+    def _load_history(self, key):
+        # Buckets written before histories were encoded hold plain entries
+        for bucket in self._history.find({"owner": key}, {"_id": 0, "entries": 1, "chunks": 1}, sort=[("bucket", 1)]):
+            yield from bucket.get("entries", ())
+            for chunk in bucket.get("chunks", ()):
+                yield from decode_history(chunk)
+
+    def _hydrate(self, doc):
+        if "encoded_history" in doc:
+            doc = {**doc, "transaction_history": decode_history(doc["encoded_history"])}
+        if 'pesel' in doc:
+            account = Account.from_stored(doc)
+        else:
+            account = Company_Account.from_stored(doc)
+        if self._history is not None and "history_length" in doc and "transaction_history" not in doc:
+            key = account_key(account)
+            account.restore_history(
+                LazyHistory(partial(self._load_history, key), doc["history_length"], doc["history_recent"]), doc)
+            account.mark_clean()
+        return account
+
+    def load_all(self) -> Iterator[Account]:
+        # Documents are streamed in cursor batches and hydrated without
+        # re-validation, so loading makes no MF API calls
+        cursor = self._collection.find({}, LOAD_PROJECTION, batch_size=self._batch_size)
+        for doc in cursor:
+            if 'pesel' in doc or 'NIP' in doc or 'nip' in doc:
+                yield self._hydrate(doc)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY,
+    pesel TEXT,
+    NIP TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    company_name TEXT,
+    balance,
+    history_length INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS accounts_pesel ON accounts (pesel);
+CREATE UNIQUE INDEX IF NOT EXISTS accounts_nip ON accounts (NIP);
+CREATE TABLE IF NOT EXISTS history (
+    account_id INTEGER NOT NULL REFERENCES accounts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    amount,
+    PRIMARY KEY (account_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteAccountsRepository(AccountsRepository):
+    """Accounts stored in a local SQLite database running in WAL mode.
+
+    Histories live in their own table, one row per entry. Like the Mongo
+    repository, a save only writes accounts that changed or are missing
+    and deletes rows whose account is gone, all in one transaction.
+    The connection is shared between threads and used by one at a time.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self._batch_size = batch_size
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(SQLITE_SCHEMA)
+        # Counted once and then kept up to date by the writes below, so a
+        # count request does not scan the accounts table
+        self._count = None
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def _selector_field(account):
+        return "NIP" if isinstance(account, Company_Account) else "pesel"
+
+    def _stored_history_lengths(self, where="", parameters=()):
+        stored = {}
+        for pesel, nip, history_length in self._connection.execute(
+                "SELECT pesel, NIP, history_length FROM accounts" + where, parameters):
+            stored[("pesel", pesel) if pesel is not None else ("NIP", nip)] = history_length
+        return stored
+
+    @staticmethod
+    def _row(field, account):
+        if field == "NIP":
+            return (None, account.NIP, None, None, account.company_name, account.balance,
+                    len(account.transaction_history))
+        return (account.pesel, None, account.first_name, account.last_name, None, account.balance,
+                len(account.transaction_history))
+
+    def _write_accounts(self, field, chunk, stored):
+        self._connection.executemany(
+            "INSERT INTO accounts (pesel, NIP, first_name, last_name, company_name, balance, history_length) "
+            f"VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT ({field}) DO UPDATE SET "
+            "first_name = excluded.first_name, last_name = excluded.last_name, "
+            "company_name = excluded.company_name, balance = excluded.balance, "
+            "history_length = excluded.history_length",
+            [self._row(field, account) for account in chunk])
+        # Histories only grow, so just the entries past the stored length are
+        # inserted; a history that got shorter is rewritten from the start
+        account_id = f"(SELECT id FROM accounts WHERE {field} = ?)"
+        rewritten, entries = [], []
+        for account in chunk:
+            key = getattr(account, field)
+            start = stored.get((field, key), 0)
+            if len(account.transaction_history) < start:
+                rewritten.append((key,))
+                start = 0
+            entries.extend((key, position, amount)
+                           for position, amount in enumerate(account.transaction_history[start:], start))
+        self._connection.executemany(f"DELETE FROM history WHERE account_id = {account_id}", rewritten)
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO history (account_id, position, amount) VALUES ({account_id}, ?, ?)", entries)
 
     def save_all(self, accounts: List[Account]):
-        self._collection.delete_many({})
+        """Make the database match ``accounts``; see ``MongoAccountsRepository.save_all``."""
+        current = {}
         for account in accounts:
-            data = None
-            if isinstance(account, Company_Account):
-                data = account.to_dict()
-                selector = {"NIP": data.get("NIP")}
-            else:
-                data = account.to_dict()
-                selector = {"pesel": data.get("pesel")}
-
-            self._collection.update_one(selector, {"$set": data}, upsert=True)
-
-    def load_all(self) -> List[Account]:
-        results = []
-        for doc in self._collection.find():
-            if 'pesel' in doc:
-                results.append(Account.from_dict(doc))
-            elif 'NIP' in doc or 'nip' in doc:
-                results.append(Company_Account.from_dict(doc))
-        return results
+            field = self._selector_field(account)
+            current[(field, getattr(account, field))] = account
 
+        with self._lock, self._connection:
+            stored = self._stored_history_lengths()
+            changed = [(key, account) for key, account in current.items() if account.is_dirty or key not in stored]
+            self._write(changed, stored)
 
-def create_mongo_repo_from_env():
+            stale = sorted(stored.keys() - current.keys())
+            for field in ("pesel", "NIP"):
+                self._connection.executemany(f"DELETE FROM accounts WHERE {field} = ?",
+                                             [(value,) for stale_field, value in stale if stale_field == field])
+            self._count = len(current)
+
+        for _, account in changed:
+            account.mark_clean()
+        return {"written": len(changed), "deleted": len(stale)}
+
+    def _write(self, changed, stored):
+        for field in ("pesel", "NIP"):
+            accounts_for_field = [account for (changed_field, _), account in changed if changed_field == field]
+            for start in range(0, len(accounts_for_field), self._batch_size):
+                self._write_accounts(field, accounts_for_field[start:start + self._batch_size], stored)
+
+    def save(self, accounts: List[Account]):
+        """Write ``accounts`` whether or not they changed, leaving other rows alone."""
+        current = {(self._selector_field(account), account_key(account)): account for account in accounts}
+        keys = [value for _, value in current]
+        with self._lock, self._connection:
+            stored = {}
+            for start in range(0, len(keys), self._batch_size):
+                batch = keys[start:start + self._batch_size]
+                marks = ", ".join("?" * len(batch))
+                stored.update(self._stored_history_lengths(
+                    f" WHERE pesel IN ({marks}) OR NIP IN ({marks})", batch + batch))
+            self._write(list(current.items()), stored)
+            if self._count is not None:
+                self._count += len(current.keys() - stored.keys())
+        for account in current.values():
+            account.mark_clean()
+
+    @staticmethod
+    def _account(row, history):
+        _, pesel, nip, first_name, last_name, company_name, balance = row
+        if pesel is not None:
+            return Account.from_stored({"first_name": first_name, "last_name": last_name, "pesel": pesel,
+                                        "balance": balance, "transaction_history": history})
+        return Company_Account.from_stored({"company_name": company_name, "NIP": nip,
+                                            "balance": balance, "transaction_history": history})
+
+    def find(self, key) -> Optional[Account]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, pesel, NIP, first_name, last_name, company_name, balance FROM accounts "
+                "WHERE pesel = ? OR NIP = ?", (key, key)).fetchone()
+            if row is None:
+                return None
+            history = [amount for amount, in self._connection.execute(
+                "SELECT amount FROM history WHERE account_id = ? ORDER BY position", (row[0],))]
+        return self._account(row, history)
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            deleted = self._connection.execute("DELETE FROM accounts WHERE pesel = ? OR NIP = ?", (key, key)).rowcount
+            if self._count is not None:
+                self._count -= deleted
+
+    def count(self) -> int:
+        with self._lock:
+            if self._count is None:
+                self._count = self._connection.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+            return self._count
+
+    def load_all(self) -> Iterator[Account]:
+        # Accounts and history entries are both read in id order and merged,
+        # so neither table is loaded into memory at once
+        accounts = self._connection.execute(
+            "SELECT id, pesel, NIP, first_name, last_name, company_name, balance FROM accounts ORDER BY id")
+        entries = self._connection.execute("SELECT account_id, amount FROM history ORDER BY account_id, position")
+        entry = next(entries, None)
+        for row in accounts:
+            account_id = row[0]
+            history = []
+            while entry is not None and entry[0] < account_id:
+                entry = next(entries, None)
+            while entry is not None and entry[0] == account_id:
+                history.append(entry[1])
+                entry = next(entries, None)
+            yield self._account(row, history)
+
+
+def mongo_client_options_from_env():
+    write_concern = os.environ.get('MONGO_WRITE_CONCERN', '1')
+    return {
+        "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', 50)),
+        "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+        "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+        "socketTimeoutMS": int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+        "w": int(write_concern) if write_concern.isdigit() else write_concern,
+    }
+
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+# Collections of the current client whose indexes were created
+_indexed = set()
+
+
+def get_mongo_client():
+    """Return the process-wide MongoClient, creating it on first use.
+
+    A client inherited from a parent process is never reused, since
+    pymongo clients are not fork-safe; the child opens its own pool.
+    """
+    global _client, _client_key
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = pymongo.MongoClient(mongo_url)
+    key = (os.getpid(), mongo_url)
+    if _client_key != key:
+        with _client_lock:
+            if _client_key != key:
+                if _client is not None and _client_key[0] == key[0]:
+                    _client.close()
+                _client = pymongo.MongoClient(mongo_url, **mongo_client_options_from_env())
+                _client_key = key
+                _indexed.clear()
+    return _client
+
+
+def close_mongo_client():
+    global _client, _client_key
+    with _client_lock:
+        if _client is not None and _client_key[0] == os.getpid():
+            _client.close()
+        _client = None
+        _client_key = None
+        _indexed.clear()
+
+
+atexit.register(close_mongo_client)
+
+
+def create_mongo_repo_from_env():
+    client = get_mongo_client()
     db_name = os.environ.get('MONGO_DB', 'bank_app')
     col_name = os.environ.get('MONGO_COLLECTION', 'accounts')
     db = client[db_name]
     collection = db[col_name]
-    return MongoAccountsRepository(collection)
+    history_name = os.environ.get('MONGO_HISTORY_COLLECTION', f'{col_name}_history')
+    repo = MongoAccountsRepository(collection, history_collection=db[history_name])
+    # A repository is created for every save and load; indexes only once per client
+    indexed = (db_name, col_name, history_name)
+    if indexed not in _indexed:
+        repo.create_indexes()
+        with _client_lock:
+            _indexed.add(indexed)
+    return repo
+
+
+def create_sqlite_repo_from_env():
+    return SqliteAccountsRepository(os.environ.get('BANK_APP_SQLITE_PATH', 'bank_app.sqlite3'))
+
+
+def create_repo_from_env():
+    """Return the repository named by BANK_APP_REPOSITORY: ``mongo`` (default) or ``sqlite``."""
+    backend = os.environ.get('BANK_APP_REPOSITORY', 'mongo')
+    if backend == 'sqlite':
+        return create_sqlite_repo_from_env()
+    if backend == 'mongo':
+        return create_mongo_repo_from_env()
+    raise ValueError(f"Unknown BANK_APP_REPOSITORY {backend!r}")
+
+
+def use_repository_cache_from_env(registry):
+    """Put ``registry`` in front of the configured repository if BANK_APP_CACHE_SIZE is set.
+
+    Returns the repository, or None when the registry keeps every account
+    in memory.
+    """
+    capacity = os.environ.get('BANK_APP_CACHE_SIZE')
+    if not capacity:
+        return None
+    repo = create_repo_from_env()
+    registry.use_repository(repo, int(capacity))
+    return repo
@@ -0,0 +1,152 @@
+from array import array
+from itertools import chain, islice
+
+MINOR_UNITS = 100
+
+
+def to_minor(amount):
+    if isinstance(amount, int):
+        return amount * MINOR_UNITS
+    return round(amount * MINOR_UNITS)
+
+
+def from_minor(value):
+    whole, rest = divmod(value, MINOR_UNITS)
+    if rest == 0:
+        return whole
+    return value / MINOR_UNITS
+
+
+class CompactHistory:
+    """Transaction history kept as int64 grosze in a single array.
+
+    Reads return amounts in zloty like the plain list did: whole amounts
+    come back as ints, fractional ones as floats rounded to the grosz.
+    """
+
+    __slots__ = ('_entries',)
+
+    def __init__(self, entries=()):
+        self._entries = array('q', (to_minor(entry) for entry in entries))
+
+    @classmethod
+    def from_minor_values(cls, values):
+        """Build a history straight from int64 grosze, e.g. a snapshot column."""
+        history = cls.__new__(cls)
+        history._entries = array('q')
+        history._entries.frombytes(memoryview(values).cast('B'))
+        return history
+
+    def append(self, amount):
+        self._entries.append(to_minor(amount))
+
+    def copy(self):
+        return CompactHistory.from_minor_values(self._entries)
+
+    def total(self):
+        # Summed in grosze, so there is no float drift however long the history is
+        return from_minor(sum(self._entries))
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [from_minor(value) for value in self._entries[position]]
+        return from_minor(self._entries[position])
+
+    def __contains__(self, amount):
+        return to_minor(amount) in self._entries
+
+    def __iter__(self):
+        return (from_minor(value) for value in self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, CompactHistory)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class LazyHistory:
+    """Transaction history whose stored entries are fetched on first read.
+
+    Until then only the last few stored entries (``recent``) and the ones
+    appended since loading are in memory. Appends, ``len`` and reads that
+    stay within those entries, such as ``history[-5:]``, never fetch.
+    """
+
+    __slots__ = ('_load', '_unloaded', '_recent', '_appended_from')
+
+    def __init__(self, load, length, recent=()):
+        self._load = load
+        self._recent = list(recent)
+        # Number of leading entries that are only in storage
+        self._unloaded = length - len(self._recent)
+        self._appended_from = len(self._recent)
+
+    @property
+    def loaded(self):
+        return self._unloaded == 0
+
+    def _materialize(self):
+        if self._unloaded:
+            # Saves since loading may have stored some of the appended
+            # entries too; they are already in _recent, so storage is only
+            # read up to what it held when this history was built
+            stored = islice(self._load(), self._unloaded + self._appended_from)
+            self._recent = list(stored) + self._recent[self._appended_from:]
+            self._unloaded = 0
+
+    def append(self, amount):
+        self._recent.append(amount)
+
+    def stream(self):
+        """Iterate over every entry without keeping the stored ones in memory."""
+        if not self._unloaded:
+            return iter(self._recent)
+        # Bounded like _materialize, and the entries appended since loading come from _recent
+        stored = islice(self._load(), self._unloaded + self._appended_from)
+        return chain(stored, self._recent[self._appended_from:])
+
+    def copy(self):
+        # The copy shares the loader but not the entries, and stays unloaded
+        history = LazyHistory(self._load, 0)
+        history._recent = list(self._recent)
+        history._unloaded = self._unloaded
+        history._appended_from = self._appended_from
+        return history
+
+    def __len__(self):
+        return self._unloaded + len(self._recent)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self))
+            if step != 1 or start < self._unloaded:
+                self._materialize()
+                return self._recent[position]
+            return self._recent[start - self._unloaded:stop - self._unloaded]
+        if position < 0:
+            position += len(self)
+        if position < self._unloaded:
+            self._materialize()
+        return self._recent[position - self._unloaded]
+
+    def __contains__(self, amount):
+        self._materialize()
+        return amount in self._recent
+
+    def __iter__(self):
+        self._materialize()
+        return iter(self._recent)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, LazyHistory)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
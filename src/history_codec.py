@@ -0,0 +1,109 @@
+from array import array
+from collections import Counter
+
+from src.history import from_minor, to_minor
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(delta):
+    return delta << 1 if delta >= 0 else ((-delta) << 1) - 1
+
+
+def _fee_value(values):
+    # The entry repeated most often, e.g. the fee every express transfer
+    # appends after its amount, is the one short fee tokens stand for
+    counts = Counter(values)
+    if not counts:
+        return None
+    value, count = counts.most_common(1)[0]
+    return value if count > 1 else None
+
+
+def encode(values):
+    """Encode int64 grosze as delta, zigzag varint and run-length tokens.
+
+    Each token is a varint whose two low bits say what it holds:
+
+    * 0: the zigzagged difference to the previous value (shifted left by
+      two, like the rest), for one entry;
+    * 1: the same, for a run of equal entries; a second varint with the
+      run length minus two follows;
+    * 2: the same, for the fee value: the entry repeated most often, such
+      as the fee every express transfer appends after its amount;
+    * 3: the fee value again, for a run of the run length minus one.
+
+    Fee entries do not move the value the next difference is taken from,
+    so an amount and its fee cost no more than the amount alone, plus one
+    byte for each fee after the first.
+    """
+    out = bytearray()
+    previous = 0
+    fee, fee_written = _fee_value(values), False
+    position, length = 0, len(values)
+    while position < length:
+        value = values[position]
+        run = position + 1
+        while run < length and values[run] == value:
+            run += 1
+        if value == fee and fee_written:
+            _write_varint(out, (run - position - 1) << 2 | 3)
+        elif value == fee:
+            _write_varint(out, _zigzag(value - previous) << 2 | 2)
+            fee_written = True
+            run = position + 1
+        elif run - position > 1:
+            _write_varint(out, _zigzag(value - previous) << 2 | 1)
+            _write_varint(out, run - position - 2)
+            previous = value
+        else:
+            _write_varint(out, _zigzag(value - previous) << 2)
+            previous = value
+        position = run
+    return bytes(out)
+
+
+def decode(data):
+    """Decode ``encode`` output into an int64 array of grosze."""
+    values = array('q')
+    previous = fee = 0
+    number, shift, count_next = 0, 0, False
+    for byte in data:
+        number |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        kind = number & 3
+        if count_next:
+            values.extend([previous] * (number + 1))
+            count_next = False
+        elif kind == 3:
+            values.extend([fee] * ((number >> 2) + 1))
+        else:
+            zigzag = number >> 2
+            value = previous + ((zigzag >> 1) ^ -(zigzag & 1))
+            values.append(value)
+            if kind == 2:
+                fee = value
+            else:
+                previous = value
+                count_next = kind == 1
+        number, shift = 0, 0
+    if shift or count_next:
+        raise ValueError("Truncated history encoding")
+    return values
+
+
+def encode_history(history):
+    """Encode a transaction history given in zloty, as ``to_dict`` returns it."""
+    return encode([to_minor(amount) for amount in history])
+
+
+def decode_history(data):
+    """Decode an ``encode_history`` blob back to the list ``from_dict`` expects."""
+    return [from_minor(value) for value in decode(data)]
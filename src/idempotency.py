@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """Responses of requests sent with an ``Idempotency-Key``, kept for ``ttl`` seconds.
+
+    Every entry lives for the same ``ttl``, so insertion order is also
+    expiry order: expired entries are dropped from the front on each
+    ``put`` and, once ``max_size`` entries are stored, the oldest one goes
+    too. Lookups and inserts are O(1) and memory is bounded by ``max_size``.
+    """
+
+    def __init__(self, ttl=86400, max_size=1000000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        # key -> (fingerprint, response, expires at), oldest first; an
+        # OrderedDict because a plain dict slows down finding its first
+        # entry as entries are deleted from the front
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(fingerprint, response)`` stored under ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > self._clock():
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, fingerprint, response):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            now = self._clock()
+            # An expired entry for the same key is replaced at the back
+            self._entries.pop(key, None)
+            self._entries[key] = (fingerprint, response, now + self.ttl)
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if len(self._entries) <= self.max_size and oldest[2] > now:
+                    break
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def create_idempotency_cache_from_env():
+    return IdempotencyCache(
+        ttl=float(os.environ.get('BANK_APP_IDEMPOTENCY_TTL', 86400)),
+        max_size=int(os.environ.get('BANK_APP_IDEMPOTENCY_CACHE_SIZE', 1000000)),
+    )
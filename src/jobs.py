@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """Progress and outcome of one background job; updated by the job, read by status requests."""
+
+    def __init__(self, kind, clock=time.monotonic):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.processed = 0
+        self.bytes = 0
+        self.result = None
+        self.error = None
+        self._clock = clock
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def advance(self, accounts=1, size=0):
+        with self._lock:
+            self.processed += accounts
+            self.bytes += size
+
+    def _start(self):
+        with self._lock:
+            self.status = "running"
+            self._started = self._clock()
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            self.status = "failed" if error is not None else "succeeded"
+            self.result = result
+            self.error = error
+            self._finished = self._clock()
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self):
+        with self._lock:
+            if self._started is None:
+                elapsed = 0
+            else:
+                elapsed = (self._finished if self._finished is not None else self._clock()) - self._started
+            data = {
+                "id": self.id,
+                "type": self.kind,
+                "status": self.status,
+                "processed": self.processed,
+                "bytes": self.bytes,
+                "elapsed": round(elapsed, 3),
+            }
+            if self.result is not None:
+                data["result"] = self.result
+            if self.error is not None:
+                data["error"] = self.error
+            return data
+
+
+class JobManager:
+    """Runs jobs on a dedicated executor and keeps the most recent ``max_jobs`` for polling.
+
+    With the default single worker, jobs run one at a time in the order
+    they were submitted.
+    """
+
+    def __init__(self, max_workers=1, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bank-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, work):
+        """Queue ``work(job)``; its return value becomes the job result."""
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Only finished jobs are forgotten, oldest first
+            excess = len(self._jobs) - self.max_jobs
+            if excess > 0:
+                for finished in [key for key, old in self._jobs.items() if old.done][:excess]:
+                    del self._jobs[finished]
+        self._executor.submit(self._run, job, work)
+        return job
+
+    @staticmethod
+    def _run(job, work):
+        job._start()
+        try:
+            result = work(job)
+        except Exception as e:
+            job._finish(error=str(e))
+        else:
+            job._finish(result=result)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,313 @@
+import atexit
+import json
+import logging
+import os
+import threading
+
+from src.account import Account
+from src.snapshot import SnapshotFile, snapshot_columns, write_snapshot_file
+
+SEGMENT_PREFIX = 'journal-'
+SEGMENT_SUFFIX = '.log'
+SNAPSHOT_FILE = 'snapshot.bin'
+
+logger = logging.getLogger('bank_app.journal')
+
+
+def segment_name(first_seq):
+    return f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory):
+    """Return ``(first_seq, path)`` for every segment in ``directory``, oldest first."""
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            first_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            segments.append((first_seq, os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def fsync_directory(directory):
+    # Makes file creations, renames and removals in ``directory`` durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def truncate_segment(path, last_seq):
+    """Cut the segment at ``path`` after its last whole record numbered ``last_seq`` or lower."""
+    end = 0
+    with open(path, 'rb+') as segment:
+        for line in segment:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                seq = json.loads(line)["seq"]
+            except ValueError:
+                break
+            if seq > last_seq:
+                break
+            end += len(line)
+        if end < segment.seek(0, os.SEEK_END):
+            segment.truncate(end)
+            segment.flush()
+            os.fsync(segment.fileno())
+
+
+class Journal:
+    """Append-only journal of account changes with group commit.
+
+    ``append`` gives a record the next sequence number and queues it; a
+    background thread writes everything queued so far and fsyncs once for
+    the whole group. Callers that must not answer before their record is
+    on disk pass its sequence number to ``wait_durable``.
+    """
+
+    def __init__(self, directory, start_seq=0, sync=True):
+        self.directory = directory
+        self.sync = sync
+        self.fsyncs = 0
+        os.makedirs(directory, exist_ok=True)
+        # Recovery stops before any segment starting past start_seq, so such
+        # segments only hold records that never became durable; the tail of
+        # the last kept one is cut for the same reason, or replay would stop
+        # at a torn line there before reaching the segments written next
+        last_kept = None
+        for first_seq, path in list_segments(directory):
+            if first_seq > start_seq:
+                os.remove(path)
+            else:
+                last_kept = path
+        if last_kept is not None:
+            truncate_segment(last_kept, start_seq)
+        self._seq = start_seq
+        self._durable_seq = start_seq
+        self._pending = []
+        self._closed = False
+        self._error = None
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+        self._durable = threading.Condition(self._lock)
+        # Held while writing so batches reach the file in sequence order
+        self._io_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        # Stop event of the periodic snapshot thread, if one was started
+        self.snapshots = None
+        self._file = self._open_segment(start_seq + 1)
+        self._thread = threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True)
+        self._thread.start()
+
+    def _open_segment(self, first_seq):
+        segment = open(os.path.join(self.directory, segment_name(first_seq)), 'ab')
+        fsync_directory(self.directory)
+        return segment
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            return self._seq
+
+    @property
+    def durable_seq(self):
+        with self._lock:
+            return self._durable_seq
+
+    def append(self, record):
+        """Queue ``record`` (a non-empty dict) and return its sequence number."""
+        body = json.dumps(record, separators=(',', ':'))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Journal is closed")
+            self._seq += 1
+            self._pending.append(f'{{"seq":{self._seq},{body[1:]}\n')
+            self._queued.notify()
+            return self._seq
+
+    def wait_durable(self, seq):
+        with self._lock:
+            while self._durable_seq < seq and self._error is None:
+                self._durable.wait()
+            if self._durable_seq < seq:
+                raise self._error
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._queued.wait()
+                if not self._pending:
+                    return
+            try:
+                with self._io_lock:
+                    self._write_pending()
+            except OSError:
+                # The error is kept in _error and raised to every waiter
+                return
+
+    def _write_pending(self):
+        # Caller holds _io_lock; everything queued so far goes out with one fsync
+        with self._lock:
+            batch, self._pending = self._pending, []
+            last_seq = self._seq
+        if batch:
+            try:
+                self._file.write(''.join(batch).encode('utf-8'))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                with self._lock:
+                    self._error = e
+                    self._durable.notify_all()
+                raise
+            self.fsyncs += 1
+        with self._lock:
+            self._durable_seq = last_seq
+            self._durable.notify_all()
+        return last_seq
+
+    def rotate(self):
+        """Start a new segment.
+
+        Returns the last sequence number written to the old segments and
+        their paths; records appended from now on go to the new segment.
+        """
+        with self._io_lock:
+            last_seq = self._write_pending()
+            old_segments = [path for _, path in list_segments(self.directory)]
+            self._file.close()
+            self._file = self._open_segment(last_seq + 1)
+        return last_seq, old_segments
+
+    def write_snapshot(self, registry):
+        """Write every account in ``registry`` to the snapshot file and drop the segments it covers.
+
+        The snapshot holds all records up to the returned sequence number;
+        accounts also carry their own ``journal_seq``, so records that are
+        already in an account's state are skipped on replay.
+        """
+        with self._snapshot_lock:
+            start_seq, old_segments = self.rotate()
+            path = os.path.join(self.directory, SNAPSHOT_FILE)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as snapshot:
+                write_snapshot_file(snapshot, registry.export(snapshot_columns), start_seq)
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(temp_path, path)
+            fsync_directory(self.directory)
+            for segment in old_segments:
+                os.remove(segment)
+            return start_seq
+
+    def close(self):
+        if self.snapshots is not None:
+            self.snapshots.set()
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queued.notify()
+        self._thread.join()
+        with self._io_lock:
+            self._file.close()
+
+
+def read_records(directory):
+    """Yield journal records oldest first, stopping at the first torn or unreadable line."""
+    for _, path in list_segments(directory):
+        with open(path, 'rb') as segment:
+            for line in segment:
+                if not line.endswith(b'\n'):
+                    return
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+
+
+def apply_record(registry, record):
+    seq = record["seq"]
+    if record["op"] == "create":
+        account = Account.from_stored(record["account"])
+        account.journal_seq = seq
+        registry.add_account_if_absent(account)
+        return
+    if record["op"] == "internal_transfer":
+        # One record for both sides; each account skips it on its own
+        for pesel, side in ((record["from"], "outgoing"), (record["to"], "incoming")):
+            account = registry.find_account_by_pesel(pesel)
+            if account is not None and account.journal_seq < seq:
+                account.journal_seq = seq
+                getattr(account, f"{side}_transfer")(record["amount"])
+        return
+    account = registry.find_account_by_pesel(record["pesel"])
+    # An account already holding this record came from a later snapshot
+    if account is None or account.journal_seq >= seq:
+        return
+    account.journal_seq = seq
+    if record["op"] == "delete":
+        registry.remove_account(account)
+    elif record["op"] == "update":
+        for field, value in record["fields"].items():
+            setattr(account, field, value)
+        account.mark_dirty()
+    elif record["op"] == "transfer":
+        getattr(account, f"{record['type']}_transfer")(record["amount"])
+
+
+def recover(directory, registry):
+    """Rebuild ``registry`` from the snapshot and the journal tail; return the last sequence number applied.
+
+    The snapshot is memory-mapped and handed to ``registry.load_snapshot``,
+    so a sharded registry only builds the accounts the tail touches.
+    """
+    last_seq = 0
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    if os.path.exists(path):
+        snapshot = SnapshotFile(path)
+        registry.load_snapshot(snapshot)
+        last_seq = snapshot.start_seq
+    else:
+        registry.replace_accounts([])
+    for record in read_records(directory):
+        if record["seq"] <= last_seq:
+            continue
+        if record["seq"] != last_seq + 1:
+            break
+        apply_record(registry, record)
+        last_seq = record["seq"]
+    return last_seq
+
+
+def start_periodic_snapshots(journal, registry, interval):
+    """Write a snapshot every ``interval`` seconds until the returned event is set."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                journal.write_snapshot(registry)
+            except Exception as e:
+                # Logged and tried again next time; a dead thread would let the journal grow for ever
+                logger.error("Journal snapshot failed: %s", e)
+
+    threading.Thread(target=run, name='journal-snapshots', daemon=True).start()
+    return stop
+
+
+def create_journal_from_env(registry):
+    """Recover ``registry`` and open a journal when BANK_APP_JOURNAL_DIR is set; return ``None`` otherwise."""
+    directory = os.environ.get('BANK_APP_JOURNAL_DIR')
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    last_seq = recover(directory, registry)
+    journal = Journal(directory, start_seq=last_seq, sync=os.environ.get('BANK_APP_JOURNAL_SYNC', '1') != '0')
+    interval = float(os.environ.get('BANK_APP_JOURNAL_SNAPSHOT_INTERVAL', 300))
+    if interval > 0:
+        journal.snapshots = start_periodic_snapshots(journal, registry, interval)
+    atexit.register(journal.close)
+    return journal
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = 'bank_app'
+# Eleven digits on their own: a PESEL, unless it is part of a longer number
+PESEL_PATTERN = re.compile(r'(?<!\d)\d{11}(?!\d)')
+
+_route_loggers = {}
+_listener = None
+
+
+def mask_pesel(pesel):
+    """Keep only the last four digits of ``pesel``, enough to tell log lines apart."""
+    pesel = str(pesel)
+    return '*' * max(len(pesel) - 4, 0) + pesel[-4:]
+
+
+class RedactPesels(logging.Filter):
+    """Masks anything that looks like a PESEL in a record's message; a safety net for
+    messages built from exceptions or outside data."""
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = PESEL_PATTERN.sub(lambda match: mask_pesel(match.group()), message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        return True
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Logs only a ``sample`` fraction of records below WARNING.
+
+    The draw happens before the record is created, so a record that is
+    sampled out or below the logger's level costs one call and a random
+    number. Warnings and errors are always logged.
+    """
+
+    def __init__(self, logger, sample=1.0, rng=random.random):
+        super().__init__(logger, {})
+        self.sample = sample
+        self._rng = rng
+
+    def log(self, level, msg, *args, **kwargs):
+        if level < logging.WARNING and self.sample < 1 and self._rng() >= self.sample:
+            return
+        super().log(level, msg, *args, **kwargs)
+
+
+def route_logger(route):
+    """The ``SampledLogger`` of one API route, logging as ``bank_app.api.<route>``."""
+    logger = _route_loggers.get(route)
+    if logger is None:
+        logger = _route_loggers.setdefault(route, SampledLogger(logging.getLogger(f'{LOGGER_NAME}.api.{route}')))
+    return logger
+
+
+def configure_route(route, level=None, sample=None):
+    """Set the level and sample rate of one route; ``None`` leaves a setting as it is."""
+    logger = route_logger(route)
+    if level is not None:
+        logger.logger.setLevel(level)
+    if sample is not None:
+        logger.sample = sample
+
+
+def parse_route_settings(spec):
+    """Parse ``route=LEVEL[@sample],...``, e.g. ``transfer=INFO@0.01,get_job=WARNING``."""
+    settings = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        route, _, setting = item.partition('=')
+        level, _, sample = setting.partition('@')
+        settings[route.strip()] = (level.strip().upper() or None, float(sample) if sample else None)
+    return settings
+
+
+def start_log_pipeline(handler=None, level=logging.INFO):
+    """Send ``bank_app`` records through a queue to ``handler`` (stdout by default) on a listener thread.
+
+    Request threads only put records on the queue; formatting the output
+    and writing it happen on the listener thread. The records stop at the
+    ``bank_app`` logger, so handlers on the root logger do not format and
+    write them again on the request thread. Starting the pipeline again
+    returns the listener already running.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    if handler is None:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(RedactPesels())
+    records = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.addHandler(QueueHandler(records))
+    logger.propagate = False
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_log_pipeline)
+    return _listener
+
+
+def stop_log_pipeline():
+    """Write out what is queued, stop the listener and let ``bank_app`` records propagate again."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in [handler for handler in logger.handlers if isinstance(handler, QueueHandler)]:
+        logger.removeHandler(handler)
+    logger.propagate = True
+    _listener = None
+
+
+def start_log_pipeline_from_env():
+    """Start the pipeline at BANK_APP_LOG_LEVEL (INFO by default) with the routes set in BANK_APP_LOG_ROUTES."""
+    listener = start_log_pipeline(level=os.environ.get('BANK_APP_LOG_LEVEL', 'INFO').upper())
+    for route, (level, sample) in parse_route_settings(os.environ.get('BANK_APP_LOG_ROUTES', '')).items():
+        configure_route(route, level, sample)
+    return listener
@@ -0,0 +1,80 @@
+import os
+import threading
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_MF_URL = 'https://wl-test.mf.gov.pl/'
+
+
+class MfApiClient:
+    """Client for the MF VAT whitelist API sharing one pooled session.
+
+    Every request is bounded by a connect and a read timeout. Connection
+    errors and 429/5xx answers are retried with exponential backoff.
+    """
+
+    def __init__(self, base_url=None, connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff=0.3, pool_size=10, session=None):
+        self._base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = session if session is not None else self._build_session(retries, backoff, pool_size)
+
+    @staticmethod
+    def _build_session(retries, backoff, pool_size):
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def base_url(self):
+        # Read on every call when not pinned, so BANK_APP_MF_URL can change at runtime
+        return self._base_url or os.getenv('BANK_APP_MF_URL', DEFAULT_MF_URL)
+
+    def search_nip(self, nip, date=None):
+        """Return ``(status_code, data)``; ``data`` is the parsed body of a 200 answer, else ``None``."""
+        date = date or datetime.now().strftime('%Y-%m-%d')
+        url = f"{self.base_url}api/search/nip/{nip}?date={date}"
+        response = self.session.get(url, timeout=self.timeout)
+        data = response.json() if response.status_code == 200 else None
+        return response.status_code, data
+
+    def close(self):
+        self.session.close()
+
+
+def create_mf_client_from_env():
+    return MfApiClient(
+        connect_timeout=float(os.environ.get('BANK_APP_MF_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.environ.get('BANK_APP_MF_READ_TIMEOUT', 10)),
+        retries=int(os.environ.get('BANK_APP_MF_RETRIES', 2)),
+        backoff=float(os.environ.get('BANK_APP_MF_BACKOFF', 0.3)),
+        pool_size=int(os.environ.get('BANK_APP_MF_POOL_SIZE', 10)),
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mf_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_mf_client_from_env()
+    return _client
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class NipValidationCache:
+    """LRU cache of MF whitelist answers keyed by NIP.
+
+    Active (``Czynny``) results live for ``ttl`` seconds, every other
+    answer for ``negative_ttl``. Once ``max_size`` entries are stored the
+    least recently used one is dropped.
+    """
+
+    def __init__(self, ttl=86400, negative_ttl=3600, max_size=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, nip):
+        with self._lock:
+            entry = self._entries.get(nip)
+            if entry is not None and entry[1] > self._clock():
+                self._entries.move_to_end(nip)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[nip]
+            self.misses += 1
+            return None
+
+    def put(self, nip, valid):
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl if valid else self.negative_ttl
+        with self._lock:
+            self._entries[nip] = (valid, self._clock() + ttl)
+            self._entries.move_to_end(nip)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def create_nip_cache_from_env():
+    return NipValidationCache(
+        ttl=float(os.environ.get('BANK_APP_NIP_CACHE_TTL', 86400)),
+        negative_ttl=float(os.environ.get('BANK_APP_NIP_CACHE_NEGATIVE_TTL', 3600)),
+        max_size=int(os.environ.get('BANK_APP_NIP_CACHE_SIZE', 10000)),
+    )
+
+
+nip_validation_cache = create_nip_cache_from_env()
@@ -1,30 +1,131 @@
+import copy
+
+from src.history import CompactHistory, from_minor, to_minor
+
+
 class Transfer_operations:
+    __slots__ = ('balance', 'fee', '_history', '_positive_streak', '_last_five_sum', '_zus_payments', '_dirty',
+                 'journal_seq')
+
+    ZUS_PAYMENT = -1775
+
+    # Container type used for transaction_history; set to
+    # src.history.CompactHistory to keep histories as int64 grosze
+    history_factory = list
+
     def __init__(self):
         self.balance = 0
         self.fee = 0
-        self.transaction_history = []
-        
+        # Sequence number of the last journal record applied to this account
+        self.journal_seq = 0
+        self.transaction_history = self.history_factory()
+
+    # An account is dirty until a repository has stored its current state
+    @property
+    def is_dirty(self):
+        return getattr(self, '_dirty', True)
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    def mark_clean(self):
+        self._dirty = False
+
+    # Loan rules read these aggregates instead of rescanning the history.
+    # They are rebuilt when a history is assigned and kept up to date by
+    # _record, so history entries must be appended through _record.
+    @property
+    def transaction_history(self):
+        return self._history
+
+    @transaction_history.setter
+    def transaction_history(self, history):
+        self._history = history
+        self._dirty = True
+        self._positive_streak = 0
+        self._zus_payments = 0
+        for amount in history:
+            self._track(amount)
+        self._last_five_sum = sum(history[-5:])
+
+    def detached_copy(self):
+        """Copy of the account that later transfers on the original do not change."""
+        account = copy.copy(self)
+        account._history = self._history.copy()
+        return account
+
+    def history_summary(self):
+        """Fields a store keeps next to the account so the history can be loaded lazily."""
+        return {
+            "history_length": len(self._history),
+            "history_recent": list(self._history[-5:]),
+            "positive_streak": self._positive_streak,
+            "zus_payments": self._zus_payments,
+        }
+
+    def restore_history(self, history, summary):
+        # Takes the loan aggregates from a history_summary() instead of
+        # scanning the entries, so a lazily loaded history stays unloaded
+        self._history = history
+        self._positive_streak = summary["positive_streak"]
+        self._zus_payments = summary["zus_payments"]
+        self._last_five_sum = sum(history[-5:])
+
+    def _track(self, amount):
+        self._positive_streak = self._positive_streak + 1 if amount > 0 else 0
+        if amount == self.ZUS_PAYMENT:
+            self._zus_payments += 1
+
+    def _record(self, amount):
+        self._history.append(amount)
+        self._dirty = True
+        self._track(amount)
+        # Summing the five-entry window keeps the result identical to the
+        # old slice-and-sum check, float amounts included
+        self._last_five_sum = sum(self._history[-5:])
+
+    # A compact history keeps whole grosze, so with one the amounts are
+    # rounded to the grosz and the balance is added up in grosze: it moves
+    # by exactly what the history records and does not drift from it
+    def _in_grosze(self):
+        return isinstance(self._history, CompactHistory)
+
+    def _amount(self, amount):
+        return from_minor(to_minor(amount)) if self._in_grosze() else amount
+
+    def _add_to_balance(self, amount):
+        if self._in_grosze():
+            self.balance = from_minor(to_minor(self.balance) + to_minor(amount))
+        else:
+            self.balance += amount
+
+    def accepts_amount(self, amount):
+        """Whether a transfer of ``amount`` would move money; with a compact history it must come to a grosz."""
+        return self._amount(amount) > 0
 
     def incoming_transfer(self, amount):
+        amount = self._amount(amount)
         if amount > 0 and amount:
-            self.balance += amount
-            self.transaction_history.append(amount)
+            self._add_to_balance(amount)
+            self._record(amount)
             return True
         return False
             
     def outgoing_transfer(self, amount):
-        if amount > self.balance or amount < 0:
+        amount = self._amount(amount)
+        if amount > self.balance or not amount >= 0:
             return False
         else:
-            self.balance -= amount
-            self.transaction_history.append(-amount)
+            self._add_to_balance(-amount)
+            self._record(-amount)
             return True
     
     def express_transfer(self, amount):
-        if amount > self.balance + self.fee or amount < 0:
+        amount = self._amount(amount)
+        if amount > self.balance + self.fee or not amount >= 0:
             return False
 
-        self.balance -= (amount + self.fee)
-        self.transaction_history.append(-amount)
-        self.transaction_history.append(-self.fee)
+        self._add_to_balance(-(amount + self.fee))
+        self._record(-amount)
+        self._record(-self.fee)
         return True
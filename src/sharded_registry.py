@@ -0,0 +1,469 @@
+import contextlib
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+
+from src.account import AccountRegistry, AccountStore, account_key
+
+
+class SharedLock:
+    """Lock held by any number of threads in shared mode or by one in exclusive mode.
+
+    Waiting exclusive holders go first, so a stream of shared holders
+    cannot keep one out for ever.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._shared = 0
+        self._exclusive = False
+        self._waiting_exclusive = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive and not self._waiting_exclusive)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                if not self._shared:
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._waiting_exclusive += 1
+            self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+            self._waiting_exclusive -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+class ShardedAccountStore:
+    """Account storage split into lock-striped shards by PESEL/NIP hash.
+
+    Every shard is an ``AccountStore`` guarded by its own lock. All shards
+    draw slot numbers from one counter, so iterating the store still yields
+    accounts in the order they were added.
+    """
+
+    def __init__(self, shard_count=16, first_slot=0):
+        if shard_count < 1:
+            raise ValueError("shard_count must be positive")
+        self._slot_counter = itertools.count(first_slot)
+        self._shards = [AccountStore(slots=self._slot_counter) for _ in range(shard_count)]
+        self._locks = [threading.RLock() for _ in range(shard_count)]
+
+    @property
+    def shard_count(self):
+        return len(self._shards)
+
+    def _shard_number(self, key):
+        return hash(key) % len(self._shards)
+
+    def lock_for(self, key):
+        return self._locks[self._shard_number(key)]
+
+    @contextlib.contextmanager
+    def locked(self, keys):
+        # Every shard owning one of ``keys`` is locked once, in shard order,
+        # so callers locking overlapping keys in any order cannot deadlock
+        numbers = sorted({self._shard_number(key) for key in keys})
+        for number in numbers:
+            self._locks[number].acquire()
+        try:
+            yield
+        finally:
+            for number in reversed(numbers):
+                self._locks[number].release()
+
+    def _shard_for(self, key):
+        return self._shards[self._shard_number(key)]
+
+    def append(self, account):
+        key = account_key(account)
+        with self.lock_for(key):
+            self._append_locked(key, account)
+
+    def _first_locked(self, key):
+        # Caller holds the lock of the shard owning ``key``
+        return self._shard_for(key).first(key)
+
+    def _append_locked(self, key, account):
+        # Caller holds the lock of the shard owning ``key``
+        self._shard_for(key).append(account)
+
+    def append_if_absent(self, account):
+        key = account_key(account)
+        with self.lock_for(key):
+            if self._first_locked(key) is not None:
+                return False
+            self._append_locked(key, account)
+            return True
+
+    def extend_if_absent(self, accounts, on_added=None):
+        # Every shard touched by the batch is locked up front, and the
+        # accounts go in in request order so slots follow the batch.
+        # ``on_added`` runs for each new account before any lock is released
+        with self.locked([account_key(account) for account in accounts]):
+            added = []
+            for account in accounts:
+                key = account_key(account)
+                if self._first_locked(key) is None:
+                    self._append_locked(key, account)
+                    if on_added is not None:
+                        on_added(account)
+                    added.append(True)
+                else:
+                    added.append(False)
+            return added
+
+    def first(self, key):
+        with self.lock_for(key):
+            return self._first_locked(key)
+
+    def remove(self, account):
+        key = account_key(account)
+        with self.lock_for(key):
+            self._shard_for(key).remove(account)
+
+    def clear(self):
+        # Locks are always taken in shard order so two clears cannot deadlock
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            for shard in self._shards:
+                shard.clear()
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def count(self, account):
+        key = account_key(account)
+        with self.lock_for(key):
+            return self._shard_for(key).count(account)
+
+    def copy(self):
+        snapshots = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                snapshots.append(shard.slot_items())
+        merged = heapq.merge(*snapshots, key=lambda item: item[0])
+        return [account for _, account in merged]
+
+    def _shard_page_items(self, number, after, ceiling, batch):
+        shard, lock = self._shards[number], self._locks[number]
+        while True:
+            with lock:
+                items = shard.page(after, batch)
+            for item in items:
+                if item[0] >= ceiling:
+                    return
+                yield item
+            if batch is None or len(items) < batch:
+                return
+            after = items[-1][0]
+
+    def page(self, after=None, limit=None):
+        # Accounts added while the shards are being read get slots above the
+        # ceiling and are left for the next page, so a cursor never skips them
+        ceiling = next(self._slot_counter)
+        # Shards are read lazily in small batches so a page costs about
+        # ``limit`` items rather than ``limit`` per shard
+        batch = limit // len(self._shards) + 1 if limit is not None else None
+        pages = [self._shard_page_items(number, after, ceiling, batch) for number in range(len(self._shards))]
+        merged = heapq.merge(*pages, key=lambda item: item[0])
+        return list(itertools.islice(merged, limit))
+
+    def export_chunks(self, fn, chunk_size=1000):
+        """Yield lists of ``fn(account)``, at most ``chunk_size`` long, for every account.
+
+        Each chunk is read under the lock of the shard it comes from, so
+        ``fn`` sees every account in a state no request is halfway through
+        changing, while other shards keep serving requests.
+        """
+        for shard, lock in zip(self._shards, self._locks):
+            after = None
+            while True:
+                with lock:
+                    items = shard.page(after, chunk_size)
+                    chunk = [fn(account) for _, account in items]
+                if chunk:
+                    yield chunk
+                if len(items) < chunk_size:
+                    break
+                after = items[-1][0]
+
+    def __contains__(self, account):
+        return self.count(account) > 0
+
+    def __iter__(self):
+        return iter(self.copy())
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def __getitem__(self, position):
+        return self.copy()[position]
+
+    def __eq__(self, other):
+        return self.copy() == other
+
+
+class LazySnapshotStore(ShardedAccountStore):
+    """Sharded store whose initial accounts stay in a snapshot until needed.
+
+    Snapshot accounts keep their snapshot position as slot number and are
+    built the first time they are looked up by key or reached by a page,
+    copy or export. Accounts added later get slots after the snapshot's.
+    """
+
+    def __init__(self, snapshot, shard_count=16):
+        super().__init__(shard_count, first_slot=len(snapshot))
+        self._snapshot = snapshot
+        self._materialized = bytearray(len(snapshot))
+        self._pending = len(snapshot)
+        self._pending_lock = threading.Lock()
+
+    def _materialize(self, index):
+        # Caller holds the lock of the shard owning the account's key
+        account = self._snapshot.account(index)
+        self._shard_for(account_key(account)).insert(index, account)
+        self._materialized[index] = 1
+        with self._pending_lock:
+            self._pending -= 1
+        return account
+
+    def _first_locked(self, key):
+        account = super()._first_locked(key)
+        if account is None:
+            for index in self._snapshot.find(key):
+                if not self._materialized[index]:
+                    return self._materialize(index)
+        return account
+
+    def _materialize_range(self, start, stop):
+        for index in range(start, min(stop, len(self._materialized))):
+            if not self._materialized[index]:
+                with self.lock_for(self._snapshot.key(index)):
+                    if not self._materialized[index]:
+                        self._materialize(index)
+
+    def materialize_all(self):
+        if self._pending:
+            self._materialize_range(0, len(self._materialized))
+
+    def clear(self):
+        with self._pending_lock:
+            self._materialized = bytearray(b'\x01') * len(self._materialized)
+            self._pending = 0
+        super().clear()
+
+    def copy(self):
+        self.materialize_all()
+        return super().copy()
+
+    def page(self, after=None, limit=None):
+        # Only the snapshot slots this page can reach are materialized. Slots
+        # of deleted accounts stay empty, so the range grows until the page
+        # is full of accounts whose slots all lie inside it; a page ending
+        # past the range could skip snapshot accounts not built yet
+        start = 0 if after is None else after + 1
+        if limit is None:
+            self._materialize_range(start, len(self._materialized))
+            return super().page(after, limit)
+        step = limit
+        while True:
+            stop = start + step
+            self._materialize_range(start, stop)
+            items = super().page(after, limit)
+            if stop >= len(self._materialized) or (len(items) == limit and items[-1][0] < stop):
+                return items
+            start, step = stop, step * 2
+
+    def export_chunks(self, fn, chunk_size=1000):
+        self.materialize_all()
+        return super().export_chunks(fn, chunk_size)
+
+    def __len__(self):
+        return super().__len__() + self._pending
+
+
+class RepositoryCacheStore(ShardedAccountStore):
+    """Sharded store caching about ``capacity`` accounts of a repository.
+
+    A key missing from the cache is fetched with ``repository.find`` and
+    becomes the most recently used account of its shard. When a shard
+    holds more than its share of ``capacity`` (at least two accounts), its
+    least recently used account is written back if it changed and is
+    dropped. Both happen under the shard lock, so an account is never
+    dropped while a request holding that lock is changing it.
+
+    The length is the repository's count plus the accounts created here
+    and not written back yet. Iteration, pages and exports only see the
+    accounts currently cached, so the API does not list accounts in this
+    mode.
+    """
+
+    def __init__(self, repository, capacity, shard_count=16):
+        super().__init__(shard_count)
+        self._repository = repository
+        # Two per shard at least, so both accounts of a transfer stay cached
+        self._shard_capacity = max(2, capacity // shard_count)
+        self._recent = [OrderedDict() for _ in range(shard_count)]
+        # Keys of accounts created in the cache and missing from the repository
+        self._unstored = set()
+        self._unstored_lock = threading.Lock()
+
+    def _first_locked(self, key):
+        number = self._shard_number(key)
+        account = self._shards[number].first(key)
+        if account is not None:
+            self._recent[number].move_to_end(key)
+            return account
+        if key is None:
+            return None
+        account = self._repository.find(key)
+        if account is not None:
+            self._cache_locked(number, key, account)
+        return account
+
+    def _append_locked(self, key, account):
+        with self._unstored_lock:
+            self._unstored.add(key)
+        self._cache_locked(self._shard_number(key), key, account)
+
+    def _cache_locked(self, number, key, account):
+        self._shards[number].append(account)
+        recent = self._recent[number]
+        recent[key] = None
+        while len(recent) > self._shard_capacity:
+            oldest = next(iter(recent))
+            evicted = self._shards[number].first(oldest)
+            # Written back before it is dropped, so a failed write loses nothing
+            self._write_back([evicted])
+            self._shards[number].remove(evicted)
+            del recent[oldest]
+
+    def _write_back(self, accounts):
+        with self._unstored_lock:
+            changed = [account for account in accounts
+                       if account.is_dirty or account_key(account) in self._unstored]
+        if changed:
+            self._repository.save(changed)
+            with self._unstored_lock:
+                self._unstored.difference_update(account_key(account) for account in changed)
+        return len(changed)
+
+    def write_back(self):
+        """Write every changed cached account to the repository; return how many were written."""
+        written = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                written += self._write_back(shard.copy())
+        return written
+
+    def remove(self, account):
+        key = account_key(account)
+        with self.lock_for(key):
+            self._shard_for(key).remove(account)
+            self._recent[self._shard_number(key)].pop(key, None)
+            with self._unstored_lock:
+                stored = key not in self._unstored
+                self._unstored.discard(key)
+            if stored:
+                self._repository.delete(key)
+
+    def clear(self):
+        # Drops the cached accounts without writing them back
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            super().clear()
+            for recent in self._recent:
+                recent.clear()
+            with self._unstored_lock:
+                self._unstored.clear()
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def __len__(self):
+        with self._unstored_lock:
+            unstored = len(self._unstored)
+        return self._repository.count() + unstored
+
+
+class ShardedAccountRegistry(AccountRegistry):
+    """Registry that can be shared between request threads.
+
+    Check-and-insert and per-account updates run under the lock of the
+    shard owning the PESEL, so unrelated accounts never wait on each other.
+    """
+
+    def __init__(self, shard_count=16):
+        self.accounts = ShardedAccountStore(shard_count)
+        # Held shared by transfers between two accounts and exclusively
+        # while the accounts they touched during a save are copied again,
+        # so the copies have each such transfer on both sides or on neither
+        self._internal_transfers = SharedLock()
+        self._trackers = []
+        self._trackers_lock = threading.Lock()
+
+    def _new_store(self):
+        return ShardedAccountStore(self.accounts.shard_count)
+
+    def add_account_if_absent(self, account):
+        if not hasattr(account, 'pesel'):
+            return False
+        return self.accounts.append_if_absent(account)
+
+    def add_accounts_if_absent(self, accounts, on_added=None):
+        valid = [account for account in accounts if hasattr(account, 'pesel')]
+        added = iter(self.accounts.extend_if_absent(valid, on_added))
+        return [next(added) if hasattr(account, 'pesel') else False for account in accounts]
+
+    def locked(self, pesel):
+        return self.accounts.lock_for(pesel)
+
+    @contextlib.contextmanager
+    def locked_for_transfer(self, source, target):
+        with self._internal_transfers.shared(), self.accounts.locked((source, target)):
+            # Noted with both accounts locked: a copy taken before this
+            # point was taken before the transfer started, on either side
+            with self._trackers_lock:
+                for touched in self._trackers:
+                    touched.update((source, target))
+            yield
+
+    def transfers_paused(self):
+        return self._internal_transfers.exclusive()
+
+    @contextlib.contextmanager
+    def tracking_transfers(self):
+        touched = set()
+        with self._trackers_lock:
+            self._trackers.append(touched)
+        try:
+            yield touched
+        finally:
+            with self._trackers_lock:
+                self._trackers = [tracker for tracker in self._trackers if tracker is not touched]
+
+    def load_snapshot(self, snapshot):
+        # Accounts are built from the snapshot on first use instead of up front
+        self.accounts = LazySnapshotStore(snapshot, self.accounts.shard_count)
+        return len(snapshot)
+
+    def use_repository(self, repository, capacity):
+        """Serve accounts from ``repository``, keeping at most ``capacity`` of them in memory."""
+        self.accounts = RepositoryCacheStore(repository, capacity, self.accounts.shard_count)
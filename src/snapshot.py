@@ -0,0 +1,176 @@
+import bisect
+import mmap
+import struct
+from array import array
+
+from src.account import Account
+from src.history import LazyHistory, from_minor, to_minor
+from src.history_codec import decode, encode
+
+MAGIC = b'BANKSNP3'
+# magic, accounts, encoded history bytes, journal start_seq, first-name bytes, last-name bytes
+HEADER = struct.Struct('=8sqqqqq')
+HEADER_SIZE = 64
+KEY_WIDTH = 11
+
+
+def padded(size):
+    return size + (-size) % 8
+
+
+def snapshot_columns(account):
+    """Registry export function turning an account into one snapshot row.
+
+    An export runs it under the account's shard lock, so a history that is
+    still in the repository is only copied here; ``write_snapshot_file``
+    fetches its entries after the lock is released and does not keep them.
+    """
+    history = account.transaction_history
+    if isinstance(history, LazyHistory) and not history.loaded:
+        entries = history.copy()
+    else:
+        entries = [to_minor(amount) for amount in history]
+    return (account.pesel, account.first_name, account.last_name, to_minor(account.balance),
+            to_minor(account.fee), account.journal_seq, entries)
+
+
+def encode_text(value):
+    return b'' if value is None else str(value).encode('utf-8')
+
+
+def write_snapshot_file(file, rows, start_seq=0):
+    """Write ``snapshot_columns`` rows to the binary ``file``; return the number of accounts.
+
+    The file is columnar in native byte order: a header, fixed-width keys,
+    the key sort order, int64 balance/fee/journal_seq columns, offset
+    columns, every history encoded with ``history_codec`` in one region and
+    the UTF-8 names. Amounts are stored in grosze.
+    """
+    keys = bytearray()
+    balances, fees, seqs = array('q'), array('q'), array('q')
+    history, history_offsets = bytearray(), array('q', [0])
+    first_names, first_offsets = bytearray(), array('q', [0])
+    last_names, last_offsets = bytearray(), array('q', [0])
+    for pesel, first_name, last_name, balance, fee, seq, entries in rows:
+        key = pesel.encode('ascii')
+        if len(key) > KEY_WIDTH:
+            raise ValueError(f"Key {pesel!r} is longer than {KEY_WIDTH} characters")
+        keys += key.ljust(KEY_WIDTH, b'\0')
+        balances.append(balance)
+        fees.append(fee)
+        seqs.append(seq)
+        if isinstance(entries, LazyHistory):
+            entries = [to_minor(amount) for amount in entries.stream()]
+        history += encode(entries)
+        history_offsets.append(len(history))
+        first_names += encode_text(first_name)
+        first_offsets.append(len(first_names))
+        last_names += encode_text(last_name)
+        last_offsets.append(len(last_names))
+
+    count = len(balances)
+    order = array('q', sorted(range(count), key=lambda index: keys[index * KEY_WIDTH:(index + 1) * KEY_WIDTH]))
+    file.write(HEADER.pack(MAGIC, count, len(history), start_seq, len(first_names), len(last_names))
+               .ljust(HEADER_SIZE, b'\0'))
+    file.write(keys.ljust(padded(len(keys)), b'\0'))
+    for column in (order, balances, fees, seqs, history_offsets, first_offsets, last_offsets):
+        file.write(column.tobytes())
+    file.write(history)
+    file.write(first_names)
+    file.write(last_names)
+    return count
+
+
+class SortedKeys:
+    """Sequence of snapshot keys in sorted order, for bisecting."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __getitem__(self, position):
+        return self._snapshot.raw_key(self._snapshot.order[position])
+
+
+class SnapshotFile:
+    """Memory-mapped snapshot written by ``write_snapshot_file``.
+
+    Opening only maps the file and reads the header; columns are read in
+    place, and ``account`` builds a single Account when it is needed.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, history_length, self.start_seq, first_length, last_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an account snapshot")
+        self._count = count
+        self._view = memoryview(self._map)
+        self._position = HEADER_SIZE + padded(count * KEY_WIDTH)
+        self.order = self._column(count)
+        self._balances = self._column(count)
+        self._fees = self._column(count)
+        self._seqs = self._column(count)
+        self._history_offsets = self._column(count + 1)
+        self._first_offsets = self._column(count + 1)
+        self._last_offsets = self._column(count + 1)
+        self._history = self._bytes(history_length)
+        self._first_names = self._bytes(first_length)
+        self._last_names = self._bytes(last_length)
+        self._sorted_keys = SortedKeys(self)
+
+    def _bytes(self, length):
+        region = self._view[self._position:self._position + length]
+        self._position += length
+        return region
+
+    def _column(self, length):
+        return self._bytes(length * 8).cast('q')
+
+    def __len__(self):
+        return self._count
+
+    def raw_key(self, index):
+        start = HEADER_SIZE + index * KEY_WIDTH
+        return self._map[start:start + KEY_WIDTH]
+
+    def key(self, index):
+        return self.raw_key(index).rstrip(b'\0').decode('ascii')
+
+    def find(self, key):
+        """Return the indexes of the accounts stored under ``key``, lowest first."""
+        try:
+            target = key.encode('ascii').ljust(KEY_WIDTH, b'\0')
+        except (AttributeError, UnicodeEncodeError):
+            return []
+        position = bisect.bisect_left(self._sorted_keys, target)
+        indexes = []
+        while position < self._count and self._sorted_keys[position] == target:
+            indexes.append(self.order[position])
+            position += 1
+        return indexes
+
+    @staticmethod
+    def _text(blob, offsets, index):
+        return str(blob[offsets[index]:offsets[index + 1]], 'utf-8')
+
+    def account(self, index):
+        account = Account.from_validated(self._text(self._first_names, self._first_offsets, index),
+                                         self._text(self._last_names, self._last_offsets, index),
+                                         self.key(index), fee=from_minor(self._fees[index]))
+        account.balance = from_minor(self._balances[index])
+        entries = decode(self._history[self._history_offsets[index]:self._history_offsets[index + 1]])
+        factory = Account.history_factory
+        if hasattr(factory, 'from_minor_values'):
+            account.transaction_history = factory.from_minor_values(entries)
+        else:
+            account.transaction_history = factory(from_minor(value) for value in entries)
+        account.journal_seq = self._seqs[index]
+        account.mark_clean()
+        return account
+
+    def accounts(self):
+        return (self.account(index) for index in range(self._count))
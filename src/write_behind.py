@@ -0,0 +1,164 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('bank_app.write_behind')
+
+
+class WriteBehind:
+    """Writes changed accounts to a repository from a background thread.
+
+    Request handlers call ``mark`` with the keys of accounts they changed,
+    created or deleted; that only queues the keys, so requests never wait
+    on the database. The flusher writes everything queued every
+    ``interval`` seconds, or as soon as ``max_pending`` keys are queued.
+    A key queued many times between flushes is written once, with the
+    account as it is when the flush copies it; an account that is gone
+    by then is deleted from the repository.
+
+    If a flush fails its keys are queued again and retried on the next
+    one, so ``lag`` keeps growing until the repository is back.
+    """
+
+    def __init__(self, registry, repository, interval=1.0, max_pending=1000, clock=time.monotonic):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self._registry = registry
+        self._repository = repository
+        self._clock = clock
+        # Key -> when it was first queued, oldest first
+        self._pending = {}
+        self._in_flight = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Held for a whole flush so the flusher and close() never overlap
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._flush_loop, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def mark(self, *keys):
+        # Keys marked together go to the same flush
+        with self._lock:
+            now = self._clock()
+            for key in keys:
+                self._pending.setdefault(key, now)
+            if len(self._pending) >= self.max_pending:
+                self._wake.notify()
+
+    @property
+    def queue_depth(self):
+        """Keys queued or being written that the repository does not have yet."""
+        with self._lock:
+            return len(self._pending) + len(self._in_flight)
+
+    @property
+    def lag(self):
+        """Seconds since the oldest change the repository does not have yet was queued."""
+        with self._lock:
+            # Both queues are ordered oldest first
+            oldest = [next(iter(queue.values())) for queue in (self._in_flight, self._pending) if queue]
+            return self._clock() - min(oldest) if oldest else 0
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "lag_seconds": round(self.lag, 3),
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._wake.wait_for(lambda: self._closed or len(self._pending) >= self.max_pending, self.interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # Kept in last_error and retried on the next flush
+                logger.error("Write-behind flush failed: %s", e)
+
+    def flush(self):
+        """Write every queued account now; return how many keys were written."""
+        with self._flush_lock:
+            with self._lock:
+                self._in_flight, self._pending = self._pending, {}
+                batch = self._in_flight
+            if not batch:
+                return 0
+            copies, deleted = {}, []
+            # Copied under each account's lock, like the save job does, so
+            # the repository is written without holding any lock; accounts
+            # an internal transfer touched meanwhile are copied again with
+            # transfers paused, so the copies hold it on both sides
+            with self._registry.tracking_transfers() as touched:
+                for key in batch:
+                    self._copy(key, copies, deleted)
+                with self._registry.transfers_paused():
+                    for key in touched:
+                        self._copy(key, copies, deleted)
+            saved = list(copies.values())
+            try:
+                if saved:
+                    self._repository.save([copy for _, copy in saved])
+                for key in deleted:
+                    self._repository.delete(key)
+            except Exception as e:
+                for account, copy in saved:
+                    account.mark_dirty()
+                with self._lock:
+                    # Requeued ahead of newer keys, keeping when they were first queued
+                    self._pending = {**batch, **{key: since for key, since in self._pending.items()
+                                                 if key not in batch}}
+                    self._in_flight = {}
+                    self.errors += 1
+                    self.last_error = str(e)
+                raise
+            with self._lock:
+                self._in_flight = {}
+                self.flushes += 1
+                self.written += len(saved) + len(deleted)
+            return len(saved) + len(deleted)
+
+    def _copy(self, key, copies, deleted):
+        with self._registry.locked(key):
+            account = self._registry.find_account_by_pesel(key)
+            if account is None:
+                copies.pop(key, None)
+                if key not in deleted:
+                    deleted.append(key)
+            elif account.is_dirty:
+                copies[key] = (account, account.detached_copy())
+                account.mark_clean()
+
+    def close(self):
+        """Stop the flusher and write what is still queued."""
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+        self.flush()
+
+
+def create_write_behind_from_env(registry, repository_factory):
+    """Start write-behind persistence when BANK_APP_WRITE_BEHIND_INTERVAL is set; return ``None`` otherwise.
+
+    ``repository_factory`` is only called when write-behind is enabled.
+    """
+    interval = os.environ.get('BANK_APP_WRITE_BEHIND_INTERVAL')
+    if not interval:
+        return None
+    write_behind = WriteBehind(registry, repository_factory(), interval=float(interval),
+                               max_pending=int(os.environ.get('BANK_APP_WRITE_BEHIND_MAX_PENDING', 1000)))
+    atexit.register(write_behind.close)
+    return write_behind
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from app.api import app, registry
+from src.account import Account
+
+
+def make_pesel(i: int) -> str:
+    return f"{i:011d}"
+
+
+class TestAccountsListingAPI:
+
+    @pytest.fixture
+    def client(self):
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            for i in range(25):
+                registry.add_account(Account("Page", f"User{i}", make_pesel(i)))
+            yield client
+
+    def test_unpaginated_list_unchanged(self, client):
+        resp = client.get('/api/accounts')
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert len(data) == 25
+        assert data[0] == {"name": "Page", "surname": "User0", "pesel": make_pesel(0), "balance": 0}
+
+    def test_pages_cover_all_accounts_in_order(self, client):
+        pesels = []
+        after = None
+        while True:
+            url = '/api/accounts?limit=10' + (f'&after={after}' if after else '')
+            resp = client.get(url)
+            assert resp.status_code == 200
+            data = resp.get_json()
+            pesels.extend(acc["pesel"] for acc in data["accounts"])
+            after = data["next"]
+            if after is None:
+                break
+        assert pesels == [make_pesel(i) for i in range(25)]
+
+    def test_cursor_stable_when_accounts_change(self, client):
+        first = client.get('/api/accounts?limit=5').get_json()
+        client.delete(f'/api/accounts/{make_pesel(2)}')
+        client.delete(f'/api/accounts/{make_pesel(6)}')
+        client.post('/api/accounts', json={"name": "New", "surname": "User", "pesel": make_pesel(100)})
+        second = client.get(f'/api/accounts?limit=5&after={first["next"]}').get_json()
+        assert [acc["pesel"] for acc in second["accounts"]] == [make_pesel(i) for i in (5, 7, 8, 9, 10)]
+
+    @pytest.mark.parametrize("query", ["limit=0", "limit=1001", "limit=abc", "after=xyz"])
+    def test_invalid_page_parameters(self, client, query):
+        resp = client.get(f'/api/accounts?{query}')
+        assert resp.status_code == 400
+
+    def test_ndjson_stream(self, client):
+        resp = client.get('/api/accounts?format=ndjson')
+        assert resp.status_code == 200
+        assert resp.mimetype == 'application/x-ndjson'
+        lines = resp.get_data(as_text=True).splitlines()
+        assert [json.loads(line)["pesel"] for line in lines] == [make_pesel(i) for i in range(25)]
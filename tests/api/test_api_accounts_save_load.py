@@ -13,27 +13,42 @@ def client():
         yield client
 
 
-def test_save_endpoint_calls_repository(monkeypatch, client):
+def test_save_endpoint_calls_repository(monkeypatch, client, wait_for_job):
     mock_repo = mock.Mock()
-    monkeypatch.setattr('app.api.create_mongo_repo_from_env', lambda: mock_repo)
+    monkeypatch.setattr('app.api.create_repo_from_env', lambda: mock_repo)
 
     registry.accounts.clear()
     registry.add_account(Account('Piotr', 'Z', '55555555555'))
 
     rv = client.post('/api/accounts/save')
-    assert rv.status_code == 200
+    job = wait_for_job(client, rv)
+    assert job["status"] == "succeeded"
+    assert job["result"]["count"] == 1
     mock_repo.save_all.assert_called_once()
 
 
-def test_load_endpoint_replaces_registry(monkeypatch, client):
+def test_load_endpoint_replaces_registry(monkeypatch, client, wait_for_job):
     loaded_acc = Account('Loaded', 'User', '99999999999')
     mock_repo = mock.Mock()
     mock_repo.load_all.return_value = [loaded_acc]
-    monkeypatch.setattr('app.api.create_mongo_repo_from_env', lambda: mock_repo)
+    monkeypatch.setattr('app.api.create_repo_from_env', lambda: mock_repo)
 
     registry.accounts.clear()
 
     rv = client.post('/api/accounts/load')
-    assert rv.status_code == 200
+    job = wait_for_job(client, rv)
+    assert job["status"] == "succeeded"
+    assert job["processed"] == job["result"]["count"] == 1
     assert registry.get_accounts_count() == 1
     assert registry.find_account_by_pesel('99999999999') is not None
+
+
+def test_patch_marks_account_dirty(client):
+    registry.accounts.clear()
+    account = Account.from_dict({'first_name': 'Clean', 'last_name': 'User', 'pesel': '99999999999'})
+    registry.add_account(account)
+    assert not account.is_dirty
+
+    rv = client.patch('/api/accounts/99999999999', json={'name': 'Changed'})
+    assert rv.status_code == 200
+    assert account.is_dirty
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from app.asgi import AsgiApp, runs_inline
+from src.journal import Journal
+
+PESEL = "89010112345"
+
+
+class TestAsgiApp:
+
+    @pytest.fixture
+    def asgi(self):
+        registry.accounts.clear()
+        asgi = AsgiApp(app, workers=4)
+        yield asgi
+        asyncio.run(self.lifespan(asgi))
+        registry.accounts.clear()
+
+    async def lifespan(self, asgi):
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await asgi({'type': 'lifespan'}, receive, send)
+        assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+    def request(self, asgi, method, path, body=None, query=b"", headers=()):
+        """Send one request through ``asgi``; return the status, headers, body and the thread that answered."""
+        data = json.dumps(body).encode() if body is not None else b""
+        # Sent in two parts, as servers do with large bodies
+        messages = iter([
+            {'type': 'http.request', 'body': data[:5], 'more_body': True},
+            {'type': 'http.request', 'body': data[5:]},
+        ])
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http', 'path': path,
+            'query_string': query, 'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode()),
+                        *headers],
+        }
+        sent = []
+        threads = set()
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message)
+
+        original = app.wsgi_app
+
+        def traced(environ, start_response):
+            threads.add(threading.current_thread())
+            return original(environ, start_response)
+
+        app.wsgi_app = traced
+        try:
+            asyncio.run(asgi(scope, receive, send))
+        finally:
+            app.wsgi_app = original
+        start, *parts = sent
+        assert [part.get('more_body', False) for part in parts] == [True] * (len(parts) - 1) + [False]
+        return start['status'], dict(start['headers']), b"".join(part['body'] for part in parts), threads.pop()
+
+    def test_same_routes_and_responses_as_flask(self, asgi):
+        status, headers, body, _ = self.request(
+            asgi, 'POST', '/api/accounts', {"name": "alice", "surname": "walker", "pesel": PESEL})
+        assert (status, json.loads(body)) == (201, {"message": "Account created"})
+        assert headers[b'content-type'] == b'application/json'
+        status, _, body, _ = self.request(asgi, 'POST', f'/api/accounts/{PESEL}/transfer',
+                                          {"amount": 100, "type": "incoming"},
+                                          headers=[(b'idempotency-key', b'key-1')])
+        assert status == 200
+        status, headers, _, _ = self.request(asgi, 'POST', f'/api/accounts/{PESEL}/transfer',
+                                             {"amount": 100, "type": "incoming"},
+                                             headers=[(b'idempotency-key', b'key-1')])
+        assert headers[b'idempotent-replayed'] == b'true'
+        status, _, body, _ = self.request(asgi, 'GET', f'/api/accounts/{PESEL}')
+        assert (status, json.loads(body)["balance"]) == (200, 100)
+        status, _, body, _ = self.request(asgi, 'GET', '/api/accounts/11111111111')
+        assert (status, json.loads(body)) == (404, {"error": "Account not found"})
+
+    def test_unknown_route(self, asgi):
+        status, _, _, thread = self.request(asgi, 'GET', '/api/unknown')
+        assert status == 404
+        assert thread is threading.main_thread()
+
+    def test_streamed_accounts_come_in_chunks(self, asgi):
+        self.request(asgi, 'POST', '/api/accounts/bulk',
+                     [{"name": "user", "surname": "bulk", "pesel": f"{i:011d}"} for i in range(3000)])
+        status, _, body, thread = self.request(asgi, 'GET', '/api/accounts', query=b'format=ndjson')
+        assert status == 200
+        assert len(body.splitlines()) == 3000
+        assert thread.name.startswith('asgi-worker')
+
+    def test_memory_only_requests_run_on_the_event_loop(self, asgi):
+        self.request(asgi, 'POST', '/api/accounts', {"name": "alice", "surname": "walker", "pesel": PESEL})
+        *_, thread = self.request(asgi, 'GET', f'/api/accounts/{PESEL}')
+        assert thread is threading.main_thread()
+        *_, thread = self.request(asgi, 'POST', '/api/transfers/internal', {"from": PESEL, "to": "1", "amount": 1})
+        assert thread.name.startswith('asgi-worker')
+
+    def test_busy_account_is_handled_off_the_event_loop(self, asgi):
+        self.request(asgi, 'POST', '/api/accounts', {"name": "alice", "surname": "walker", "pesel": PESEL})
+        held, release = threading.Event(), threading.Event()
+
+        def hold_shard():
+            # As a bulk create or save export holding the shard would
+            with registry.locked(PESEL):
+                held.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold_shard)
+        holder.start()
+        held.wait(5)
+        threading.Timer(0.1, release.set).start()
+        status, _, _, thread = self.request(asgi, 'POST', f'/api/accounts/{PESEL}/transfer',
+                                            {"amount": 100, "type": "incoming"})
+        holder.join()
+        assert status == 200
+        assert thread.name.startswith('asgi-worker')
+        *_, thread = self.request(asgi, 'POST', f'/api/accounts/{PESEL}/transfer', {"amount": 1, "type": "incoming"})
+        assert thread is threading.main_thread()
+        assert registry.find_account_by_pesel(PESEL).balance == 101
+
+    def test_routing(self, tmp_path, monkeypatch):
+        assert runs_inline('get_account_by_pesel') and runs_inline('transfer')
+        assert not runs_inline('save_accounts_to_db') and not runs_inline('get_all_accounts')
+        # Its PESEL is in the body, so its lock cannot be checked up front
+        assert not runs_inline('create_account')
+        journal = Journal(str(tmp_path))
+        monkeypatch.setattr(api, 'journal', journal)
+        try:
+            # Writes wait for the journal fsync before they answer
+            assert runs_inline('get_account_by_pesel') and not runs_inline('transfer')
+            journal.sync = False
+            assert runs_inline('transfer')
+        finally:
+            journal.close()
+        monkeypatch.setattr(api, 'cache_repository', object())
+        assert not runs_inline('get_account_by_pesel')
+
+    def test_client_gone_before_body(self, asgi):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi({'type': 'http', 'method': 'POST', 'path': '/api/accounts'}, receive, send))
+        assert sent == []
@@ -0,0 +1,76 @@
+import pytest
+from app.api import app, registry, MAX_BATCH_SIZE
+
+
+class TestBatchTransfersAPI:
+
+    @pytest.fixture
+    def client(self):
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+            client.post('/api/accounts', json={"name": "bob", "surname": "stone", "pesel": "90010112345"})
+            yield client
+
+    def test_batch_results_in_request_order(self, client):
+        items = [
+            {"pesel": "89010112345", "type": "incoming", "amount": 100},
+            {"pesel": "90010112345", "type": "outgoing", "amount": 10},
+            {"pesel": "89010112345", "type": "outgoing", "amount": 30},
+            {"pesel": "00000000000", "type": "incoming", "amount": 5},
+            {"pesel": "89010112345", "type": "express", "amount": 60},
+            {"pesel": "89010112345", "type": "bogus", "amount": 1},
+            {"pesel": "89010112345", "amount": 1},
+            "not a transfer",
+        ]
+        resp = client.post('/api/transfers/batch', json=items)
+        assert resp.status_code == 200
+        statuses = [result["status"] for result in resp.get_json()["results"]]
+        assert statuses == [200, 422, 200, 404, 200, 400, 400, 400]
+
+        account = registry.find_account_by_pesel("89010112345")
+        assert account.balance == 100 - 30 - 60 - 1
+        assert account.transaction_history == [100, -30, -60, -1]
+
+    def test_batch_matches_single_transfers(self, client):
+        client.post('/api/accounts/90010112345/transfer', json={"amount": 50, "type": "incoming"})
+        client.post('/api/accounts/90010112345/transfer', json={"amount": 20, "type": "outgoing"})
+        client.post('/api/transfers/batch', json=[
+            {"pesel": "89010112345", "type": "incoming", "amount": 50},
+            {"pesel": "89010112345", "type": "outgoing", "amount": 20},
+        ])
+        single = registry.find_account_by_pesel("90010112345")
+        batched = registry.find_account_by_pesel("89010112345")
+        assert batched.balance == single.balance
+        assert batched.transaction_history == single.transaction_history
+
+    def test_batch_reports_transfer_errors(self, client):
+        resp = client.post('/api/transfers/batch', json=[{"pesel": "89010112345", "type": "incoming", "amount": "abc"}])
+        result = resp.get_json()["results"][0]
+        assert result["status"] == 422
+        assert "error" in result
+
+    @pytest.mark.parametrize("pesel", [["89010112345"], {"pesel": "89010112345"}, 89010112345, None])
+    def test_pesel_that_is_not_a_string_fails_only_its_item(self, client, pesel):
+        resp = client.post('/api/transfers/batch', json=[
+            {"pesel": pesel, "type": "incoming", "amount": 5},
+            {"pesel": "89010112345", "type": "incoming", "amount": 10},
+        ])
+        assert resp.status_code == 200
+        assert resp.get_json()["results"] == [
+            {"status": 400, "error": "PESEL must be a string"},
+            {"status": 200, "message": "Zlecenie przyjęto do realizacji"},
+        ]
+        assert registry.find_account_by_pesel("89010112345").balance == 10
+
+    @pytest.mark.parametrize("payload", [{"pesel": "89010112345"}, []])
+    def test_batch_requires_non_empty_list(self, client, payload):
+        resp = client.post('/api/transfers/batch', json=payload)
+        assert resp.status_code == 400
+
+    def test_batch_size_limit(self, client):
+        items = [{"pesel": "89010112345", "type": "incoming", "amount": 1}] * (MAX_BATCH_SIZE + 1)
+        resp = client.post('/api/transfers/batch', json=items)
+        assert resp.status_code == 400
+        assert registry.find_account_by_pesel("89010112345").balance == 0
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from app.api import app, registry, MAX_BULK_ACCOUNTS
+
+
+class TestBulkAccountCreationAPI:
+
+    @pytest.fixture
+    def client(self):
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            client.post('/api/accounts', json={"name": "old", "surname": "user", "pesel": "89010112345"})
+            yield client
+
+    def test_bulk_create_json_array(self, client):
+        rows = [
+            {"name": "a", "surname": "b", "pesel": "90010112345"},
+            {"name": "c", "surname": "d", "pesel": "89010112345"},
+            {"name": "e", "surname": "f", "pesel": "90010112345"},
+            {"name": "g", "surname": "h", "pesel": "123"},
+            {"name": "i", "pesel": "91010112345"},
+            {"name": "j", "surname": "k", "pesel": "91010112345", "promocode": "PROM_123"},
+        ]
+        resp = client.post('/api/accounts/bulk', json=rows)
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert data["created"] == 2
+        assert [row["status"] for row in data["results"]] == [201, 409, 409, 400, 400, 201]
+        assert registry.get_accounts_count() == 3
+        assert registry.find_account_by_pesel("91010112345").balance == 50
+        assert registry.find_account_by_pesel("89010112345").first_name == "old"
+
+    def test_bulk_create_ndjson(self, client):
+        body = "\n".join([
+            json.dumps({"name": "a", "surname": "b", "pesel": "90010112345"}),
+            "",
+            "{not json",
+            json.dumps({"name": "c", "surname": "d", "pesel": "91010112345"}),
+        ])
+        resp = client.post('/api/accounts/bulk', data=body, content_type='application/x-ndjson')
+        assert resp.status_code == 200
+        assert [row["status"] for row in resp.get_json()["results"]] == [201, 400, 201]
+        assert registry.get_all_accounts()[-1].pesel == "91010112345"
+
+    @pytest.mark.parametrize("payload", [{"name": "a"}, []])
+    def test_bulk_create_requires_non_empty_list(self, client, payload):
+        resp = client.post('/api/accounts/bulk', json=payload)
+        assert resp.status_code == 400
+
+    def test_bulk_create_size_limit(self, client):
+        rows = [{"name": "a", "surname": "b", "pesel": "90010112345"}] * (MAX_BULK_ACCOUNTS + 1)
+        resp = client.post('/api/accounts/bulk', json=rows)
+        assert resp.status_code == 400
+        assert registry.get_accounts_count() == 1
@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from src.accounts_repository import SqliteAccountsRepository
+from src.journal import Journal
+from src.write_behind import WriteBehind
+
+PESEL, OTHER = "89010112345", "90010112345"
+
+
+class TestIdempotencyKeyAPI:
+
+    @pytest.fixture
+    def client(self):
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            api.idempotency_cache.clear()
+            client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": PESEL})
+            client.post('/api/accounts', json={"name": "bob", "surname": "stone", "pesel": OTHER})
+            yield client
+        registry.accounts.clear()
+        api.idempotency_cache.clear()
+
+    def transfer(self, client, pesel=PESEL, amount=100, transfer_type="incoming", key="key-1"):
+        return client.post(f'/api/accounts/{pesel}/transfer', json={"amount": amount, "type": transfer_type},
+                           headers={"Idempotency-Key": key})
+
+    def balance(self, client, pesel=PESEL):
+        return client.get(f'/api/accounts/{pesel}').get_json()["balance"]
+
+    def test_retry_is_booked_once(self, client):
+        first = self.transfer(client)
+        retry = self.transfer(client)
+        assert first.status_code == retry.status_code == 200
+        assert retry.get_json() == first.get_json()
+        assert "Idempotent-Replayed" not in first.headers
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert self.balance(client) == 100
+
+    def test_rejected_transfer_is_replayed_too(self, client):
+        assert self.transfer(client, transfer_type="outgoing").status_code == 422
+        self.transfer(client, key="key-2")
+        retry = self.transfer(client, transfer_type="outgoing")
+        assert retry.status_code == 422
+        assert retry.get_json() == {"error": "Insufficient funds"}
+        assert self.balance(client) == 100
+
+    def test_keys_are_scoped_to_the_account(self, client):
+        self.transfer(client)
+        self.transfer(client, pesel=OTHER)
+        assert [self.balance(client), self.balance(client, OTHER)] == [100, 100]
+
+    def test_key_reused_for_another_transfer_is_rejected(self, client):
+        self.transfer(client)
+        response = self.transfer(client, amount=50)
+        assert response.status_code == 422
+        assert response.get_json() == {"error": "Idempotency-Key was already used for a different transfer"}
+        assert self.balance(client) == 100
+
+    @pytest.mark.parametrize("key", ["", "k" * 256])
+    def test_invalid_key(self, client, key):
+        response = self.transfer(client, key=key)
+        assert response.status_code == 400
+        assert self.balance(client) == 0
+
+    def test_requests_without_a_key_are_not_deduplicated(self, client):
+        client.post(f'/api/accounts/{PESEL}/transfer', json={"amount": 100, "type": "incoming"})
+        client.post(f'/api/accounts/{PESEL}/transfer', json={"amount": 100, "type": "incoming"})
+        assert self.balance(client) == 200
+        assert api.idempotency_cache.stats()["size"] == 0
+
+    def test_unknown_account_is_not_remembered(self, client):
+        assert self.transfer(client, pesel="11111111111").status_code == 404
+        assert api.idempotency_cache.stats()["size"] == 0
+
+    def test_replay_is_not_journaled_or_queued(self, client, tmp_path, monkeypatch):
+        journal = Journal(str(tmp_path / "journal"))
+        repo = SqliteAccountsRepository(str(tmp_path / "bank.sqlite3"))
+        write_behind = WriteBehind(registry, repo, interval=60)
+        monkeypatch.setattr(api, 'journal', journal)
+        monkeypatch.setattr(api, 'write_behind', write_behind)
+        try:
+            self.transfer(client)
+            self.transfer(client)
+            assert (journal.last_seq, write_behind.queue_depth) == (1, 1)
+        finally:
+            journal.close()
+            write_behind.close()
+            repo.close()
+
+    def test_concurrent_retries_are_booked_once(self, client):
+        start = threading.Barrier(8)
+        statuses = []
+
+        def retry():
+            with app.test_client() as own_client:
+                start.wait()
+                statuses.append(self.transfer(own_client).status_code)
+
+        threads = [threading.Thread(target=retry) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert statuses == [200] * 8
+        assert self.balance(client) == 100
+        assert registry.find_account_by_pesel(PESEL).transaction_history == [100]
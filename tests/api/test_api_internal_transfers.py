@@ -0,0 +1,138 @@
+import threading
+import time
+import types
+
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from src.history import CompactHistory
+from src.journal import Journal, recover
+from src.sharded_registry import ShardedAccountRegistry
+
+ALICE, BOB = "89010112345", "90010112345"
+
+
+class TestInternalTransfersAPI:
+
+    @pytest.fixture
+    def client(self):
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": ALICE})
+            client.post('/api/accounts', json={"name": "bob", "surname": "stone", "pesel": BOB})
+            client.post(f'/api/accounts/{ALICE}/transfer', json={"amount": 100, "type": "incoming"})
+            yield client
+        registry.accounts.clear()
+
+    def balances(self, client):
+        return [client.get(f'/api/accounts/{pesel}').get_json()["balance"] for pesel in (ALICE, BOB)]
+
+    def test_moves_money_between_accounts(self, client):
+        response = client.post('/api/transfers/internal', json={"from": ALICE, "to": BOB, "amount": 40.5})
+        assert response.status_code == 200
+        assert response.get_json() == {"message": "Zlecenie przyjęto do realizacji"}
+        assert self.balances(client) == [59.5, 40.5]
+        assert registry.find_account_by_pesel(BOB).transaction_history == [40.5]
+
+    def test_insufficient_funds_change_nothing(self, client):
+        response = client.post('/api/transfers/internal', json={"from": BOB, "to": ALICE, "amount": 1})
+        assert response.status_code == 422
+        assert response.get_json() == {"error": "Insufficient funds"}
+        assert self.balances(client) == [100, 0]
+        assert registry.find_account_by_pesel(ALICE).transaction_history == [100]
+
+    @pytest.mark.parametrize("body, status, error", [
+        ({"from": ALICE, "to": BOB}, 400, "Missing required fields"),
+        ([ALICE, BOB, 1], 400, "Missing required fields"),
+        ({"from": ALICE, "to": ALICE, "amount": 1}, 400, "Source and target accounts must differ"),
+        ({"from": ALICE, "to": BOB, "amount": -5}, 400, "Amount must be a positive number"),
+        ({"from": ALICE, "to": BOB, "amount": "5"}, 400, "Amount must be a positive number"),
+        ({"from": ALICE, "to": BOB, "amount": True}, 400, "Amount must be a positive number"),
+        ({"from": ALICE, "to": BOB, "amount": float("nan")}, 400, "Amount must be a positive number"),
+        ({"from": ALICE, "to": BOB, "amount": float("inf")}, 400, "Amount must be a positive number"),
+        ({"from": ["x"], "to": BOB, "amount": 1}, 400, "PESEL must be a string"),
+        ({"from": ALICE, "to": {"pesel": BOB}, "amount": 1}, 400, "PESEL must be a string"),
+        ({"from": ALICE, "to": 90010112345, "amount": 1}, 400, "PESEL must be a string"),
+        ({"from": ALICE, "to": "00000000000", "amount": 5}, 404, "Account not found"),
+        ({"from": "00000000000", "to": BOB, "amount": 5}, 404, "Account not found"),
+    ])
+    def test_rejected_requests(self, client, body, status, error):
+        response = client.post('/api/transfers/internal', json=body)
+        assert response.status_code == status
+        assert response.get_json() == {"error": error}
+        assert self.balances(client) == [100, 0]
+
+    def test_amount_a_compact_history_rounds_away_is_refused(self, client):
+        registry.find_account_by_pesel(BOB).transaction_history = CompactHistory()
+        response = client.post('/api/transfers/internal', json={"from": ALICE, "to": BOB, "amount": 0.004})
+        assert response.status_code == 400
+        assert response.get_json() == {"error": "Amount must be at least 0.01"}
+        assert self.balances(client) == [100, 0]
+        assert registry.find_account_by_pesel(ALICE).transaction_history == [100]
+
+    def test_one_journal_record_for_both_sides(self, client, tmp_path, monkeypatch):
+        journal = Journal(str(tmp_path))
+        monkeypatch.setattr(api, 'journal', journal)
+        carl, dora = "91010112345", "92010112345"
+        for name, pesel in (("carl", carl), ("dora", dora)):
+            client.post('/api/accounts', json={"name": name, "surname": "gray", "pesel": pesel})
+        client.post(f'/api/accounts/{carl}/transfer', json={"amount": 50, "type": "incoming"})
+        client.post('/api/transfers/internal', json={"from": carl, "to": dora, "amount": 30})
+        assert registry.find_account_by_pesel(carl).journal_seq == registry.find_account_by_pesel(dora).journal_seq == 4
+        journal.close()
+
+        restored = ShardedAccountRegistry()
+        assert recover(str(tmp_path), restored) == 4
+        assert [restored.find_account_by_pesel(pesel).balance for pesel in (carl, dora)] == [20, 30]
+
+    def test_both_accounts_are_queued_for_write_behind(self, client, monkeypatch):
+        marked = []
+        monkeypatch.setattr(api, 'write_behind', types.SimpleNamespace(mark=lambda *keys: marked.append(keys)))
+        client.post('/api/transfers/internal', json={"from": ALICE, "to": BOB, "amount": 30})
+        assert marked == [(ALICE, BOB)]
+
+    def test_save_copies_hold_each_transfer_on_both_sides(self, client, monkeypatch, wait_for_job):
+        saved = []
+
+        class Repo:
+            def save_all(self, accounts):
+                saved.extend(accounts)
+
+        monkeypatch.setattr(api, 'create_repo_from_env', Repo)
+        with registry.locked_for_transfer(ALICE, BOB):
+            registry.find_account_by_pesel(ALICE).outgoing_transfer(25)
+            response = client.post('/api/accounts/save')
+            time.sleep(0.05)
+            # The save cannot copy anything until the transfer is complete
+            assert client.get(response.get_json()["status_url"]).get_json()["processed"] == 0
+            registry.find_account_by_pesel(BOB).incoming_transfer(25)
+        assert wait_for_job(client, response)["status"] == "succeeded"
+        assert sorted(account.balance for account in saved) == [25, 75]
+
+    def test_transfers_go_on_while_a_save_copies_accounts(self, client, monkeypatch, wait_for_job):
+        saved = []
+
+        class Repo:
+            def save_all(self, accounts):
+                saved.extend(accounts)
+
+        export = registry.export
+        responses = []
+
+        def export_with_a_transfer(fn):
+            for position, item in enumerate(export(fn)):
+                if position == 0:
+                    # One of the two accounts is copied, the other is not yet
+                    transfer = threading.Thread(target=lambda: responses.append(app.test_client().post(
+                        '/api/transfers/internal', json={"from": ALICE, "to": BOB, "amount": 25}).status_code))
+                    transfer.start()
+                    transfer.join(5)
+                yield item
+
+        monkeypatch.setattr(api, 'create_repo_from_env', Repo)
+        monkeypatch.setattr(registry, 'export', export_with_a_transfer)
+        assert wait_for_job(client, client.post('/api/accounts/save'))["status"] == "succeeded"
+        assert responses == [200]
+        assert sorted(account.balance for account in saved) == [25, 75]
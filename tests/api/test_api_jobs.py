@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from src.account import Account
+
+
+class BlockingRepo:
+    """Repository whose save waits until the test lets it finish."""
+
+    def __init__(self, fail=False):
+        self.release = threading.Event()
+        self.saving = threading.Event()
+        self.saved = None
+        self.fail = fail
+
+    def save_all(self, accounts):
+        self.saving.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("connection lost")
+        self.saved = [(account.pesel, account.balance) for account in accounts]
+        return {"written": len(accounts), "deleted": 0}
+
+    def load_all(self):
+        raise RuntimeError("no such database")
+
+
+class TestJobsAPI:
+
+    @pytest.fixture
+    def client(self):
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+            yield client
+        registry.accounts.clear()
+
+    def test_transfers_are_not_blocked_by_a_running_save(self, client, monkeypatch, wait_for_job):
+        repo = BlockingRepo()
+        monkeypatch.setattr(api, 'create_repo_from_env', lambda: repo)
+        response = client.post('/api/accounts/save')
+        assert response.status_code == 202
+        assert response.headers['Location'] == response.get_json()["status_url"]
+        assert repo.saving.wait(5)
+
+        running = client.get(response.get_json()["status_url"]).get_json()
+        assert running["status"] == "running"
+        assert running["processed"] == 1
+        assert running["bytes"] > 0
+
+        transfer = client.post('/api/accounts/89010112345/transfer', json={"amount": 100, "type": "incoming"})
+        assert transfer.status_code == 200
+        repo.release.set()
+
+        job = wait_for_job(client, response)
+        assert job["status"] == "succeeded"
+        assert job["result"] == {"count": 1, "written": 1, "deleted": 0}
+        assert job["elapsed"] >= 0
+        # The save holds the state from when the job copied the account
+        assert repo.saved == [("89010112345", 0)]
+        assert registry.find_account_by_pesel("89010112345").is_dirty
+
+    def test_failed_save_keeps_accounts_dirty(self, client, monkeypatch, wait_for_job):
+        repo = BlockingRepo(fail=True)
+        repo.release.set()
+        monkeypatch.setattr(api, 'create_repo_from_env', lambda: repo)
+        job = wait_for_job(client, client.post('/api/accounts/save'))
+        assert job["status"] == "failed"
+        assert job["error"] == "connection lost"
+        assert registry.find_account_by_pesel("89010112345").is_dirty
+
+    def test_failed_load_keeps_accounts(self, client, monkeypatch, wait_for_job):
+        monkeypatch.setattr(api, 'create_repo_from_env', BlockingRepo)
+        job = wait_for_job(client, client.post('/api/accounts/load'))
+        assert job["status"] == "failed"
+        assert registry.get_accounts_count() == 1
+
+    def test_repository_errors_are_reported_immediately(self, client, monkeypatch):
+        def broken():
+            raise ImportError("pymongo missing")
+
+        monkeypatch.setattr(api, 'create_repo_from_env', broken)
+        for path in ('/api/accounts/save', '/api/accounts/load'):
+            response = client.post(path)
+            assert response.status_code == 500
+            assert response.get_json()["details"] == "pymongo missing"
+
+    def test_unknown_job(self, client):
+        assert client.get('/api/jobs/nope').status_code == 404
@@ -0,0 +1,68 @@
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from src.journal import Journal, recover
+from src.sharded_registry import ShardedAccountRegistry
+
+
+class TestJournaledAPI:
+
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch):
+        app.config['TESTING'] = True
+        journal = Journal(str(tmp_path))
+        monkeypatch.setattr(api, 'journal', journal)
+        with app.test_client() as client:
+            registry.accounts.clear()
+            yield client
+        journal.close()
+        registry.accounts.clear()
+
+    def recovered_accounts(self):
+        api.journal.close()
+        restored = ShardedAccountRegistry()
+        recover(api.journal.directory, restored)
+        return {account.pesel: account for account in restored.get_all_accounts()}
+
+    def test_changes_survive_recovery(self, client):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+        client.post('/api/accounts/bulk', json=[
+            {"name": "bob", "surname": "stone", "pesel": "90010112345"},
+            {"name": "carl", "surname": "gray", "pesel": "91010112345"},
+        ])
+        client.post('/api/accounts/89010112345/transfer', json={"amount": 100, "type": "incoming"})
+        client.post('/api/accounts/89010112345/transfer', json={"amount": 500, "type": "outgoing"})
+        client.post('/api/transfers/batch', json=[
+            {"pesel": "89010112345", "type": "outgoing", "amount": 30},
+            {"pesel": "90010112345", "type": "incoming", "amount": 20},
+            {"pesel": "90010112345", "type": "outgoing", "amount": 50},
+        ])
+        client.patch('/api/accounts/90010112345', json={"surname": "rock"})
+        client.delete('/api/accounts/91010112345')
+        assert api.journal.durable_seq == api.journal.last_seq == 8
+
+        accounts = self.recovered_accounts()
+        assert list(accounts) == ["89010112345", "90010112345"]
+        assert accounts["89010112345"].balance == 70
+        assert accounts["89010112345"].transaction_history == [100, -30]
+        assert accounts["90010112345"].last_name == "rock"
+        assert accounts["90010112345"].balance == 20
+
+    def test_rejected_requests_are_not_journaled(self, client):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+        client.post('/api/accounts/89010112345/transfer', json={"amount": 10, "type": "outgoing"})
+        client.delete('/api/accounts/00000000000')
+        assert api.journal.last_seq == 1
+
+    def test_load_writes_snapshot(self, client, monkeypatch, wait_for_job):
+        class Repo:
+            def load_all(self):
+                return iter(registry.get_all_accounts())
+
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+        monkeypatch.setattr(api, 'create_repo_from_env', Repo)
+        assert wait_for_job(client, client.post('/api/accounts/load'))["status"] == "succeeded"
+        assert api.journal.last_seq == 1
+        assert list(self.recovered_accounts()) == ["89010112345"]
@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+from app.api import app, registry
+from src.log_pipeline import configure_route
+
+PESEL, OTHER = "89010112345", "90010112345"
+
+
+class TestRequestLogging:
+
+    @pytest.fixture
+    def client(self, caplog):
+        caplog.set_level(logging.INFO, logger="bank_app")
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            registry.accounts.clear()
+            yield client
+        registry.accounts.clear()
+        configure_route("transfer", logging.NOTSET, 1.0)
+
+    def test_requests_are_logged_per_route_without_pesels(self, client, caplog):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": PESEL})
+        client.post('/api/accounts', json={"name": "bob", "surname": "stone", "pesel": OTHER})
+        client.post(f'/api/accounts/{PESEL}/transfer', json={"amount": 100, "type": "incoming"})
+        client.post('/api/transfers/internal', json={"from": PESEL, "to": OTHER, "amount": 10})
+        client.get(f'/api/accounts/{PESEL}')
+        logged = [(record.name, record.getMessage()) for record in caplog.records]
+        assert logged == [
+            ("bank_app.api.create_account", "Create account request: *******2345"),
+            ("bank_app.api.create_account", "Create account request: *******2345"),
+            ("bank_app.api.transfer", "Transfer request for pesel: *******2345"),
+            ("bank_app.api.internal_transfer", "Internal transfer request: *******2345 -> *******2345, 10"),
+            ("bank_app.api.get_account_by_pesel", "Get account by pesel request: *******2345"),
+        ]
+        assert PESEL not in caplog.text and OTHER not in caplog.text
+
+    def test_route_can_be_silenced(self, client, caplog):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": PESEL})
+        configure_route("transfer", "WARNING")
+        client.post(f'/api/accounts/{PESEL}/transfer', json={"amount": 100, "type": "incoming"})
+        assert [record.name for record in caplog.records] == ["bank_app.api.create_account"]
+
+    def test_invalid_requests_are_logged_without_their_body(self, client, caplog):
+        client.post('/api/accounts', json={"pesel": PESEL})
+        client.post('/api/transfers/internal', json={"from": PESEL})
+        assert caplog.messages == ["Create account request without required fields",
+                                   "Internal transfer request without required fields"]
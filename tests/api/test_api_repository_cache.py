@@ -0,0 +1,67 @@
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from src.accounts_repository import SqliteAccountsRepository
+
+PESELS = [f"8901011{i:04d}" for i in range(200)]
+
+
+class TestRepositoryCacheAPI:
+
+    @pytest.fixture
+    def repo(self, tmp_path):
+        repo = SqliteAccountsRepository(str(tmp_path / "bank.sqlite3"))
+        yield repo
+        repo.close()
+
+    @pytest.fixture
+    def client(self, repo, monkeypatch):
+        app.config['TESTING'] = True
+        store = registry.accounts
+        registry.use_repository(repo, capacity=32)
+        monkeypatch.setattr(api, 'cache_repository', repo)
+        with app.test_client() as client:
+            yield client
+        registry.accounts = store
+
+    def test_accounts_outlive_the_cache(self, client, repo):
+        for pesel in PESELS:
+            client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": pesel})
+            client.post(f'/api/accounts/{pesel}/transfer', json={"amount": 100, "type": "incoming"})
+        assert len(registry.accounts.copy()) <= 32
+        assert repo.count() >= len(PESELS) - 32
+        assert client.get('/api/accounts/count').get_json() == {"count": len(PESELS)}
+
+        # The first account was evicted long ago and comes back from SQLite
+        assert client.get(f'/api/accounts/{PESELS[0]}').get_json()["balance"] == 100
+        response = client.post(f'/api/accounts/{PESELS[0]}/transfer', json={"amount": 30, "type": "outgoing"})
+        assert response.status_code == 200
+        assert client.patch(f'/api/accounts/{PESELS[0]}', json={"name": "alicja"}).status_code == 200
+        assert client.post('/api/accounts', json={"name": "a", "surname": "b", "pesel": PESELS[1]}).status_code == 409
+
+        assert client.delete(f'/api/accounts/{PESELS[2]}').status_code == 200
+        assert client.get(f'/api/accounts/{PESELS[2]}').status_code == 404
+        assert client.get('/api/accounts/count').get_json() == {"count": len(PESELS) - 1}
+
+    def test_listing_is_refused(self, client):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": PESELS[0]})
+        for query in ("", "?format=ndjson", "?limit=10"):
+            response = client.get(f'/api/accounts{query}')
+            assert response.status_code == 501
+            assert "cached" in response.get_json()["error"]
+
+    def test_save_writes_back_and_load_drops_the_cache(self, client, repo, wait_for_job):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": PESELS[0]})
+        client.post(f'/api/accounts/{PESELS[0]}/transfer', json={"amount": 100, "type": "incoming"})
+        assert repo.find(PESELS[0]) is None
+
+        job = wait_for_job(client, client.post('/api/accounts/save'))
+        assert job["result"] == {"count": 1, "written": 1, "deleted": 0}
+        assert repo.find(PESELS[0]).balance == 100
+
+        cached = registry.find_account_by_pesel(PESELS[0])
+        cached.incoming_transfer(50)
+        job = wait_for_job(client, client.post('/api/accounts/load'))
+        assert job["result"] == {"count": 1}
+        assert client.get(f'/api/accounts/{PESELS[0]}').get_json()["balance"] == 100
@@ -0,0 +1,56 @@
+import pytest
+
+import app.api as api
+from app.api import app, registry
+from src.accounts_repository import SqliteAccountsRepository
+from src.write_behind import WriteBehind
+
+
+class TestWriteBehindAPI:
+
+    @pytest.fixture
+    def repo(self, tmp_path):
+        repo = SqliteAccountsRepository(str(tmp_path / "bank.sqlite3"))
+        yield repo
+        repo.close()
+
+    @pytest.fixture
+    def client(self, repo, monkeypatch):
+        app.config['TESTING'] = True
+        write_behind = WriteBehind(registry, repo, interval=60)
+        monkeypatch.setattr(api, 'write_behind', write_behind)
+        with app.test_client() as client:
+            registry.accounts.clear()
+            yield client
+        write_behind.close()
+        registry.accounts.clear()
+
+    def test_every_change_is_queued_and_flushed(self, client, repo):
+        client.post('/api/accounts', json={"name": "alice", "surname": "walker", "pesel": "89010112345"})
+        client.post('/api/accounts/bulk', json=[
+            {"name": "bob", "surname": "stone", "pesel": "90010112345"},
+            {"name": "carl", "surname": "gray", "pesel": "91010112345"},
+        ])
+        client.post('/api/accounts/89010112345/transfer', json={"amount": 100, "type": "incoming"})
+        client.post('/api/accounts/89010112345/transfer', json={"amount": 500, "type": "outgoing"})
+        client.post('/api/transfers/batch', json=[{"pesel": "90010112345", "type": "incoming", "amount": 20}])
+        client.patch('/api/accounts/91010112345', json={"surname": "grey"})
+        stats = client.get('/api/write-behind').get_json()
+        assert stats["queue_depth"] == 3
+        assert repo.count() == 0
+
+        assert api.write_behind.flush() == 3
+        assert repo.find('89010112345').balance == 100
+        assert repo.find('90010112345').transaction_history == [20]
+        assert repo.find('91010112345').last_name == "grey"
+
+        client.delete('/api/accounts/90010112345')
+        assert client.get('/api/write-behind').get_json()["queue_depth"] == 1
+        api.write_behind.flush()
+        assert repo.find('90010112345') is None
+        stats = client.get('/api/write-behind').get_json()
+        assert (stats["queue_depth"], stats["flushes"], stats["written"]) == (0, 2, 4)
+
+    def test_stats_need_write_behind(self, client, monkeypatch):
+        monkeypatch.setattr(api, 'write_behind', None)
+        assert client.get('/api/write-behind').status_code == 404
@@ -0,0 +1,42 @@
+import logging
+import time
+
+import pytest
+
+from src.log_pipeline import LOGGER_NAME
+from src.nip_cache import nip_validation_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_nip_cache():
+    # Tests mock different MF answers for the same NIP
+    nip_validation_cache.clear()
+    yield
+    nip_validation_cache.clear()
+
+
+@pytest.fixture
+def caplog(caplog):
+    # The running log pipeline keeps bank_app records from the root logger,
+    # where pytest's capture handler listens
+    logger = logging.getLogger(LOGGER_NAME)
+    attached = not logger.propagate
+    if attached:
+        logger.addHandler(caplog.handler)
+    yield caplog
+    if attached:
+        logger.removeHandler(caplog.handler)
+
+
+@pytest.fixture
+def wait_for_job():
+    """Poll the status URL of a 202 job response until the job finishes."""
+    def wait(client, response, timeout=5):
+        assert response.status_code == 202
+        deadline = time.monotonic() + timeout
+        while True:
+            job = client.get(response.get_json()["status_url"]).get_json()
+            if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+                return job
+            time.sleep(0.01)
+    return wait
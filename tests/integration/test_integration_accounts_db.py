@@ -17,7 +17,7 @@ def mongo_client_or_skip():
         pytest.skip(f"Mongo not available at {url}: {e}")
 
 
-def test_save_and_load_end_to_end():
+def test_save_and_load_end_to_end(wait_for_job):
     mongo_client = mongo_client_or_skip()
     db_name = os.environ.get('MONGO_DB', 'bank_app')
     coll_name = os.environ.get('MONGO_COLLECTION', 'accounts')
@@ -30,12 +30,12 @@ def test_save_and_load_end_to_end():
     app.testing = True
     with app.test_client() as client_app:
         rv = client_app.post('/api/accounts/save')
-        assert rv.status_code == 200
+        assert wait_for_job(client_app, rv)["status"] == "succeeded"
 
         registry.accounts.clear()
         assert registry.get_accounts_count() == 0
 
         rv2 = client_app.post('/api/accounts/load')
-        assert rv2.status_code == 200
+        assert wait_for_job(client_app, rv2)["status"] == "succeeded"
         assert registry.get_accounts_count() == 1
     coll.delete_many({})
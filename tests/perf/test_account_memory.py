@@ -0,0 +1,68 @@
+import gc
+import os
+import tracemalloc
+
+import pytest
+
+from src.account import Account
+from src.history import CompactHistory
+
+
+class DictAccount:
+    # Mirrors the attribute layout Account had before it used __slots__
+    def __init__(self, first_name, last_name, pesel, promocode=None, fee=1):
+        self.balance = 0
+        self.fee = 0
+        self.transaction_history = []
+        self.first_name = first_name
+        self.last_name = last_name
+        self.pesel = pesel
+        self.promocode = promocode
+        self.fee = fee
+
+
+def make_pesel(i: int) -> str:
+    return f"{i:011d}"
+
+
+def bytes_per_account(factory, count):
+    pesels = [make_pesel(i) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    accounts = [factory("Perf", "User", pesel) for pesel in pesels]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(accounts) == count
+    return size / count
+
+
+@pytest.mark.parametrize("count", [
+    100_000,
+    pytest.param(1_000_000, marks=pytest.mark.skipif(
+        not os.environ.get('BANK_APP_BENCH_FULL'), reason="set BANK_APP_BENCH_FULL=1 to run the 1M account benchmark")),
+])
+def test_slotted_account_uses_less_memory(count):
+    before = bytes_per_account(DictAccount, count)
+    after = bytes_per_account(Account, count)
+    print(f"\n{count} accounts: dict-based {before:.0f} B/account, slotted {after:.0f} B/account")
+    assert after < before
+
+
+def bytes_per_entry(factory, count):
+    gc.collect()
+    tracemalloc.start()
+    history = factory()
+    for i in range(count):
+        history.append(1000 + i)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(history) == count
+    return size / count
+
+
+def test_compact_history_uses_less_memory():
+    count = 1_000_000
+    before = bytes_per_entry(list, count)
+    after = bytes_per_entry(CompactHistory, count)
+    print(f"\n{count} history entries: list {before:.1f} B/entry, compact {after:.1f} B/entry")
+    assert after * 3 < before
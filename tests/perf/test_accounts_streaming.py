@@ -0,0 +1,43 @@
+import tracemalloc
+
+import pytest
+from app.api import app, registry
+from src.account import Account
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        registry.accounts.clear()
+        yield client
+        registry.accounts.clear()
+
+
+def fill_registry(count):
+    registry.accounts.clear()
+    for i in range(count):
+        registry.add_account(Account("Perf", "User", f"{i:011d}"))
+
+
+def stream_peak_memory(client):
+    tracemalloc.start()
+    resp = client.get('/api/accounts?format=ndjson')
+    lines = 0
+    for chunk in resp.response:
+        lines += chunk.count(b"\n") if isinstance(chunk, bytes) else chunk.count("\n")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return lines, peak
+
+
+def test_ndjson_stream_peak_memory_is_flat(client):
+    peaks = {}
+    for count in (5_000, 20_000, 80_000):
+        fill_registry(count)
+        lines, peak = stream_peak_memory(client)
+        assert lines == count
+        peaks[count] = peak
+        print(f"\n{count} accounts: NDJSON stream peak {peak / 1024:.0f} KiB")
+    # 16x more accounts must not mean noticeably more memory while streaming
+    assert peaks[80_000] < peaks[5_000] * 2
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ACCOUNTS = 1000
+SECONDS = float(os.environ.get('BANK_APP_BENCH_SECONDS', 2))
+
+# The threaded Werkzeug server `flask run` starts, without its access log
+FLASK_SERVER = """
+import logging, sys
+from werkzeug.serving import run_simple
+from app.api import app
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port):
+    server = subprocess.Popen(command, cwd=ROOT, env={**os.environ, 'PYTHONPATH': ROOT},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError(f"{command[:3]} did not start")
+            time.sleep(0.05)
+
+
+class Connection:
+    """One HTTP/1.1 client connection, reopened whenever the server closes it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+        status_line = await self.reader.readline()
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if status_line.startswith(b"HTTP/1.0") or headers.get('connection', '').lower() == 'close':
+            self.close()
+        return int(status_line.split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def run_clients(port, clients, seconds):
+    """Each client sends GET and transfer requests in turn for ``seconds``; return latencies and failures."""
+    latencies, failures = [], []
+    deadline = time.perf_counter() + seconds
+
+    async def client(number):
+        rng = random.Random(number)
+        connection = Connection(port)
+        try:
+            while time.perf_counter() < deadline:
+                pesel = f"{rng.randrange(ACCOUNTS):011d}"
+                start = time.perf_counter()
+                try:
+                    if len(latencies) % 2:
+                        status = await connection.request('GET', f'/api/accounts/{pesel}')
+                    else:
+                        status = await connection.request('POST', f'/api/accounts/{pesel}/transfer',
+                                                          {"amount": 1, "type": "incoming"})
+                except OSError as e:
+                    failures.append(type(e).__name__)
+                    connection.close()
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    failures.append(status)
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return latencies, failures
+
+
+@pytest.fixture(scope="module")
+def servers():
+    ports = {"flask": free_port(), "asgi": free_port()}
+    commands = {
+        "flask": [sys.executable, '-c', FLASK_SERVER, str(ports["flask"])],
+        "asgi": [sys.executable, '-m', 'uvicorn', 'app.asgi:asgi_app', '--host', '127.0.0.1',
+                 '--port', str(ports["asgi"]), '--no-access-log', '--log-level', 'warning'],
+    }
+    started = []
+    try:
+        for name, command in commands.items():
+            started.append(start_server(command, ports[name]))
+            seed = [{"name": "bench", "surname": "user", "pesel": f"{i:011d}"} for i in range(ACCOUNTS)]
+            status = asyncio.run(Connection(ports[name]).request('POST', '/api/accounts/bulk', seed))
+            assert status == 200
+        yield ports
+    finally:
+        for server in started:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+@pytest.mark.parametrize("clients", [1, 64, 512])
+def test_asgi_against_flask(servers, clients):
+    print(f"\n{clients} concurrent clients, {SECONDS:g}s each:")
+    for name, port in servers.items():
+        latencies, failures = asyncio.run(run_clients(port, clients, SECONDS))
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print(f"  {name:5}: {len(latencies) / SECONDS:8,.0f} req/s  p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms"
+              f"  p99 {p99 * 1000:7.1f} ms  failed {len(failures)}")
+        assert latencies
+        assert not [failure for failure in failures if isinstance(failure, int)]
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+from app.api import app, registry
+
+TRANSFERS = 2000
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        registry.accounts.clear()
+        for i in range(10):
+            client.post('/api/accounts', json={"name": "Perf", "surname": "User", "pesel": f"{i:011d}"})
+        yield client
+        registry.accounts.clear()
+
+
+def test_batch_endpoint_outperforms_single_transfers(client):
+    items = [{"pesel": f"{i % 10:011d}", "type": "incoming", "amount": 1} for i in range(TRANSFERS)]
+
+    start = time.perf_counter()
+    for item in items:
+        resp = client.post(f"/api/accounts/{item['pesel']}/transfer", json={"amount": item["amount"], "type": item["type"]})
+        assert resp.status_code == 200
+    single_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resp = client.post('/api/transfers/batch', json=items)
+    batch_duration = time.perf_counter() - start
+    assert resp.status_code == 200
+    assert all(result["status"] == 200 for result in resp.get_json()["results"])
+
+    print(f"\n{TRANSFERS} transfers: single {TRANSFERS / single_duration:.0f}/s, batch {TRANSFERS / batch_duration:.0f}/s")
+    for i in range(10):
+        assert registry.find_account_by_pesel(f"{i:011d}").balance == 2 * TRANSFERS // 10
+    assert batch_duration * 5 < single_duration
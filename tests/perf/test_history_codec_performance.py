@@ -0,0 +1,82 @@
+import json
+import os
+import random
+import time
+
+import pytest
+
+from src.history import to_minor
+from src.history_codec import decode, encode
+
+HISTORIES = 10_000
+
+
+def synthetic_history(rng, length):
+    # Salary-sized incoming transfers, everyday payments, express transfers
+    # with their fee, and runs of the monthly ZUS payment
+    history = []
+    while len(history) < length:
+        kind = rng.random()
+        if kind < 0.2:
+            history.append(rng.randrange(2000, 12000))
+        elif kind < 0.7:
+            history.append(-round(rng.uniform(1, 300), 2))
+        elif kind < 0.9:
+            history.extend([-rng.randrange(10, 1000), -1])
+        else:
+            history.extend([-1775] * rng.randrange(1, 4))
+    return [to_minor(amount) for amount in history[:length]]
+
+
+def express_history(rng, length):
+    # Nothing but express transfers: every amount is followed by its fee
+    history = []
+    while len(history) < length:
+        history.extend([-rng.randrange(10, 1000), -1])
+    return [to_minor(amount) for amount in history[:length]]
+
+
+def plain_varint_size(values):
+    # Zigzag varints without deltas, runs or fee tokens
+    size = 0
+    for value in values:
+        zigzag = value << 1 if value >= 0 else ((-value) << 1) - 1
+        size += max(1, (zigzag.bit_length() + 6) // 7)
+    return size
+
+
+@pytest.mark.parametrize("length", [
+    20,
+    pytest.param(1000, marks=pytest.mark.skipif(
+        not os.environ.get('BANK_APP_BENCH_FULL'), reason="set BANK_APP_BENCH_FULL=1 to run the long history benchmark")),
+])
+@pytest.mark.parametrize("make_history", [synthetic_history, express_history])
+def test_history_codec_size_and_throughput(length, make_history):
+    rng = random.Random(2025)
+    histories = [make_history(rng, length) for _ in range(HISTORIES)]
+    entries = HISTORIES * length
+
+    start = time.perf_counter()
+    encoded = [encode(history) for history in histories]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [decode(blob) for blob in encoded]
+    decode_time = time.perf_counter() - start
+
+    json_size = sum(len(json.dumps([value / 100 for value in history])) for history in histories)
+    encoded_size = sum(len(blob) for blob in encoded)
+    varint_size = sum(plain_varint_size(history) for history in histories)
+    print(f"\n{HISTORIES} histories of {length} entries ({make_history.__name__}):"
+          f"\n  JSON:     {json_size / entries:5.2f} B/entry"
+          f"\n  int64:    {8:5.2f} B/entry"
+          f"\n  varint:   {varint_size / entries:5.2f} B/entry"
+          f"\n  encoded:  {encoded_size / entries:5.2f} B/entry"
+          f"\n  encode:   {entries / encode_time:,.0f} entries/s"
+          f"\n  decode:   {entries / decode_time:,.0f} entries/s")
+
+    assert [list(values) for values in decoded] == histories
+    assert encoded_size < json_size / 2
+    if make_history is express_history:
+        # Fee tokens make up for the low bits every token spends on its kind
+        assert encoded_size < varint_size
@@ -0,0 +1,57 @@
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from src.idempotency import IdempotencyCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("keys", [
+    200_000,
+    pytest.param(2_000_000, marks=pytest.mark.skipif(
+        not os.environ.get('BANK_APP_BENCH_FULL'), reason="set BANK_APP_BENCH_FULL=1 to run the two million key benchmark")),
+])
+def test_idempotency_cache_stays_bounded(keys):
+    # A day of keys squeezed into a cache holding a quarter of them: every
+    # put past that point evicts, and the clock moves so entries expire too
+    max_size = keys // 4
+    clock = FakeClock()
+    cache = IdempotencyCache(ttl=keys // 8, max_size=max_size, clock=clock)
+    response = ({"message": "Zlecenie przyjęto do realizacji"}, 200)
+    requests = [(f"key-{number}", "89010112345") for number in range(keys)]
+
+    start = time.perf_counter()
+    for number, key in enumerate(requests):
+        clock.now = number
+        cache.put(key, ("incoming", 100), response)
+    put_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = sum(cache.get(key) is not None for key in requests)
+    get_time = time.perf_counter() - start
+
+    # Memory of a cache full to max_size, keys included
+    tracemalloc.start()
+    full = IdempotencyCache(max_size=max_size, clock=clock)
+    for number in range(keys):
+        full.put((f"key-{number}", "89010112345"), ("incoming", 100), response)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"\n{keys:,} keys, max_size {max_size:,}, ttl {keys // 8:,}:"
+          f"\n  put:    {keys / put_time:,.0f} keys/s"
+          f"\n  get:    {keys / get_time:,.0f} keys/s"
+          f"\n  memory: {current / 1024 / 1024:.1f} MiB when full, {current / max_size:.0f} B/entry")
+
+    assert cache.stats()["size"] == hits == keys // 8
+    assert full.stats()["size"] == max_size
+    assert current < max_size * 500
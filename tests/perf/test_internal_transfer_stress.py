@@ -0,0 +1,95 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from app.api import app, registry
+
+INITIAL_BALANCE = 1000
+TRANSFERS_PER_THREAD = int(os.environ.get('BANK_APP_BENCH_TRANSFERS', 200))
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        registry.accounts.clear()
+        yield client
+        registry.accounts.clear()
+
+
+def create_accounts(client, count):
+    pesels = [f"{i:011d}" for i in range(count)]
+    client.post('/api/accounts/bulk', json=[{"name": "Perf", "surname": "User", "pesel": pesel} for pesel in pesels])
+    for pesel in pesels:
+        registry.find_account_by_pesel(pesel).incoming_transfer(INITIAL_BALANCE)
+    return pesels
+
+
+def total_money():
+    with registry.transfers_paused():
+        return sum(registry.export(lambda account: account.balance))
+
+
+def run_transfers(pesels, threads):
+    results = {200: 0, 422: 0}
+    results_lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        counts = {200: 0, 422: 0}
+        with app.test_client() as client:
+            for _ in range(TRANSFERS_PER_THREAD):
+                source, target = rng.sample(pesels, 2)
+                response = client.post('/api/transfers/internal',
+                                       json={"from": source, "to": target, "amount": rng.randint(1, 400)})
+                counts[response.status_code] += 1
+        with results_lock:
+            for status, count in counts.items():
+                results[status] += count
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+@pytest.mark.parametrize("accounts", [1000, 4])
+def test_internal_transfers_conserve_money(client, accounts, capsys):
+    pesels = create_accounts(client, accounts)
+    expected = accounts * INITIAL_BALANCE
+
+    # Copies taken while transfers run must still add up, like a save's
+    totals = []
+    stop = threading.Event()
+
+    def audit():
+        # Saves are occasional; back-to-back exclusive holders would starve the transfers
+        while not stop.wait(0.02):
+            totals.append(total_money())
+
+    auditor = threading.Thread(target=audit)
+    auditor.start()
+    lines = []
+    try:
+        for threads in THREAD_COUNTS:
+            results, elapsed = run_transfers(pesels, threads)
+            assert sum(results.values()) == threads * TRANSFERS_PER_THREAD
+            assert total_money() == expected
+            lines.append(f"  {threads:2d} threads: {threads * TRANSFERS_PER_THREAD / elapsed:8,.0f} transfers/s"
+                         f"  ({results[422]} rejected for funds)")
+    finally:
+        stop.set()
+        auditor.join()
+
+    with capsys.disabled():
+        print(f"\ninternal transfers between {accounts} accounts, "
+              f"{len(totals)} consistent audits during the run:\n" + "\n".join(lines))
+    assert totals and set(totals) == {expected}
+    assert all(account.balance >= 0 for account in registry.get_all_accounts())
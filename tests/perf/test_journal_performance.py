@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.account import Account
+from src.journal import Journal, recover
+from src.sharded_registry import ShardedAccountRegistry
+
+ACCOUNTS = 1000
+SYNC_THREADS = 32
+SYNC_TRANSFERS_PER_THREAD = 100
+
+
+def transfer_record(i):
+    return {"op": "transfer", "pesel": f"{i % ACCOUNTS:011d}", "type": "incoming", "amount": 1}
+
+
+@pytest.mark.parametrize("transfers", [
+    100_000,
+    pytest.param(10_000_000, marks=pytest.mark.skipif(
+        not os.environ.get('BANK_APP_BENCH_FULL'), reason="set BANK_APP_BENCH_FULL=1 to run the 10M transfer benchmark")),
+])
+def test_journal_append_and_recovery(tmp_path, transfers):
+    directory = str(tmp_path)
+    journal = Journal(directory)
+    for i in range(ACCOUNTS):
+        journal.append({"op": "create", "account": Account("Perf", "User", f"{i:011d}").to_dict()})
+
+    start = time.perf_counter()
+    for i in range(transfers):
+        journal.append(transfer_record(i))
+    journal.wait_durable(journal.last_seq)
+    append_time = time.perf_counter() - start
+    fsyncs = journal.fsyncs
+    journal.close()
+
+    registry = ShardedAccountRegistry()
+    start = time.perf_counter()
+    last_seq = recover(directory, registry)
+    replay_time = time.perf_counter() - start
+
+    journal = Journal(directory, start_seq=last_seq)
+    start = time.perf_counter()
+    journal.write_snapshot(registry)
+    snapshot_time = time.perf_counter() - start
+    journal.close()
+
+    start = time.perf_counter()
+    recover(directory, ShardedAccountRegistry())
+    snapshot_recovery_time = time.perf_counter() - start
+
+    print(f"\n{transfers} journaled transfers over {ACCOUNTS} accounts:"
+          f"\n  append:                  {transfers / append_time:,.0f} records/s, {fsyncs} fsyncs"
+          f"\n  recovery (full replay):  {replay_time:.2f}s"
+          f"\n  snapshot:                {snapshot_time:.2f}s"
+          f"\n  recovery (snapshot):     {snapshot_recovery_time:.2f}s")
+
+    assert last_seq == ACCOUNTS + transfers
+    assert sum(account.balance for account in registry.get_all_accounts()) == transfers
+    assert fsyncs < transfers
+
+
+def test_group_commit_with_waiting_writers(tmp_path):
+    journal = Journal(str(tmp_path))
+
+    def writer(offset):
+        for i in range(SYNC_TRANSFERS_PER_THREAD):
+            journal.wait_durable(journal.append(transfer_record(offset + i)))
+
+    threads = [threading.Thread(target=writer, args=(n * SYNC_TRANSFERS_PER_THREAD,)) for n in range(SYNC_THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    journal.close()
+
+    records = SYNC_THREADS * SYNC_TRANSFERS_PER_THREAD
+    print(f"\n{SYNC_THREADS} threads waiting for durability: {records / elapsed:,.0f} records/s, "
+          f"{records / journal.fsyncs:.1f} records per fsync")
+    assert journal.fsyncs < records
@@ -0,0 +1,93 @@
+import logging
+import os
+import time
+
+import pytest
+
+from app.api import app, registry
+from src import log_pipeline
+from src.log_pipeline import configure_route, route_logger, start_log_pipeline, start_log_pipeline_from_env, stop_log_pipeline
+
+TRANSFERS = int(os.environ.get('BANK_APP_BENCH_TRANSFERS', 2000))
+ROUNDS = 3
+PESEL = "89010112345"
+MODES = {
+    "disabled": ("WARNING", 1.0),
+    "sampled": ("INFO", 0.01),
+    "full": ("INFO", 1.0),
+}
+
+
+class CountingHandler(logging.StreamHandler):
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+        super().emit(record)
+
+
+@pytest.fixture
+def devnull_pipeline():
+    # The same pipeline the app runs, writing to /dev/null instead of stdout
+    running = log_pipeline._listener is not None
+    stop_log_pipeline()
+    with open(os.devnull, 'w') as devnull:
+        handler = CountingHandler(devnull)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        start_log_pipeline(handler)
+        yield handler
+        stop_log_pipeline()
+    configure_route("transfer", logging.NOTSET, 1.0)
+    if running:
+        start_log_pipeline_from_env()
+
+
+def test_transfer_logging_overhead(devnull_pipeline):
+    app.config['TESTING'] = True
+    best = {}
+    with app.test_client() as client:
+        registry.accounts.clear()
+        client.post('/api/accounts', json={"name": "perf", "surname": "user", "pesel": PESEL})
+        configure_route("transfer", "WARNING")
+        for _ in range(TRANSFERS // 10):
+            client.post(f'/api/accounts/{PESEL}/transfer', json={"amount": 1, "type": "incoming"})
+        # Modes take turns, so a slow stretch of the machine hits them all
+        for _ in range(ROUNDS):
+            for mode, (level, sample) in MODES.items():
+                configure_route("transfer", level, sample)
+                before = devnull_pipeline.count
+                start = time.perf_counter()
+                for _ in range(TRANSFERS):
+                    client.post(f'/api/accounts/{PESEL}/transfer', json={"amount": 1, "type": "incoming"})
+                elapsed = time.perf_counter() - start
+                # Stopping the listener writes out everything still queued
+                stop_log_pipeline()
+                written = devnull_pipeline.count - before
+                start_log_pipeline(devnull_pipeline)
+                best[mode] = min(best.get(mode, elapsed), elapsed)
+
+                if mode == "disabled":
+                    assert written == 0
+                elif mode == "full":
+                    assert written == TRANSFERS
+                else:
+                    assert written < TRANSFERS * 0.05
+    registry.accounts.clear()
+
+    # The logging call alone, without the noise of the rest of the request
+    calls = {}
+    logger = route_logger("transfer")
+    for mode, (level, sample) in MODES.items():
+        configure_route("transfer", level, sample)
+        start = time.perf_counter()
+        for _ in range(TRANSFERS * 10):
+            logger.info("Transfer request for pesel: %s", "*******2345")
+        calls[mode] = (time.perf_counter() - start) / (TRANSFERS * 10)
+
+    print(f"\n{TRANSFERS} transfers per mode, best of {ROUNDS} rounds:")
+    for mode, elapsed in best.items():
+        print(f"  {mode:8}: {elapsed / TRANSFERS * 1e6:6.1f} us/request,"
+              f" logging call {calls[mode] * 1e6:5.2f} us")
+    assert calls["disabled"] < calls["full"]
@@ -0,0 +1,69 @@
+import os
+import statistics
+import time
+
+import pytest
+from pymongo import MongoClient
+
+import src.accounts_repository as repo_mod
+from src.account import Account
+
+REQUESTS = 50
+
+
+def mongo_url_or_skip():
+    url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    try:
+        client = MongoClient(url, serverSelectionTimeoutMS=2000)
+        client.admin.command('ping')
+        return client
+    except Exception as e:
+        pytest.skip(f"Mongo not available at {url}: {e}")
+
+
+def server_connections(admin_client):
+    return admin_client.admin.command('serverStatus')['connections']['current']
+
+
+def save_latencies(make_repo, accounts):
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        make_repo().save_all(accounts)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def test_shared_client_vs_client_per_request(monkeypatch):
+    admin_client = mongo_url_or_skip()
+    monkeypatch.setenv('MONGO_COLLECTION', 'perf_client_pool')
+    url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('MONGO_DB', 'bank_app')
+    accounts = [Account("Perf", "User", f"{i:011d}") for i in range(10)]
+    leaked = []
+
+    def repo_with_new_client():
+        # The behaviour before the shared client: one MongoClient per request
+        client = MongoClient(url)
+        leaked.append(client)
+        return repo_mod.MongoAccountsRepository(client[db_name]['perf_client_pool'])
+
+    baseline = server_connections(admin_client)
+    per_request = save_latencies(repo_with_new_client, accounts)
+    per_request_connections = server_connections(admin_client) - baseline
+    for client in leaked:
+        client.close()
+
+    repo_mod.close_mongo_client()
+    baseline = server_connections(admin_client)
+    shared = save_latencies(repo_mod.create_mongo_repo_from_env, accounts)
+    shared_connections = server_connections(admin_client) - baseline
+    repo_mod.close_mongo_client()
+    admin_client[db_name]['perf_client_pool'].drop()
+
+    print(f"\n{REQUESTS} saves:"
+          f"\n  client per request: median {statistics.median(per_request) * 1000:.1f} ms, "
+          f"+{per_request_connections} server connections"
+          f"\n  shared client:      median {statistics.median(shared) * 1000:.1f} ms, "
+          f"+{shared_connections} server connections")
+    assert shared_connections < per_request_connections
@@ -0,0 +1,66 @@
+import os
+import time
+
+from pymongo import MongoClient
+
+from src.account import Account
+from src.accounts_repository import MongoAccountsRepository, SqliteAccountsRepository
+
+ACCOUNTS = 100_000
+
+
+def make_accounts():
+    accounts = []
+    for i in range(ACCOUNTS):
+        account = Account.from_validated("Perf", "User", f"{i:011d}")
+        account.incoming_transfer(100)
+        account.outgoing_transfer(25)
+        accounts.append(account)
+    return accounts
+
+
+def mongo_collection_or_none():
+    url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    try:
+        client = MongoClient(url, serverSelectionTimeoutMS=2000)
+        client.admin.command('ping')
+    except Exception:
+        return None
+    collection = client[os.environ.get('MONGO_DB', 'bank_app')]['perf_backends']
+    collection.drop()
+    return collection
+
+
+def timed(action):
+    start = time.perf_counter()
+    result = action()
+    return result, time.perf_counter() - start
+
+
+def benchmark(repo):
+    accounts = make_accounts()
+    _, full_save = timed(lambda: repo.save_all(accounts))
+    for account in accounts[::100]:
+        account.incoming_transfer(10)
+    _, incremental_save = timed(lambda: repo.save_all(accounts))
+    loaded, load = timed(lambda: list(repo.load_all()))
+    assert len(loaded) == ACCOUNTS
+    assert sum(account.balance for account in loaded) == 75 * ACCOUNTS + 10 * len(accounts[::100])
+    return full_save, incremental_save, load
+
+
+def test_sqlite_against_mongo(tmp_path):
+    results = {"sqlite": benchmark(SqliteAccountsRepository(str(tmp_path / "perf.sqlite3")))}
+    collection = mongo_collection_or_none()
+    if collection is not None:
+        repo = MongoAccountsRepository(collection)
+        # Indexed like create_mongo_repo_from_env does, so upserts do not scan
+        repo.create_indexes()
+        results["mongo"] = benchmark(repo)
+        collection.drop()
+
+    print(f"\n{ACCOUNTS} accounts, 2 history entries each:")
+    for backend, (full_save, incremental_save, load) in results.items():
+        print(f"  {backend:6} full save {full_save:.2f}s, 1% dirty save {incremental_save:.2f}s, load {load:.2f}s")
+    if collection is None:
+        print("  mongo  not reachable, skipped")
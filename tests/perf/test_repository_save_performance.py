@@ -0,0 +1,78 @@
+import time
+
+from src.account import Account
+from src.accounts_repository import MongoAccountsRepository
+
+ACCOUNTS = 100_000
+
+
+class CountingCollection:
+    """In-memory stand-in for a Mongo collection that counts round-trips."""
+
+    def __init__(self):
+        self.docs = {}
+        self.round_trips = 0
+
+    def find(self, *args):
+        self.round_trips += 1
+        return list(self.docs.values())
+
+    def update_one(self, selector, update, upsert=False):
+        self.round_trips += 1
+        (field, value), = selector.items()
+        self.docs[(field, value)] = update["$set"]
+
+    def bulk_write(self, operations, ordered=True):
+        self.round_trips += 1
+        for operation in operations:
+            (field, value), = operation._filter.items()
+            self.docs[(field, value)] = operation._doc["$set"]
+
+    def delete_many(self, query):
+        self.round_trips += 1
+        if not query:
+            self.docs.clear()
+            return
+        (field, condition), = query.items()
+        for value in condition["$in"]:
+            self.docs.pop((field, value), None)
+
+
+def delete_and_upsert_each(collection, accounts):
+    # The save strategy used before dirty tracking
+    collection.delete_many({})
+    for account in accounts:
+        collection.update_one({"pesel": account.pesel}, {"$set": account.to_dict()}, upsert=True)
+
+
+def measure(save):
+    start = time.perf_counter()
+    save()
+    return time.perf_counter() - start
+
+
+def test_incremental_bulk_save_round_trips():
+    accounts = [Account("Perf", "User", f"{i:011d}") for i in range(ACCOUNTS)]
+
+    old_collection = CountingCollection()
+    old_time = measure(lambda: delete_and_upsert_each(old_collection, accounts))
+
+    new_collection = CountingCollection()
+    repo = MongoAccountsRepository(new_collection)
+    full_time = measure(lambda: repo.save_all(accounts))
+    full_trips = new_collection.round_trips
+
+    for account in accounts[::100]:
+        account.incoming_transfer(10)
+    new_collection.round_trips = 0
+    incremental_time = measure(lambda: repo.save_all(accounts))
+    incremental_trips = new_collection.round_trips
+
+    print(f"\n{ACCOUNTS} accounts, stand-in collection:"
+          f"\n  delete + update_one each: {old_collection.round_trips} round-trips, {old_time:.2f}s"
+          f"\n  bulk save (all dirty):    {full_trips} round-trips, {full_time:.2f}s"
+          f"\n  bulk save (1% dirty):     {incremental_trips} round-trips, {incremental_time:.2f}s")
+
+    assert len(new_collection.docs) == ACCOUNTS
+    assert full_trips * 100 < old_collection.round_trips
+    assert incremental_trips == 2
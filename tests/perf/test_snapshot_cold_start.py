@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+
+from src.account import Account
+from src.sharded_registry import ShardedAccountRegistry
+from src.snapshot import SnapshotFile, snapshot_columns, write_snapshot_file
+
+
+@pytest.mark.parametrize("count", [
+    100_000,
+    pytest.param(2_000_000, marks=pytest.mark.skipif(
+        not os.environ.get('BANK_APP_BENCH_FULL'), reason="set BANK_APP_BENCH_FULL=1 to run the 2M account benchmark")),
+])
+def test_snapshot_cold_start(tmp_path, count):
+    accounts = []
+    for i in range(count):
+        account = Account.from_validated("Perf", "User", f"{i:011d}")
+        account.incoming_transfer(100)
+        account.outgoing_transfer(25)
+        accounts.append(account)
+    docs = [account.to_dict() for account in accounts]
+    path = str(tmp_path / "snapshot.bin")
+    with open(path, 'wb') as file:
+        write_snapshot_file(file, (snapshot_columns(account) for account in accounts))
+    del accounts
+
+    # The load path before snapshots: hydrate every stored document up front
+    start = time.perf_counter()
+    registry = ShardedAccountRegistry()
+    registry.replace_accounts(Account.from_stored(doc) for doc in docs)
+    eager_time = time.perf_counter() - start
+    del registry, docs
+
+    start = time.perf_counter()
+    registry = ShardedAccountRegistry()
+    registry.load_snapshot(SnapshotFile(path))
+    first = registry.find_account_by_pesel(f"{count // 2:011d}")
+    cold_start_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, count, count // 1000):
+        registry.find_account_by_pesel(f"{i:011d}")
+    lookup_time = (time.perf_counter() - start) / 1000
+
+    print(f"\n{count} accounts, {os.path.getsize(path) / count:.0f} B/account on disk:"
+          f"\n  from_stored rebuild:         {eager_time:.2f}s"
+          f"\n  mmap + first lookup:         {cold_start_time * 1000:.1f} ms"
+          f"\n  first lookup of an account:  {lookup_time * 1e6:.0f} us")
+
+    assert first.balance == 75
+    assert registry.get_accounts_count() == count
+    assert cold_start_time < 1
@@ -33,6 +33,7 @@ class TestAccount:
         ("123456789112", "Invalid"),
         ("1234567891", "Invalid"),
         ("12345ABCDE1", "Invalid"),
+        ("١٢٣٤٥٦٧٨٩٠١", "Invalid"),
     ])
     def test_pesel_validation(self, pesel, expected):
         account = Account("John", "Doe", pesel)
@@ -173,7 +174,7 @@ class TestCompanyAccount:
         }
 
     @pytest.fixture
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def company(self, mock_get, mock_valid_nip_response):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -181,7 +182,7 @@ class TestCompanyAccount:
         mock_get.return_value = mock_response
         return Company_Account("Lockhead_Martin", "8461627563")
 
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_company_creation_valid_nip(self, mock_get, mock_valid_nip_response):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -193,7 +194,7 @@ class TestCompanyAccount:
         assert company.NIP == "8461627563"
         assert company.balance == 0
 
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_company_creation_invalid_nip_raises_error(self, mock_get, mock_invalid_nip_response):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -205,7 +206,7 @@ class TestCompanyAccount:
         
 
 
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_nip_validation_invalid_length_skips_api(self, mock_get):
         with pytest.raises(ValueError, match="Company not registered!!"):
             Company_Account("Test", "123")
@@ -435,7 +436,7 @@ class TestCompanyAccountNIPValidation:
     def mock_not_found_response(self):
         return {"result": None}
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_with_active_company(self, mock_get, mock_valid_nip_response):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -445,7 +446,7 @@ class TestCompanyAccountNIPValidation:
         company = Company_Account("Test", "8461627563")
         assert company.NIP == "8461627563"
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_with_inactive_company(self, mock_get, mock_invalid_nip_response):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -455,7 +456,7 @@ class TestCompanyAccountNIPValidation:
         with pytest.raises(ValueError, match="Company not registered!!"):
             Company_Account("Test", "1234567890")
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_not_found(self, mock_get, mock_not_found_response):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -465,14 +466,14 @@ class TestCompanyAccountNIPValidation:
         with pytest.raises(ValueError, match="Company not registered!!"):
             Company_Account("Test", "9999999999")
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_api_error(self, mock_get):
         mock_get.side_effect = Exception("API Error")
         
         with pytest.raises(ValueError, match="Company not registered!!"):
             Company_Account("Test", "8461627563")
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_404_response(self, mock_get):
         mock_response = Mock()
         mock_response.status_code = 404
@@ -481,7 +482,7 @@ class TestCompanyAccountNIPValidation:
         with pytest.raises(ValueError, match="Company not registered!!"):
             Company_Account("Test", "8461627563")
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_uses_env_url(self, mock_get, mock_valid_nip_response):
         os.environ['BANK_APP_MF_URL'] = 'https://wl-api.mf.gov.pl/'
         
@@ -497,7 +498,7 @@ class TestCompanyAccountNIPValidation:
         
         del os.environ['BANK_APP_MF_URL']
     
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def test_validate_nip_invalid_length_skips_validation(self, mock_get):
         # Te testy nadal będą rzucać błąd bo validate_nip zawsze jest wywoływane
         with pytest.raises(ValueError, match="Company not registered!!"):
@@ -510,7 +511,7 @@ class TestCompanyAccountNIPValidation:
 def test_company_validate_nip_handles_exception(monkeypatch):
     comp = Company_Account.__new__(Company_Account)
     import src.account as acc_mod
-    monkeypatch.setattr(acc_mod, 'requests', Mock(get=lambda *a, **k: (_ for _ in ()).throw(Exception('net'))))
+    monkeypatch.setattr('src.mf_client.requests.Session.get', lambda *a, **k: (_ for _ in ()).throw(Exception('net')))
 
     assert comp.validate_nip('0000000000') is False
 
@@ -567,7 +568,7 @@ def test_validate_nip_no_subject(monkeypatch):
         def json(self):
             return {'result': {}}
 
-    monkeypatch.setattr(accmod, 'requests', Mock(get=lambda url: Resp()))
+    monkeypatch.setattr('src.mf_client.requests.Session.get', lambda session, url, **kwargs: Resp())
     comp = Company_Account.__new__(Company_Account)
     assert comp.validate_nip('1234567890') is False
 
@@ -610,7 +611,7 @@ def test_import_fallback_and_validate_variants(monkeypatch):
     class Resp500:
         status_code = 500
 
-    monkeypatch.setattr(accmod, 'requests', Mock(get=lambda url: Resp500()))
+    monkeypatch.setattr('src.mf_client.requests.Session.get', lambda session, url, **kwargs: Resp500())
     comp = accmod.Company_Account.__new__(accmod.Company_Account)
     assert comp.validate_nip('0000000000') is False
 
@@ -619,7 +620,7 @@ def test_import_fallback_and_validate_variants(monkeypatch):
         def json(self):
             return {'result': None}
 
-    monkeypatch.setattr(accmod, 'requests', Mock(get=lambda url: RespNoResult()))
+    monkeypatch.setattr('src.mf_client.requests.Session.get', lambda session, url, **kwargs: RespNoResult())
     assert comp.validate_nip('0000000000') is False
 
 
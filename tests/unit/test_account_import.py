@@ -0,0 +1,49 @@
+import pytest
+
+from src.account import Account, AccountRegistry
+from src.account_import import prepare_accounts
+from src.sharded_registry import ShardedAccountRegistry
+
+
+class TestPrepareAccounts:
+    @pytest.mark.parametrize("pesel,promocode", [
+        ("65010112345", "PROM_123"),
+        ("55010112345", "PROM_123"),
+        ("05210112345", "PROM_123"),
+        ("05810112345", "PROM_123"),
+        ("65990112345", "PROM_123"),
+        ("65010112345", "PROM_1234"),
+        ("65010112345", None),
+    ])
+    def test_promotion_matches_constructor(self, pesel, promocode):
+        _, accounts, _ = prepare_accounts([{"name": "A", "surname": "B", "pesel": pesel, "promocode": promocode}])
+        expected = Account("A", "B", pesel, promocode)
+        assert accounts[0].balance == expected.balance
+        assert accounts[0].transaction_history == expected.transaction_history
+        assert accounts[0].to_dict() == expected.to_dict()
+
+    def test_invalid_rows(self):
+        rows = [None, {"name": "A", "surname": "B", "pesel": 12345678901}, {"name": "A", "surname": "B", "pesel": "1234567890a"},
+                {"name": "A", "surname": "B", "pesel": "١٢٣٤٥٦٧٨٩٠١"}]
+        results, accounts, positions = prepare_accounts(rows)
+        assert [result["status"] for result in results] == [400, 400, 400, 400]
+        assert accounts == [] and positions == []
+
+    def test_duplicates_within_batch(self):
+        rows = [{"name": "A", "surname": "B", "pesel": "65010112345"}] * 3
+        results, accounts, positions = prepare_accounts(rows)
+        assert results[0] is None
+        assert [result["status"] for result in results[1:]] == [409, 409]
+        assert positions == [0]
+
+
+class TestBulkInsert:
+    @pytest.mark.parametrize("registry", [AccountRegistry(), ShardedAccountRegistry(shard_count=4)])
+    def test_add_accounts_if_absent(self, registry):
+        registry.accounts.clear()
+        existing = Account("Old", "User", "00000000003")
+        registry.add_account(existing)
+        accounts = [Account("New", "User", f"{i:011d}") for i in range(6)]
+        added = registry.add_accounts_if_absent(accounts + ["not_an_account"])
+        assert added == [True, True, True, False, True, True, False]
+        assert registry.get_all_accounts() == [existing] + accounts[:3] + accounts[4:]
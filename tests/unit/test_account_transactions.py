@@ -42,6 +42,13 @@ class TestTransactions:
         account.outgoing_transfer(outgoing_amount)
         assert account.balance == expected_balance
     
+    @pytest.mark.parametrize("method", ["outgoing_transfer", "express_transfer"])
+    def test_nan_is_not_debited(self, account, method):
+        account.incoming_transfer(100)
+        assert getattr(account, method)(float("nan")) is False
+        assert account.balance == 100
+        assert account.transaction_history == [100]
+
     def test_balance_outgoing_with_added_money(self, account):
         account.balance += 100
         account.outgoing_transfer(70)
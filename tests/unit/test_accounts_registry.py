@@ -1,5 +1,5 @@
 import pytest
-from src.account import Account, Company_Account, AccountRegistry
+from src.account import Account, Company_Account, AccountRegistry, AccountStore, account_key
 
 class TestAccountRegistry:
     @pytest.fixture
@@ -139,3 +139,111 @@ class TestAccountRegistry:
         assert found == account1
         assert registry.get_accounts_count() == 2
     
+
+    def test_remove_account(self, registry, account1, account2):
+        registry.add_account(account1)
+        registry.add_account(account2)
+        assert registry.remove_account(account1) is True
+        assert registry.find_account_by_pesel("12345678911") is None
+        assert registry.get_all_accounts() == [account2]
+
+    def test_remove_account_not_in_registry(self, registry, account1, account2):
+        registry.add_account(account1)
+        assert registry.remove_account(account2) is False
+        assert registry.get_accounts_count() == 1
+
+    def test_remove_account_keeps_other_with_same_pesel(self, registry):
+        account1 = Account("John", "Doe", "12345678911")
+        account2 = Account("Jane", "Smith", "12345678911")
+        registry.add_account(account1)
+        registry.add_account(account2)
+        registry.remove_account(account1)
+        assert registry.find_account_by_pesel("12345678911") == account2
+
+    def test_iteration_order_preserved_after_remove(self, registry, account, account1, account2):
+        for acc in (account, account1, account2):
+            registry.add_account(acc)
+        registry.remove_account(account1)
+        registry.add_account(account1)
+        assert list(registry) == [account, account2, account1]
+        assert registry.accounts[-1] == account1
+
+    def test_accounts_clear_resets_index(self, registry, account1):
+        registry.add_account(account1)
+        registry.accounts.clear()
+        assert registry.find_account_by_pesel("12345678911") is None
+        assert registry.accounts == []
+
+
+class TestAccountStore:
+    def test_company_accounts_keyed_by_nip(self):
+        company = Company_Account.__new__(Company_Account)
+        company.NIP = "1234567890"
+        store = AccountStore([company])
+        assert account_key(company) == "1234567890"
+        assert store.first("1234567890") is company
+        assert company in store
+
+    def test_remove_missing_raises(self):
+        store = AccountStore()
+        with pytest.raises(ValueError):
+            store.remove(Account("John", "Doe", "12345678911"))
+
+    def test_accounts_page(self):
+        registry = AccountRegistry()
+        accounts = [Account("First", "Last", f"{i:011d}") for i in range(7)]
+        for acc in accounts:
+            registry.add_account(acc)
+        page, cursor = registry.get_accounts_page(limit=3)
+        assert page == accounts[:3]
+        page, cursor = registry.get_accounts_page(cursor, 3)
+        assert page == accounts[3:6]
+        page, cursor = registry.get_accounts_page(cursor, 3)
+        assert page == accounts[6:]
+        assert cursor is None
+
+    def test_iter_accounts_skips_removed(self):
+        registry = AccountRegistry()
+        accounts = [Account("First", "Last", f"{i:011d}") for i in range(10)]
+        for acc in accounts:
+            registry.add_account(acc)
+        for acc in accounts[:6]:
+            registry.remove_account(acc)
+        assert list(registry.iter_accounts(chunk_size=2)) == accounts[6:]
+        assert registry.accounts.page() == [(slot, acc) for slot, acc in zip(range(6, 10), accounts[6:])]
+
+    def test_replace_accounts(self):
+        registry = AccountRegistry()
+        registry.add_account(Account("Old", "User", "11111111111"))
+        new_accounts = [Account("New", "User", f"{i:011d}") for i in range(3)]
+        assert registry.replace_accounts(iter(new_accounts + ["not_an_account"])) == 3
+        assert registry.get_all_accounts() == new_accounts
+        assert registry.find_account_by_pesel("11111111111") is None
+
+    def test_export_in_chunks(self):
+        registry = AccountRegistry()
+        accounts = [Account("First", "Last", f"{i:011d}") for i in range(5)]
+        for acc in accounts:
+            registry.add_account(acc)
+        assert list(registry.export(lambda acc: acc.pesel, chunk_size=2)) == [acc.pesel for acc in accounts]
+
+    def test_add_accounts_if_absent_reports_added(self):
+        registry = AccountRegistry()
+        existing = Account("Old", "User", "11111111111")
+        registry.add_account(existing)
+        added = []
+        new = Account("New", "User", "22222222222")
+        assert registry.add_accounts_if_absent([existing, new], added.append) == [False, True]
+        assert added == [new]
+
+    def test_store_insert_keeps_slot_order(self):
+        store = AccountStore()
+        accounts = [Account("First", "Last", f"{i:011d}") for i in range(3)]
+        store.insert(5, accounts[0])
+        store.insert(2, accounts[1])
+        store.insert(7, accounts[2])
+        assert store.copy() == [accounts[1], accounts[0], accounts[2]]
+        assert store.slot_items() == [(2, accounts[1]), (5, accounts[0]), (7, accounts[2])]
+        store.clear()
+        store.append(accounts[0])
+        assert store.slot_items() == [(0, accounts[0])]
@@ -1,9 +1,13 @@
+import sqlite3
 from unittest import mock
 import types
+import pymongo.errors
 import pytest
+from pymongo import UpdateOne
 
-from src.accounts_repository import MongoAccountsRepository
+from src.accounts_repository import LOAD_PROJECTION, MongoAccountsRepository
 from src.account import Account, Company_Account
+from src.history_codec import decode_history, encode_history
 
 
 def test_save_all_calls_collection_methods():
@@ -11,12 +15,16 @@ def test_save_all_calls_collection_methods():
     acc2 = Account('Anna', 'Nowak', '22222222222')
 
     mock_collection = mock.Mock()
+    mock_collection.find.return_value = []
     repo = MongoAccountsRepository(mock_collection)
 
     repo.save_all([acc1, acc2])
 
-    mock_collection.delete_many.assert_called_once_with({})
-    assert mock_collection.update_one.call_count == 2
+    mock_collection.delete_many.assert_not_called()
+    mock_collection.bulk_write.assert_called_once()
+    operations = mock_collection.bulk_write.call_args[0][0]
+    assert len(operations) == 2
+    assert mock_collection.bulk_write.call_args[1] == {"ordered": False}
 
 
 def test_load_all_returns_accounts():
@@ -29,7 +37,7 @@ def test_load_all_returns_accounts():
     mock_collection.find.return_value = [d1, d2]
 
     repo = MongoAccountsRepository(mock_collection)
-    loaded = repo.load_all()
+    loaded = list(repo.load_all())
 
     assert len(loaded) == 2
     assert loaded[0].pesel == d1['pesel']
@@ -42,13 +50,17 @@ def test_accounts_repository_abstract_methods_raise():
         r.save_all([])
     with pytest.raises(NotImplementedError):
         r.load_all()
+    for method, args in ((r.find, ('1',)), (r.save, ([],)), (r.delete, ('1',)), (r.count, ())):
+        with pytest.raises(NotImplementedError):
+            method(*args)
 
 
 def test_create_mongo_repo_from_env_monkeypatch(monkeypatch):
     import src.accounts_repository as repo_mod
 
     class DummyCollection:
-        pass
+        def create_index(self, keys, **options):
+            pass
 
     class DummyDB(dict):
         def __getitem__(self, name):
@@ -60,7 +72,9 @@ def test_create_mongo_repo_from_env_monkeypatch(monkeypatch):
         def __getitem__(self, name):
             return DummyDB()
 
-    monkeypatch.setattr(repo_mod, 'pymongo', types.SimpleNamespace(MongoClient=lambda url: DummyClient(url)))
+    monkeypatch.setattr(repo_mod, 'pymongo', types.SimpleNamespace(MongoClient=lambda url, **options: DummyClient(url)))
+    monkeypatch.setattr(repo_mod, '_client', None)
+    monkeypatch.setattr(repo_mod, '_client_key', None)
 
     repo = repo_mod.create_mongo_repo_from_env()
     assert isinstance(repo, MongoAccountsRepository)
@@ -74,17 +88,18 @@ def test_save_all_company_selector():
     comp = Company_Account.__new__(Company_Account)
     comp.company_name = 'C'
     comp.NIP = '1234567890'
-    def to_dict():
-        return {"company_name": comp.company_name, "NIP": comp.NIP, "balance": 0, "transaction_history": []}
-    comp.to_dict = to_dict
+    comp.balance = 0
+    comp.transaction_history = []
 
+    mock_collection.find.return_value = []
     repo = MongoAccountsRepository(mock_collection)
     repo.save_all([comp])
 
-    mock_collection.delete_many.assert_called_once_with({})
-    mock_collection.update_one.assert_called_once()
-    args, kwargs = mock_collection.update_one.call_args
-    assert args[0] == {"NIP": comp.NIP}
+    mock_collection.delete_many.assert_not_called()
+    operations = mock_collection.bulk_write.call_args[0][0]
+    assert operations == [UpdateOne({"NIP": comp.NIP},
+                                    {"$set": {**comp.to_dict(include_history=False), "encoded_history": b""},
+                                     "$unset": {"transaction_history": ""}}, upsert=True)]
 
 
 def test_load_all_calls_from_dicts(monkeypatch):
@@ -96,9 +111,590 @@ def test_load_all_calls_from_dicts(monkeypatch):
     mock_collection.find.return_value = docs
 
     import src.accounts_repository as ar
-    monkeypatch.setattr(ar, 'Account', mock.Mock(from_dict=lambda d: 'acc_obj'))
-    monkeypatch.setattr(ar, 'Company_Account', mock.Mock(from_dict=lambda d: 'comp_obj'))
+    monkeypatch.setattr(ar, 'Account', mock.Mock(from_stored=lambda d: 'acc_obj'))
+    monkeypatch.setattr(ar, 'Company_Account', mock.Mock(from_stored=lambda d: 'comp_obj'))
 
     repo = MongoAccountsRepository(mock_collection)
-    loaded = repo.load_all()
+    loaded = list(repo.load_all())
     assert loaded == ['acc_obj', 'comp_obj']
+
+
+def test_load_all_streams_with_batch_size_and_projection(monkeypatch):
+    mock_collection = mock.Mock()
+    mock_collection.find.return_value = iter([
+        {"pesel": "11111111111", "first_name": "A", "last_name": "B", "balance": 70, "transaction_history": [100, -30]},
+        {"NIP": "1234567890", "company_name": "Co", "balance": 5, "transaction_history": [5]},
+    ])
+    network = mock.Mock(side_effect=AssertionError("no MF lookups while loading"))
+    monkeypatch.setattr(Company_Account, 'validate_nip', network)
+
+    repo = MongoAccountsRepository(mock_collection, batch_size=250)
+    loaded = repo.load_all()
+    assert not isinstance(loaded, list)
+    account, company = list(loaded)
+
+    args, kwargs = mock_collection.find.call_args
+    assert args == ({}, LOAD_PROJECTION)
+    assert kwargs == {"batch_size": 250}
+    assert account.to_dict() == {"first_name": "A", "last_name": "B", "pesel": "11111111111",
+                                 "balance": 70, "transaction_history": [100, -30]}
+    assert account.fee == 1 and not account.is_dirty
+    assert company.to_dict() == {"company_name": "Co", "NIP": "1234567890", "balance": 5, "transaction_history": [5]}
+    assert company.fee == 5 and not company.is_dirty
+
+
+class TestSharedMongoClient:
+    class RecordingClient:
+        created = []
+
+        def __init__(self, url, **options):
+            self.url = url
+            self.options = options
+            self.closed = False
+            self.created.append(self)
+
+        def close(self):
+            self.closed = True
+
+        def __getitem__(self, name):
+            return mock.MagicMock()
+
+    @pytest.fixture
+    def repo_mod(self, monkeypatch):
+        import src.accounts_repository as repo_mod
+        self.RecordingClient.created = []
+        monkeypatch.setattr(repo_mod.pymongo, 'MongoClient', self.RecordingClient)
+        monkeypatch.setattr(repo_mod, '_client', None)
+        monkeypatch.setattr(repo_mod, '_client_key', None)
+        monkeypatch.setattr(repo_mod, '_indexed', set())
+        return repo_mod
+
+    def test_client_is_shared_between_repositories(self, repo_mod):
+        repo_mod.create_mongo_repo_from_env()
+        repo_mod.create_mongo_repo_from_env()
+        assert len(self.RecordingClient.created) == 1
+
+    def test_indexes_are_created_once_per_client(self, repo_mod, monkeypatch):
+        create_indexes = mock.Mock()
+        monkeypatch.setattr(repo_mod.MongoAccountsRepository, 'create_indexes', create_indexes)
+        repo_mod.create_mongo_repo_from_env()
+        repo_mod.create_mongo_repo_from_env()
+        assert create_indexes.call_count == 1
+        monkeypatch.setenv('MONGO_COLLECTION', 'other')
+        repo_mod.create_mongo_repo_from_env()
+        assert create_indexes.call_count == 2
+        monkeypatch.setenv('MONGO_URL', 'mongodb://other:27017')
+        repo_mod.create_mongo_repo_from_env()
+        assert create_indexes.call_count == 3
+        repo_mod.close_mongo_client()
+        assert not repo_mod._indexed
+
+    def test_client_options_from_env(self, repo_mod, monkeypatch):
+        monkeypatch.setenv('MONGO_MAX_POOL_SIZE', '7')
+        monkeypatch.setenv('MONGO_SOCKET_TIMEOUT_MS', '1500')
+        monkeypatch.setenv('MONGO_WRITE_CONCERN', 'majority')
+        client = repo_mod.get_mongo_client()
+        assert client.options["maxPoolSize"] == 7
+        assert client.options["socketTimeoutMS"] == 1500
+        assert client.options["w"] == "majority"
+
+    def test_new_client_after_fork(self, repo_mod, monkeypatch):
+        parent_client = repo_mod.get_mongo_client()
+        monkeypatch.setattr(repo_mod.os, 'getpid', lambda: -1)
+        child_client = repo_mod.get_mongo_client()
+        assert child_client is not parent_client
+        assert parent_client.closed is False
+        repo_mod.close_mongo_client()
+        assert child_client.closed is True
+
+    def test_new_client_when_url_changes(self, repo_mod, monkeypatch):
+        first = repo_mod.get_mongo_client()
+        monkeypatch.setenv('MONGO_URL', 'mongodb://other:27017')
+        second = repo_mod.get_mongo_client()
+        assert first.closed is True
+        assert second.url == 'mongodb://other:27017'
+
+    def test_close_without_client(self, repo_mod):
+        repo_mod.close_mongo_client()
+        assert repo_mod._client is None
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = {self._key(doc): dict(doc) for doc in docs}
+        self.calls = []
+
+    @staticmethod
+    def _key(doc):
+        return ("pesel", doc["pesel"]) if "pesel" in doc else ("NIP", doc["NIP"])
+
+    def find(self, *args):
+        self.calls.append("find")
+        return [dict(doc) for doc in self.docs.values()]
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append("bulk_write")
+        for operation in operations:
+            (field, value), = operation._filter.items()
+            self.docs[(field, value)] = dict(operation._doc["$set"])
+
+    def delete_many(self, query):
+        self.calls.append("delete_many")
+        (field, condition), = query.items()
+        for value in condition["$in"]:
+            self.docs.pop((field, value), None)
+
+
+class TestIncrementalSave:
+    def test_only_changed_accounts_are_written(self):
+        collection = FakeCollection()
+        repo = MongoAccountsRepository(collection)
+        accounts = [Account('A', 'B', f"{i:011d}") for i in range(5)]
+        assert repo.save_all(accounts) == {"written": 5, "deleted": 0}
+        assert not any(acc.is_dirty for acc in accounts)
+
+        accounts[2].incoming_transfer(100)
+        assert repo.save_all(accounts) == {"written": 1, "deleted": 0}
+        assert collection.docs[("pesel", accounts[2].pesel)]["balance"] == 100
+        assert repo.save_all(accounts) == {"written": 0, "deleted": 0}
+
+    def test_removed_accounts_are_deleted(self):
+        collection = FakeCollection([
+            {"pesel": "11111111111", "balance": 0},
+            {"pesel": "22222222222", "balance": 0},
+            {"NIP": "1234567890", "balance": 0},
+        ])
+        repo = MongoAccountsRepository(collection, batch_size=1)
+        kept = Account.from_dict({"pesel": "11111111111", "first_name": "A", "last_name": "B"})
+        assert repo.save_all([kept]) == {"written": 0, "deleted": 2}
+        assert list(collection.docs) == [("pesel", "11111111111")]
+
+    def test_clean_accounts_missing_from_collection_are_written(self):
+        collection = FakeCollection()
+        repo = MongoAccountsRepository(collection, batch_size=2)
+        accounts = [Account.from_dict({"pesel": f"{i:011d}", "first_name": "A", "last_name": "B"}) for i in range(3)]
+        assert not accounts[0].is_dirty
+        assert repo.save_all(accounts) == {"written": 3, "deleted": 0}
+        assert collection.calls == ["find", "bulk_write", "bulk_write"]
+
+
+
+class TestSqliteAccountsRepository:
+    @pytest.fixture
+    def repo(self, tmp_path):
+        from src.accounts_repository import SqliteAccountsRepository
+        repo = SqliteAccountsRepository(str(tmp_path / "bank.sqlite3"), batch_size=2)
+        yield repo
+        repo.close()
+
+    @staticmethod
+    def company(nip, balance=0, history=()):
+        return Company_Account.from_stored({"company_name": "Co", "NIP": nip, "balance": balance,
+                                            "transaction_history": list(history)})
+
+    def test_round_trip(self, repo):
+        person = Account('Jan', 'Kowalski', '11111111111')
+        person.incoming_transfer(100)
+        person.outgoing_transfer(12.5)
+        accounts = [person, Account('Anna', 'Nowak', '22222222222'), self.company('1234567890', 5, [5])]
+        assert repo.save_all(accounts) == {"written": 3, "deleted": 0}
+        assert not person.is_dirty
+
+        loaded = list(repo.load_all())
+        assert [account.to_dict() for account in loaded] == [account.to_dict() for account in accounts]
+        assert loaded[2].fee == 5 and not loaded[0].is_dirty
+
+    def test_wal_mode_and_unique_indexes(self, repo):
+        assert repo._connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        repo.save_all([Account('Jan', 'Kowalski', '11111111111')])
+        with pytest.raises(sqlite3.IntegrityError):
+            repo._connection.execute("INSERT INTO accounts (pesel) VALUES ('11111111111')")
+
+    def test_incremental_save(self, repo):
+        accounts = [Account('Jan', 'Kowalski', f'{i:011d}') for i in range(5)]
+        repo.save_all(accounts)
+        accounts[1].incoming_transfer(10)
+        accounts[1].incoming_transfer(20)
+        assert repo.save_all(accounts[:4]) == {"written": 1, "deleted": 1}
+        assert repo.save_all(accounts[:4]) == {"written": 0, "deleted": 0}
+        loaded = {account.pesel: account for account in repo.load_all()}
+        assert sorted(loaded) == [f'{i:011d}' for i in range(4)]
+        assert loaded['00000000001'].transaction_history == [10, 20]
+        assert repo._connection.execute("SELECT COUNT(*) FROM history").fetchone() == (2,)
+
+    def test_shorter_history_is_rewritten(self, repo):
+        account = Account('Jan', 'Kowalski', '11111111111')
+        account.transaction_history = [1, 2, 3]
+        repo.save_all([account])
+        account.transaction_history = [7]
+        repo.save_all([account])
+        loaded, = repo.load_all()
+        assert loaded.transaction_history == [7]
+
+    def test_deleted_company_drops_its_history(self, repo):
+        repo.save_all([self.company('1234567890', 5, [5, 6])])
+        assert repo.save_all([]) == {"written": 0, "deleted": 1}
+        assert list(repo.load_all()) == []
+        assert repo._connection.execute("SELECT COUNT(*) FROM history").fetchone() == (0,)
+
+    def test_history_rows_without_account_are_skipped(self, repo):
+        repo.save_all([Account('Jan', 'Kowalski', '11111111111')])
+        repo._connection.execute("PRAGMA foreign_keys=OFF")
+        repo._connection.execute("INSERT INTO history VALUES (0, 0, 99)")
+        loaded, = repo.load_all()
+        assert loaded.transaction_history == []
+
+
+    def test_single_account_access(self, repo):
+        person = Account('Jan', 'Kowalski', '11111111111')
+        person.incoming_transfer(100)
+        repo.save_all([person, self.company('1234567890', 5, [5])])
+        assert repo.count() == 2
+        assert repo.find('11111111111').to_dict() == person.to_dict()
+        assert repo.find('1234567890').fee == 5
+        assert repo.find('99999999999') is None
+
+        person.outgoing_transfer(30)
+        other = Account('Anna', 'Nowak', '22222222222')
+        repo.save([person, other])
+        assert not person.is_dirty and not other.is_dirty
+        assert repo.find('11111111111').transaction_history == [100, -30]
+        assert repo.count() == 3
+
+        repo.delete('11111111111')
+        assert repo.find('11111111111') is None
+        assert repo._connection.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 1
+        assert repo.count() == 2
+
+    def test_count_scans_once_and_follows_writes(self, tmp_path):
+        from src.accounts_repository import SqliteAccountsRepository
+        path = str(tmp_path / "bank.sqlite3")
+        first = SqliteAccountsRepository(path)
+        first.save_all([Account('Jan', 'Kowalski', '11111111111'), self.company('1234567890', 5, [5])])
+        first.close()
+
+        repo = SqliteAccountsRepository(path)
+        repo.save([Account('Anna', 'Nowak', '22222222222')])
+        repo.delete('11111111111')
+        statements = []
+        repo._connection.set_trace_callback(statements.append)
+        assert repo.count() == 2
+        repo.save([Account('Jan', 'Kowalski', '11111111111'), Account('Anna', 'Nowak', '22222222222')])
+        repo.delete('99999999999')
+        repo.delete('1234567890')
+        assert repo.count() == 2
+        assert [s for s in statements if "COUNT(*)" in s] == ["SELECT COUNT(*) FROM accounts"]
+        repo.close()
+
+
+class TestRepositoryFromEnv:
+    def test_sqlite_backend(self, tmp_path, monkeypatch):
+        import src.accounts_repository as repo_mod
+        monkeypatch.setenv('BANK_APP_REPOSITORY', 'sqlite')
+        monkeypatch.setenv('BANK_APP_SQLITE_PATH', str(tmp_path / "env.sqlite3"))
+        repo = repo_mod.create_repo_from_env()
+        assert isinstance(repo, repo_mod.SqliteAccountsRepository)
+        repo.close()
+
+    def test_mongo_is_the_default(self, monkeypatch):
+        import src.accounts_repository as repo_mod
+        monkeypatch.delenv('BANK_APP_REPOSITORY', raising=False)
+        monkeypatch.setattr(repo_mod, 'create_mongo_repo_from_env', lambda: 'mongo repo')
+        assert repo_mod.create_repo_from_env() == 'mongo repo'
+
+    def test_unknown_backend(self, monkeypatch):
+        import src.accounts_repository as repo_mod
+        monkeypatch.setenv('BANK_APP_REPOSITORY', 'postgres')
+        with pytest.raises(ValueError):
+            repo_mod.create_repo_from_env()
+
+    def test_repository_cache(self, monkeypatch):
+        import src.accounts_repository as repo_mod
+        registry = mock.Mock()
+        monkeypatch.delenv('BANK_APP_CACHE_SIZE', raising=False)
+        assert repo_mod.use_repository_cache_from_env(registry) is None
+        registry.use_repository.assert_not_called()
+
+        monkeypatch.setenv('BANK_APP_CACHE_SIZE', '5000')
+        monkeypatch.setattr(repo_mod, 'create_repo_from_env', lambda: 'repo')
+        assert repo_mod.use_repository_cache_from_env(registry) == 'repo'
+        registry.use_repository.assert_called_once_with('repo', 5000)
+
+
+class FakeMongoCollection:
+    """Just enough of a Mongo collection for bucketed history saves."""
+
+    def __init__(self):
+        self.docs = []
+        self.unique = None
+        self.indexes = []
+        self.calls = []
+
+    def create_index(self, keys, unique=False, sparse=False):
+        self.indexes.append(tuple(field for field, _ in keys))
+        if unique:
+            self.unique = tuple(field for field, _ in keys)
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, condition in query.items():
+            if field == "$or":
+                if not any(FakeMongoCollection._matches(doc, option) for option in condition):
+                    return False
+            elif isinstance(condition, dict):
+                if doc.get(field) not in condition["$in"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, query, projection=None, batch_size=None, sort=None):
+        self.calls.append(("find", query))
+        docs = [dict(doc) for doc in self.docs if self._matches(doc, query)]
+        if sort:
+            (field, _), = sort
+            docs.sort(key=lambda doc: doc[field])
+        return docs
+
+    def find_one(self, query, projection=None):
+        self.calls.append(("find_one", query))
+        return next(iter(self.find(query)), None)
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def _apply(self, doc, update):
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        for field, push in update.get("$push", {}).items():
+            doc.setdefault(field, []).extend(push["$each"])
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append(("bulk_write", len(operations)))
+        errors = []
+        for index, operation in enumerate(operations):
+            matched = [doc for doc in self.docs if self._matches(doc, operation._filter)]
+            if matched:
+                self._apply(matched[0], operation._doc)
+                continue
+            doc = dict(operation._filter)
+            if self.unique and any(all(other.get(f) == doc.get(f) for f in self.unique) for other in self.docs):
+                errors.append({"index": index, "code": 11000})
+                continue
+            self._apply(doc, operation._doc)
+            self.docs.append(doc)
+        if errors:
+            raise pymongo.errors.BulkWriteError({"writeErrors": errors})
+
+    def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        self.docs = [doc for doc in self.docs if not self._matches(doc, query)]
+
+
+class TestBucketedHistory:
+    @pytest.fixture
+    def collections(self):
+        return FakeMongoCollection(), FakeMongoCollection()
+
+    @pytest.fixture
+    def repo(self, collections):
+        accounts, history = collections
+        repo = MongoAccountsRepository(accounts, batch_size=2, history_collection=history, bucket_size=10)
+        repo.create_indexes()
+        return repo
+
+    @staticmethod
+    def entries(bucket):
+        return [entry for chunk in bucket["chunks"] for entry in decode_history(chunk)]
+
+    @staticmethod
+    def account_with_history(pesel, entries):
+        account = Account('Jan', 'Kowalski', pesel)
+        for amount in entries:
+            account.incoming_transfer(amount)
+        return account
+
+    def test_history_is_stored_in_buckets(self, repo, collections):
+        accounts, history = collections
+        account = self.account_with_history('11111111111', range(1, 26))
+        repo.save_all([account])
+
+        doc, = accounts.docs
+        assert "transaction_history" not in doc
+        assert doc["history_length"] == 25
+        assert doc["history_recent"] == [21, 22, 23, 24, 25]
+        assert [(bucket["bucket"], bucket["count"]) for bucket in history.docs] == [(0, 10), (1, 10), (2, 5)]
+        assert history.unique == ("owner", "bucket")
+        assert accounts.indexes == [("pesel",), ("NIP",)]
+
+    def test_load_fetches_history_lazily(self, repo, collections):
+        _, history = collections
+        repo.save_all([self.account_with_history('11111111111', range(1, 26))])
+        history.calls.clear()
+
+        loaded, = repo.load_all()
+        assert loaded.balance == sum(range(1, 26))
+        assert len(loaded.transaction_history) == 25
+        assert loaded.submit_for_loan(10)
+        assert loaded.transaction_history[-1] == 10
+        assert history.calls == []
+
+        assert loaded.transaction_history[:3] == [1, 2, 3]
+        assert history.calls == [("find", {"owner": '11111111111'})]
+
+    def test_saves_append_only_new_entries(self, repo, collections):
+        _, history = collections
+        repo.save_all([self.account_with_history('11111111111', range(1, 9))])
+        loaded, = repo.load_all()
+        for amount in (100, 200, 300):
+            loaded.incoming_transfer(amount)
+        history.calls.clear()
+        repo.save_all([loaded])
+
+        assert history.calls == [("bulk_write", 2)]
+        assert [self.entries(bucket) for bucket in history.docs] == [list(range(1, 9)) + [100, 200], [300]]
+        assert [len(bucket["chunks"]) for bucket in history.docs] == [2, 1]
+        assert not loaded.transaction_history.loaded
+
+    def test_history_read_after_a_save_has_each_entry_once(self, repo, collections):
+        _, history = collections
+        repo.save_all([self.account_with_history('11111111111', range(1, 9))])
+        loaded, = repo.load_all()
+        for amount in (100, 200, 300):
+            loaded.incoming_transfer(amount)
+        saved = loaded.detached_copy()
+        repo.save_all([saved])
+
+        expected = list(range(1, 9)) + [100, 200, 300]
+        for account in (loaded, saved):
+            assert len(account.transaction_history) == 11
+            assert list(account.transaction_history) == expected
+            assert sum(account.transaction_history) == account.balance
+        loaded.mark_dirty()
+        repo.save_all([loaded])
+        reloaded, = repo.load_all()
+        assert list(reloaded.transaction_history) == expected
+        assert [self.entries(bucket) for bucket in history.docs] == [expected[:10], expected[10:]]
+
+    def test_renamed_account_writes_no_history(self, repo, collections):
+        _, history = collections
+        account = self.account_with_history('11111111111', [1, 2])
+        repo.save_all([account])
+        account.first_name = "Janusz"
+        account.mark_dirty()
+        history.calls.clear()
+        assert repo.save_all([account]) == {"written": 1, "deleted": 0}
+        assert history.calls == []
+
+    def test_repeated_append_is_not_duplicated(self, repo, collections):
+        _, history = collections
+        account = self.account_with_history('11111111111', range(1, 4))
+        chunk = [(("pesel", account.pesel), account)]
+        repo._save_histories(chunk, {})
+        repo._save_histories(chunk, {})
+        assert self.entries(history.docs[0]) == [1, 2, 3]
+
+    def test_entries_after_a_failed_account_write_are_kept(self, repo, collections):
+        accounts, history = collections
+        account = self.account_with_history('11111111111', range(1, 9))
+        with mock.patch.object(accounts, 'bulk_write', side_effect=pymongo.errors.AutoReconnect("primary stepped down")):
+            with pytest.raises(pymongo.errors.AutoReconnect):
+                repo.save_all([account])
+        for amount in (100, 200, 300):
+            account.incoming_transfer(amount)
+        repo.save_all([account])
+
+        expected = list(range(1, 9)) + [100, 200, 300]
+        assert [self.entries(bucket) for bucket in history.docs] == [expected[:10], expected[10:]]
+        reloaded, = repo.load_all()
+        assert list(reloaded.transaction_history) == expected
+        assert sum(reloaded.transaction_history) == reloaded.balance
+
+    def test_other_write_errors_are_raised(self, repo, collections):
+        _, history = collections
+        history.bulk_write = mock.Mock(side_effect=pymongo.errors.BulkWriteError({"writeErrors": [{"code": 121}]}))
+        with pytest.raises(pymongo.errors.BulkWriteError):
+            repo.save_all([self.account_with_history('11111111111', [1])])
+
+    def test_shorter_history_is_rewritten(self, repo, collections):
+        _, history = collections
+        account = self.account_with_history('11111111111', range(1, 15))
+        repo.save_all([account])
+        account.transaction_history = [7]
+        repo.save_all([account])
+        assert [self.entries(bucket) for bucket in history.docs] == [[7]]
+
+    def test_removed_accounts_lose_their_buckets(self, repo, collections):
+        accounts, history = collections
+        repo.save_all([self.account_with_history('11111111111', [1, 2])])
+        assert repo.save_all([]) == {"written": 0, "deleted": 1}
+        assert accounts.docs == [] and history.docs == []
+
+    def test_embedded_history_is_moved_to_buckets(self, repo, collections):
+        accounts, history = collections
+        accounts.docs.append({"pesel": "11111111111", "first_name": "A", "last_name": "B",
+                              "balance": 3, "transaction_history": [1, 2]})
+        loaded, = repo.load_all()
+        assert loaded.transaction_history == [1, 2]
+        loaded.incoming_transfer(5)
+        repo.save_all([loaded])
+        assert "transaction_history" not in accounts.docs[0]
+        assert self.entries(history.docs[0]) == [1, 2, 5]
+
+    def test_plain_bucket_entries_still_load(self, repo, collections):
+        accounts, history = collections
+        accounts.docs.append({"pesel": "11111111111", "first_name": "A", "last_name": "B", "balance": 6,
+                              "history_length": 3, "history_recent": [1, 2, 3],
+                              "positive_streak": 3, "zus_payments": 0})
+        history.docs.append({"owner": "11111111111", "bucket": 0, "count": 3, "entries": [1, 2],
+                             "chunks": [encode_history([3])]})
+        loaded, = repo.load_all()
+        assert list(loaded.transaction_history) == [1, 2, 3]
+
+    def test_embedded_history_is_encoded(self):
+        accounts = FakeMongoCollection()
+        repo = MongoAccountsRepository(accounts)
+        account = self.account_with_history('11111111111', [100, 10.25])
+        account.express_transfer(50)
+        repo.save_all([account])
+
+        doc, = accounts.docs
+        assert "transaction_history" not in doc
+        assert decode_history(doc["encoded_history"]) == [100, 10.25, -50, -1]
+        loaded, = repo.load_all()
+        assert loaded.to_dict() == account.to_dict()
+        assert not loaded.is_dirty
+
+    def test_single_account_access(self, repo, collections):
+        accounts, history = collections
+        account = self.account_with_history('11111111111', range(1, 15))
+        repo.save_all([account, self.account_with_history('22222222222', [1])])
+        assert repo.count() == 2
+
+        found = repo.find('11111111111')
+        assert found.balance == sum(range(1, 15)) and not found.transaction_history.loaded
+        assert repo.find('33333333333') is None
+
+        found.incoming_transfer(100)
+        history.calls.clear()
+        repo.save([found])
+        assert history.calls == [("bulk_write", 1)]
+        assert self.entries(history.docs[1]) == [11, 12, 13, 14, 100]
+        assert not found.is_dirty
+
+        repo.delete('11111111111')
+        assert repo.find('11111111111') is None
+        assert [doc["owner"] for doc in history.docs] == ['22222222222']
+        assert repo.count() == 1
+        repo.save([])
+
+    def test_env_repository_uses_history_collection(self, monkeypatch):
+        import src.accounts_repository as repo_mod
+        monkeypatch.setattr(repo_mod, 'get_mongo_client', lambda: {"bank_app": {"accounts": "a", "accounts_history": "h"}})
+        monkeypatch.delenv('MONGO_DB', raising=False)
+        monkeypatch.delenv('MONGO_COLLECTION', raising=False)
+        repo = repo_mod.create_mongo_repo_from_env()
+        assert (repo._collection, repo._history) == ("a", "h")
@@ -0,0 +1,177 @@
+import pytest
+
+from src.account import Account, Company_Account
+from src.history import CompactHistory, LazyHistory, from_minor, to_minor
+from src.operations import Transfer_operations
+
+
+class TestCompactHistory:
+    @pytest.fixture
+    def history(self):
+        return CompactHistory([100, -30, 12.5, -1775, 50])
+
+    @pytest.mark.parametrize("amount,minor", [
+        (100, 10000),
+        (-1775, -177500),
+        (12.5, 1250),
+        (0.1, 10),
+        (0.005, 0),
+    ])
+    def test_to_minor(self, amount, minor):
+        assert to_minor(amount) == minor
+
+    def test_from_minor_keeps_whole_amounts_as_int(self):
+        assert from_minor(10000) == 100
+        assert isinstance(from_minor(10000), int)
+        assert from_minor(1250) == 12.5
+
+    def test_append_and_len(self, history):
+        history.append(20)
+        assert len(history) == 6
+        assert history[-1] == 20
+
+    def test_indexing_and_slicing(self, history):
+        assert history[0] == 100
+        assert history[-2] == -1775
+        assert history[-3:] == [12.5, -1775, 50]
+        assert history[-5:] == [100, -30, 12.5, -1775, 50]
+
+    def test_contains(self, history):
+        assert -1775 in history
+        assert 1775 not in history
+
+    def test_list_conversion_and_equality(self, history):
+        assert list(history) == [100, -30, 12.5, -1775, 50]
+        assert history == [100, -30, 12.5, -1775, 50]
+        assert history == CompactHistory([100, -30, 12.5, -1775, 50])
+        assert history != "not a history"
+        assert repr(CompactHistory([1, -2])) == "[1, -2]"
+
+    def test_total_has_no_float_drift(self):
+        history = CompactHistory()
+        for _ in range(10000):
+            history.append(0.1)
+        assert history.total() == 1000
+        assert sum(0.1 for _ in range(10000)) != 1000
+
+
+class TestAccountsWithCompactHistory:
+    @pytest.fixture(autouse=True)
+    def compact_history(self, monkeypatch):
+        monkeypatch.setattr(Transfer_operations, 'history_factory', CompactHistory)
+
+    def test_transfers_and_loan(self):
+        account = Account("Jane", "Smith", "85020212345", promocode="PROM_456")
+        assert isinstance(account.transaction_history, CompactHistory)
+        account.incoming_transfer(100)
+        account.incoming_transfer(200)
+        assert account.submit_for_loan(500) is True
+        account.outgoing_transfer(50)
+        account.express_transfer(10)
+        assert account.to_dict()["transaction_history"] == [50, 100, 200, 500, -50, -10, -1]
+
+    def test_balance_is_kept_in_grosze_like_the_history(self):
+        account = Account("Jane", "Smith", "85020212345")
+        for _ in range(10):
+            assert account.incoming_transfer(0.1) is True
+        assert account.balance == 1
+        assert account.outgoing_transfer(0.3) is True
+        assert account.express_transfer(0.006) is True
+        assert account.transaction_history[-2:] == [-0.01, -1]
+        assert account.balance == account.transaction_history.total() == -0.31
+
+    def test_amounts_below_a_grosz_change_nothing(self):
+        account = Account("Jane", "Smith", "85020212345")
+        assert account.incoming_transfer(0.005) is False
+        assert account.submit_for_loan(0.004) is False
+        assert (account.balance, list(account.transaction_history)) == (0, [])
+
+    def test_from_dict_uses_compact_history(self, monkeypatch):
+        monkeypatch.setattr(Company_Account, 'validate_nip', lambda self, nip: True)
+        company = Company_Account.from_dict({"company_name": "C", "NIP": "1234567890",
+                                             "balance": 5000, "transaction_history": [5000, -1775]})
+        assert isinstance(company.transaction_history, CompactHistory)
+        assert company.take_loan(1000) is True
+        assert company.transaction_history[-1] == 1000
+
+    def test_detached_copy_keeps_its_history(self):
+        account = Account("Jane", "Smith", "85020212345")
+        account.incoming_transfer(100)
+        saved = account.detached_copy()
+        account.outgoing_transfer(40)
+        assert isinstance(saved.transaction_history, CompactHistory)
+        assert (saved.balance, list(saved.transaction_history)) == (100, [100])
+        assert list(account.transaction_history) == [100, -40]
+
+
+class TestLazyHistory:
+    @pytest.fixture
+    def fetches(self):
+        return []
+
+    @pytest.fixture
+    def history(self, fetches):
+        stored = list(range(1, 21))
+
+        def load():
+            fetches.append(1)
+            return iter(stored)
+
+        return LazyHistory(load, len(stored), stored[-5:])
+
+    def test_recent_reads_do_not_fetch(self, history, fetches):
+        history.append(21)
+        assert len(history) == 21
+        assert history[-5:] == [17, 18, 19, 20, 21]
+        assert history[-1] == 21
+        assert history[15] == 16
+        assert history[18:] == [19, 20, 21]
+        assert not history.loaded
+        assert fetches == []
+
+    def test_older_reads_fetch_once(self, history, fetches):
+        history.append(21)
+        assert history[0] == 1
+        assert list(history) == list(range(1, 22))
+        assert history[::10] == [1, 11, 21]
+        assert 3 in history
+        assert history.loaded
+        assert fetches == [1]
+
+    def test_short_history_is_complete_without_fetch(self, fetches):
+        history = LazyHistory(lambda: fetches.append(1), 2, [5, 6])
+        assert history.loaded
+        assert history == [5, 6]
+        assert history == LazyHistory(lambda: [], 2, [5, 6])
+        assert history != "x"
+        assert repr(history) == "[5, 6]"
+        assert fetches == []
+
+    def test_restore_history_keeps_loan_rules(self, history, fetches):
+        source = Account("Jan", "Kowalski", "11111111111")
+        source.transaction_history = list(range(1, 21))
+        account = Account("Jan", "Kowalski", "11111111111")
+        account.restore_history(history, source.history_summary())
+        assert account.submit_for_loan(50)
+        assert account.transaction_history[-1] == 50
+        assert fetches == []
+
+    def test_stream_does_not_keep_stored_entries(self, history, fetches):
+        history.append(21)
+        assert list(history.stream()) == list(range(1, 22))
+        assert not history.loaded
+        assert list(history.stream()) == list(range(1, 22))
+        assert fetches == [1, 1]
+        history[0]
+        assert list(history.stream()) == list(range(1, 22))
+        assert fetches == [1, 1, 1]
+
+    def test_copy_stays_unloaded_and_independent(self, history, fetches):
+        history.append(21)
+        copied = history.copy()
+        history.append(22)
+        assert len(copied) == 21
+        assert copied[-2:] == [20, 21]
+        assert fetches == []
+        assert list(copied) == list(range(1, 22))
+        assert history[-1] == 22
@@ -11,7 +11,7 @@ class TestEmailHistory:
         return Account("John", "Doe", "12345678911")
     
     @pytest.fixture
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def company_account(self, mock_get):
         mock_response = Mock()
         mock_response.status_code = 200
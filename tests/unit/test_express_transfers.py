@@ -12,7 +12,7 @@ class TestExpressTransfer:
         return Account("John", "Doe", "65010112345")
     
     @pytest.fixture
-    @patch('src.account.requests.get')
+    @patch('src.mf_client.requests.Session.get')
     def company_account(self, mock_get):
         mock_response = Mock()
         mock_response.status_code = 200
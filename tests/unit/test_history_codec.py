@@ -0,0 +1,45 @@
+import pytest
+
+from src.history_codec import decode, decode_history, encode, encode_history
+
+
+class TestHistoryCodec:
+    @pytest.mark.parametrize("values", [
+        [],
+        [0],
+        [10000, -2500, -100],
+        [-100] * 7,
+        [5, 5, 7, 7, 7, -1, -1, 2 ** 62, -2 ** 63],
+        [-5000, -100, 300, -100, -100, -1775, -1775, -100, 0],
+    ])
+    def test_round_trip(self, values):
+        assert list(decode(encode(values))) == values
+
+    def test_small_amounts_take_few_bytes(self):
+        assert encode([1]) == bytes([8])
+        assert encode([-1]) == bytes([4])
+        # 100, 50 and -20 zloty: three bytes each instead of eight
+        assert len(encode([10000, 5000, -2000])) == 9
+
+    def test_repeated_entries_take_one_token(self):
+        assert encode([-100] * 1000) == bytes([0x9e, 0x06, 0x9b, 0x1f])
+        assert len(encode([-100] * 1000)) == 4
+        assert len(encode([5, -100, -100, -100, 7, 7, 7])) == 6
+
+    def test_fees_between_amounts_take_one_byte(self):
+        amounts = [-(1000 + 3791 * i % 99000) for i in range(100)]
+        express = [value for amount in amounts for value in (amount, -100)]
+        # One full token for the first fee, one byte for each one after it
+        assert len(encode(express)) <= len(encode(amounts)) + 3 + len(amounts) - 1
+        assert list(decode(encode(express))) == express
+
+    def test_truncated_input_is_rejected(self):
+        with pytest.raises(ValueError):
+            decode(encode([2 ** 20])[:-1])
+        with pytest.raises(ValueError):
+            decode(encode([3, 3, 5, 5, 5])[:1])
+
+    def test_amounts_in_zloty(self):
+        history = [100, 10.25, -50, -1, -1, -1775]
+        assert decode_history(encode_history(history)) == history
+        assert decode_history(b"") == []
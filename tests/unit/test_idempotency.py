@@ -0,0 +1,73 @@
+import pytest
+
+from src.idempotency import IdempotencyCache, create_idempotency_cache_from_env
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIdempotencyCache:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, clock):
+        return IdempotencyCache(ttl=100, max_size=3, clock=clock)
+
+    def test_miss_then_hit(self, cache):
+        assert cache.get("key-1") is None
+        cache.put("key-1", ("incoming", 100), ({"message": "ok"}, 200))
+        assert cache.get("key-1") == (("incoming", 100), ({"message": "ok"}, 200))
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_entries_expire(self, cache, clock):
+        cache.put("key-1", "a", 1)
+        clock.now = 60
+        cache.put("key-2", "b", 2)
+        clock.now = 120
+        assert cache.get("key-1") is None
+        assert cache.get("key-2") == ("b", 2)
+
+    def test_expired_entries_are_dropped_on_put(self, cache, clock):
+        cache.put("key-1", "a", 1)
+        cache.put("key-2", "b", 2)
+        clock.now = 150
+        cache.put("key-3", "c", 3)
+        assert cache.stats()["size"] == 1
+
+    def test_oldest_entry_is_evicted_when_full(self, cache):
+        for number in range(4):
+            cache.put(f"key-{number}", "a", number)
+        assert cache.get("key-0") is None
+        assert [cache.get(f"key-{number}") for number in (1, 2, 3)] == [("a", 1), ("a", 2), ("a", 3)]
+
+    def test_expired_key_can_be_stored_again(self, cache, clock):
+        cache.put("key-1", "a", 1)
+        cache.put("key-2", "b", 2)
+        clock.now = 150
+        cache.put("key-1", "c", 3)
+        assert cache.get("key-1") == ("c", 3)
+        assert cache.stats()["size"] == 1
+
+    def test_zero_size_disables_the_cache(self, clock):
+        cache = IdempotencyCache(max_size=0, clock=clock)
+        cache.put("key-1", "a", 1)
+        assert cache.get("key-1") is None
+
+    def test_clear(self, cache):
+        cache.put("key-1", "a", 1)
+        cache.get("key-1")
+        cache.clear()
+        assert cache.stats() == {"hits": 0, "misses": 0, "size": 0}
+
+    def test_settings_from_env(self, monkeypatch):
+        monkeypatch.setenv('BANK_APP_IDEMPOTENCY_TTL', '60')
+        monkeypatch.setenv('BANK_APP_IDEMPOTENCY_CACHE_SIZE', '10')
+        cache = create_idempotency_cache_from_env()
+        assert (cache.ttl, cache.max_size) == (60, 10)
@@ -0,0 +1,67 @@
+import threading
+
+from src.jobs import Job, JobManager
+
+
+def wait(job):
+    for _ in range(500):
+        if job.done:
+            return job
+        threading.Event().wait(0.01)
+    return job
+
+
+class TestJob:
+    def test_progress_and_elapsed(self):
+        now = [10.0]
+        job = Job("save", clock=lambda: now[0])
+        assert job.to_dict() == {"id": job.id, "type": "save", "status": "queued",
+                                 "processed": 0, "bytes": 0, "elapsed": 0}
+        job._start()
+        job.advance(2, 100)
+        now[0] = 12.5
+        assert job.to_dict()["elapsed"] == 2.5
+        job._finish(result={"count": 2})
+        now[0] = 20
+        data = job.to_dict()
+        assert (data["status"], data["processed"], data["bytes"], data["elapsed"]) == ("succeeded", 2, 100, 2.5)
+        assert data["result"] == {"count": 2}
+
+
+class TestJobManager:
+    def test_runs_jobs_in_order(self):
+        manager = JobManager()
+        order = []
+        first = manager.submit("save", lambda job: order.append(1))
+        second = manager.submit("load", lambda job: order.append(2) or {"count": 3})
+        assert wait(second).to_dict()["result"] == {"count": 3}
+        assert wait(first).status == "succeeded"
+        assert order == [1, 2]
+        assert manager.get(first.id) is first
+        manager.shutdown()
+
+    def test_failure_is_recorded(self):
+        manager = JobManager()
+
+        def fail(job):
+            raise ValueError("boom")
+
+        job = wait(manager.submit("save", fail))
+        assert job.status == "failed"
+        assert job.to_dict()["error"] == "boom"
+        manager.shutdown()
+
+    def test_only_finished_jobs_are_forgotten(self):
+        manager = JobManager(max_jobs=2)
+        release = threading.Event()
+        running = manager.submit("save", lambda job: release.wait(5))
+        queued = manager.submit("save", lambda job: None)
+        newest = manager.submit("save", lambda job: None)
+        assert [manager.get(job.id) for job in (running, queued, newest)] == [running, queued, newest]
+        release.set()
+        wait(newest)
+        latest = manager.submit("load", lambda job: None)
+        assert manager.get(running.id) is None
+        assert manager.get(queued.id) is None
+        assert manager.get(newest.id) is newest and manager.get(latest.id) is latest
+        manager.shutdown()
@@ -0,0 +1,292 @@
+import os
+import threading
+import time
+
+import pytest
+
+import src.journal as journal_mod
+from src.account import Account, AccountRegistry
+from src.journal import Journal, SNAPSHOT_FILE, create_journal_from_env, list_segments, recover
+from src.sharded_registry import ShardedAccountRegistry
+from src.snapshot import snapshot_columns, write_snapshot_file
+
+
+def create_record(pesel, name="Jan"):
+    return {"op": "create", "account": Account(name, "Kowalski", pesel).to_dict()}
+
+
+def transfer_record(pesel, transfer_type, amount):
+    return {"op": "transfer", "pesel": pesel, "type": transfer_type, "amount": amount}
+
+
+def write_records(directory, records, start_seq=0):
+    journal = Journal(directory, start_seq=start_seq)
+    seqs = [journal.append(record) for record in records]
+    journal.close()
+    return seqs
+
+
+def recovered(directory, registry=None):
+    registry = registry or AccountRegistry()
+    last_seq = recover(directory, registry)
+    return last_seq, {account.pesel: account for account in registry.get_all_accounts()}
+
+
+class TestJournal:
+    def test_sequence_numbers_and_durability(self, tmp_path):
+        journal = Journal(str(tmp_path))
+        first = journal.append(create_record("11111111111"))
+        second = journal.append(transfer_record("11111111111", "incoming", 10))
+        journal.wait_durable(second)
+        assert (first, second) == (1, 2)
+        assert journal.last_seq == journal.durable_seq == 2
+        journal.close()
+        journal.close()
+        with pytest.raises(RuntimeError):
+            journal.append(create_record("22222222222"))
+
+    def test_concurrent_appends_share_fsyncs(self, tmp_path):
+        journal = Journal(str(tmp_path))
+
+        def worker():
+            for _ in range(50):
+                journal.wait_durable(journal.append(transfer_record("11111111111", "incoming", 1)))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        journal.close()
+        assert journal.durable_seq == 400
+        assert journal.fsyncs < 400
+
+    def test_write_error_reaches_waiters(self, tmp_path, monkeypatch):
+        journal = Journal(str(tmp_path))
+
+        def failing_fsync(fd):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(journal_mod.os, 'fsync', failing_fsync)
+        seq = journal.append(create_record("11111111111"))
+        with pytest.raises(OSError):
+            journal.wait_durable(seq)
+
+    def test_rotate_starts_new_segment(self, tmp_path):
+        journal = Journal(str(tmp_path))
+        journal.append(create_record("11111111111"))
+        last_seq, old_segments = journal.rotate()
+        journal.append(transfer_record("11111111111", "incoming", 5))
+        journal.close()
+        assert last_seq == 1
+        assert [os.path.basename(path) for path in old_segments] == ["journal-00000000000000000001.log"]
+        assert [first for first, _ in list_segments(str(tmp_path))] == [1, 2]
+
+    def test_records_past_start_seq_are_cut_from_the_last_segment(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111"), create_record("22222222222")])
+        Journal(str(tmp_path), start_seq=1).close()
+        (_, path), _ = list_segments(str(tmp_path))
+        with open(path, 'rb') as segment:
+            assert segment.read().count(b'\n') == 1
+
+    def test_segments_past_start_seq_are_dropped(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111")], start_seq=5)
+        Journal(str(tmp_path), start_seq=3).close()
+        assert [first for first, _ in list_segments(str(tmp_path))] == [4]
+
+
+class TestRecovery:
+    def test_replays_every_operation(self, tmp_path):
+        write_records(str(tmp_path), [
+            create_record("11111111111"),
+            create_record("22222222222"),
+            transfer_record("11111111111", "incoming", 100),
+            transfer_record("11111111111", "outgoing", 30),
+            transfer_record("11111111111", "express", 20),
+            {"op": "update", "pesel": "11111111111", "fields": {"first_name": "Janusz"}},
+            {"op": "delete", "pesel": "22222222222"},
+            transfer_record("22222222222", "incoming", 5),
+        ])
+        last_seq, accounts = recovered(str(tmp_path))
+        assert last_seq == 8
+        assert list(accounts) == ["11111111111"]
+        account = accounts["11111111111"]
+        assert account.first_name == "Janusz"
+        assert account.balance == 100 - 30 - 20 - 1
+        assert account.transaction_history == [100, -30, -20, -1]
+        assert account.journal_seq == 6
+
+    def test_empty_directory(self, tmp_path):
+        assert recovered(str(tmp_path)) == (0, {})
+
+    def test_torn_tail_is_ignored(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111"), transfer_record("11111111111", "incoming", 10)])
+        (_, path), = list_segments(str(tmp_path))
+        with open(path, 'ab') as segment:
+            segment.write(b'{"seq":3,"op":"transfer","pesel":"11111111111","ty')
+        last_seq, accounts = recovered(str(tmp_path))
+        assert last_seq == 2
+        assert accounts["11111111111"].balance == 10
+
+    def test_records_after_a_torn_tail_survive_the_next_restart(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111"), transfer_record("11111111111", "incoming", 100)])
+        (_, path), = list_segments(str(tmp_path))
+        with open(path, 'ab') as segment:
+            segment.write(b'{"seq":3,"op":"transfer","pesel":"11111111111","ty')
+        registry = AccountRegistry()
+        journal = Journal(str(tmp_path), start_seq=recover(str(tmp_path), registry))
+        journal.wait_durable(journal.append(transfer_record("11111111111", "incoming", 50)))
+        journal.close()
+        with open(path, 'rb') as segment:
+            assert segment.read().endswith(b'}\n')
+        last_seq, accounts = recovered(str(tmp_path))
+        assert last_seq == 3
+        assert accounts["11111111111"].balance == 150
+
+    def test_unreadable_line_ends_replay(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111")])
+        (_, path), = list_segments(str(tmp_path))
+        with open(path, 'ab') as segment:
+            segment.write(b'garbage\n')
+        assert recovered(str(tmp_path))[0] == 1
+        Journal(str(tmp_path), start_seq=1).close()
+        with open(path, 'rb') as segment:
+            assert b'garbage' not in segment.read()
+
+    def test_sequence_gap_ends_replay(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111")])
+        write_records(str(tmp_path), [transfer_record("11111111111", "incoming", 10)], start_seq=2)
+        last_seq, accounts = recovered(str(tmp_path))
+        assert last_seq == 1
+        assert accounts["11111111111"].balance == 0
+
+    def test_snapshot_plus_tail(self, tmp_path):
+        registry = ShardedAccountRegistry()
+        journal = Journal(str(tmp_path))
+        for pesel in ("11111111111", "22222222222"):
+            account = Account("Jan", "Kowalski", pesel)
+            registry.add_account(account)
+            account.journal_seq = journal.append({"op": "create", "account": account.to_dict()})
+        account = registry.find_account_by_pesel("11111111111")
+        account.incoming_transfer(100)
+        account.journal_seq = journal.append(transfer_record("11111111111", "incoming", 100))
+
+        assert journal.write_snapshot(registry) == 3
+        assert len(list_segments(str(tmp_path))) == 1
+
+        account.outgoing_transfer(40)
+        account.journal_seq = journal.append(transfer_record("11111111111", "outgoing", 40))
+        journal.close()
+
+        last_seq, accounts = recovered(str(tmp_path), ShardedAccountRegistry())
+        assert last_seq == 4
+        assert accounts["11111111111"].balance == 60
+        assert accounts["11111111111"].transaction_history == [100, -40]
+        assert accounts["22222222222"].balance == 0
+
+    def test_records_already_in_snapshot_are_skipped(self, tmp_path):
+        # A transfer journaled after the rotation but applied before the
+        # account was exported is both in the snapshot and in the tail
+        registry = AccountRegistry()
+        journal = Journal(str(tmp_path))
+        account = Account("Jan", "Kowalski", "11111111111")
+        registry.add_account(account)
+        account.journal_seq = journal.append({"op": "create", "account": account.to_dict()})
+        start_seq, _ = journal.rotate()
+        account.incoming_transfer(10)
+        account.journal_seq = journal.append(transfer_record("11111111111", "incoming", 10))
+        # Re-creating an account that exists is also a no-op
+        journal.append(create_record("11111111111", name="Other"))
+        journal.close()
+        with open(os.path.join(str(tmp_path), SNAPSHOT_FILE), 'wb') as snapshot:
+            write_snapshot_file(snapshot, [snapshot_columns(account)], start_seq)
+
+        last_seq, accounts = recovered(str(tmp_path))
+        assert last_seq == 3
+        assert accounts["11111111111"].balance == 10
+        assert accounts["11111111111"].first_name == "Jan"
+
+    def test_internal_transfer_replays_each_side_once(self, tmp_path):
+        # The snapshot caught the target after the transfer and the source
+        # before it, so only the source still needs the record
+        registry = AccountRegistry()
+        journal = Journal(str(tmp_path))
+        source, target = Account("Jan", "Kowalski", "11111111111"), Account("Anna", "Nowak", "22222222222")
+        for account in (source, target):
+            registry.add_account(account)
+            account.journal_seq = journal.append({"op": "create", "account": account.to_dict()})
+        source.incoming_transfer(100)
+        source.journal_seq = journal.append(transfer_record("11111111111", "incoming", 100))
+        start_seq, _ = journal.rotate()
+        with open(os.path.join(str(tmp_path), SNAPSHOT_FILE), 'wb') as snapshot:
+            source_row = snapshot_columns(source)
+            source.outgoing_transfer(40)
+            target.incoming_transfer(40)
+            seq = journal.append({"op": "internal_transfer", "from": "11111111111", "to": "22222222222",
+                                  "amount": 40})
+            source.journal_seq = target.journal_seq = seq
+            journal.append({"op": "internal_transfer", "from": "11111111111", "to": "33333333333", "amount": 5})
+            write_snapshot_file(snapshot, [source_row, snapshot_columns(target)], start_seq)
+        journal.close()
+
+        last_seq, accounts = recovered(str(tmp_path))
+        assert last_seq == 5
+        assert accounts["11111111111"].balance == 55
+        assert accounts["22222222222"].balance == 40
+
+    def test_recovered_journal_continues_sequence(self, tmp_path):
+        write_records(str(tmp_path), [create_record("11111111111")])
+        registry = AccountRegistry()
+        journal = Journal(str(tmp_path), start_seq=recover(str(tmp_path), registry))
+        assert journal.append(transfer_record("11111111111", "incoming", 10)) == 2
+        journal.close()
+        assert recovered(str(tmp_path))[1]["11111111111"].balance == 10
+
+
+class TestJournalFromEnv:
+    def test_disabled_without_directory(self, monkeypatch):
+        monkeypatch.delenv('BANK_APP_JOURNAL_DIR', raising=False)
+        assert create_journal_from_env(AccountRegistry()) is None
+
+    def test_recovers_and_takes_periodic_snapshots(self, tmp_path, monkeypatch):
+        write_records(str(tmp_path), [create_record("11111111111")])
+        monkeypatch.setenv('BANK_APP_JOURNAL_DIR', str(tmp_path))
+        monkeypatch.setenv('BANK_APP_JOURNAL_SYNC', '0')
+        monkeypatch.setenv('BANK_APP_JOURNAL_SNAPSHOT_INTERVAL', '0.01')
+        registry = AccountRegistry()
+        journal = create_journal_from_env(registry)
+        try:
+            assert journal.sync is False
+            assert registry.find_account_by_pesel("11111111111") is not None
+            deadline = time.monotonic() + 5
+            while not os.path.exists(os.path.join(str(tmp_path), SNAPSHOT_FILE)) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert os.path.exists(os.path.join(str(tmp_path), SNAPSHOT_FILE))
+        finally:
+            journal.close()
+
+    @pytest.mark.parametrize("error", [OSError("read-only file system"), ValueError("read-only file system")])
+    def test_failed_snapshot_is_reported(self, tmp_path, caplog, error):
+        journal = Journal(str(tmp_path))
+        registry = AccountRegistry()
+
+        def failing_snapshot(registry):
+            stop.set()
+            raise error
+
+        journal.write_snapshot = failing_snapshot
+        stop = journal_mod.start_periodic_snapshots(journal, registry, 0.01)
+        deadline = time.monotonic() + 5
+        while "Journal snapshot failed: read-only file system" not in caplog.messages and time.monotonic() < deadline:
+            time.sleep(0.01)
+        journal.close()
+        assert stop.is_set()
+        assert "Journal snapshot failed: read-only file system" in caplog.messages
+
+    def test_snapshot_interval_zero_disables_snapshots(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('BANK_APP_JOURNAL_DIR', str(tmp_path))
+        monkeypatch.setenv('BANK_APP_JOURNAL_SNAPSHOT_INTERVAL', '0')
+        journal = create_journal_from_env(AccountRegistry())
+        assert journal.snapshots is None
+        assert journal.sync is True
+        journal.close()
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from src.account import Account, Company_Account
+
+
+def old_submit_for_loan_rule(history, amount):
+    if amount <= 0:
+        return False
+    if len(history) >= 3 and all(tx > 0 for tx in history[-3:]):
+        return True
+    if len(history) >= 5:
+        return sum(history[-5:]) > amount
+    return False
+
+
+def apply_random_operation(account, rnd):
+    operation = rnd.choice(("incoming", "outgoing", "express", "zus"))
+    amount = rnd.choice((1, 5, 10.5, 100, 250))
+    if operation == "incoming":
+        account.incoming_transfer(amount)
+    elif operation == "outgoing":
+        account.outgoing_transfer(amount)
+    elif operation == "express":
+        account.express_transfer(amount)
+    else:
+        account.outgoing_transfer(1775)
+
+
+class TestLoanAggregates:
+    @pytest.mark.parametrize("seed", range(20))
+    def test_submit_for_loan_matches_slice_rules(self, seed):
+        rnd = random.Random(seed)
+        account = Account("Jane", "Smith", "85020212345")
+        for _ in range(200):
+            apply_random_operation(account, rnd)
+            amount = rnd.choice((0, 10, 100, 500))
+            expected = old_submit_for_loan_rule(list(account.transaction_history), amount)
+            assert account.submit_for_loan(amount) is expected
+
+    def test_assigned_history_rebuilds_aggregates(self):
+        account = Account("Jane", "Smith", "85020212345")
+        account.transaction_history = [-10, 20, 30, 40]
+        assert account.submit_for_loan(1000) is True
+        account.transaction_history = [100, 100, -5, 100, 100]
+        assert account.submit_for_loan(394) is True
+        account.transaction_history = [100, 100, -5, 100, 100]
+        assert account.submit_for_loan(395) is False
+
+    def test_take_loan_counts_zus_payments(self, monkeypatch):
+        monkeypatch.setattr(Company_Account, 'validate_nip', lambda self, nip: True)
+        company = Company_Account("Firma", "1234567890")
+        company.incoming_transfer(10000)
+        assert company.take_loan(100) is False
+        company.outgoing_transfer(1775)
+        assert company.take_loan(100) is True
+
+    def test_from_dict_history_with_zus_payment(self, monkeypatch):
+        monkeypatch.setattr(Company_Account, 'validate_nip', lambda self, nip: True)
+        company = Company_Account.from_dict({"company_name": "Firma", "NIP": "1234567890",
+                                             "balance": 5000, "transaction_history": [6775, -1775]})
+        assert company.take_loan(2000) is True
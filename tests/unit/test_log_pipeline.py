@@ -0,0 +1,123 @@
+import logging
+
+import pytest
+
+from src import log_pipeline
+from src.log_pipeline import (RedactPesels, SampledLogger, configure_route, mask_pesel, parse_route_settings,
+                              route_logger, start_log_pipeline, start_log_pipeline_from_env, stop_log_pipeline)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_mask_pesel():
+    assert mask_pesel("89010112345") == "*******2345"
+    assert mask_pesel(123) == "123"
+
+
+def test_pesels_are_redacted():
+    record = logging.LogRecord("bank_app", logging.INFO, __file__, 1, "Account %s, NIP %s, id %s", (
+        "89010112345", "1234567890", "123456789012"), None)
+    assert RedactPesels().filter(record)
+    assert record.getMessage() == "Account *******2345, NIP 1234567890, id 123456789012"
+
+
+class TestSampledLogger:
+    @pytest.fixture
+    def handler(self):
+        handler = ListHandler()
+        logger = logging.getLogger("bank_app.test.sampled")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        yield handler
+        logger.removeHandler(handler)
+
+    def test_only_the_sample_is_logged(self, handler):
+        draws = iter([0.5, 0.005, 0.02, 0.5])
+        logger = SampledLogger(logging.getLogger("bank_app.test.sampled"), sample=0.01, rng=lambda: next(draws))
+        for number in range(4):
+            logger.info("request %d", number)
+        assert [record.getMessage() for record in handler.records] == ["request 1"]
+
+    def test_warnings_are_always_logged(self, handler):
+        logger = SampledLogger(logging.getLogger("bank_app.test.sampled"), sample=0)
+        logger.info("dropped")
+        logger.warning("kept")
+        assert [record.getMessage() for record in handler.records] == ["kept"]
+
+
+class TestRoutes:
+    @pytest.fixture(autouse=True)
+    def reset(self):
+        yield
+        configure_route("test_route", logging.NOTSET, 1.0)
+
+    def test_settings_are_parsed(self):
+        assert parse_route_settings("transfer=info@0.01, get_job=WARNING,,count=@0.5") == {
+            "transfer": ("INFO", 0.01), "get_job": ("WARNING", None), "count": (None, 0.5)}
+
+    def test_route_level_and_sample(self):
+        logger = route_logger("test_route")
+        assert route_logger("test_route") is logger
+        assert logger.logger.name == "bank_app.api.test_route"
+        configure_route("test_route", "WARNING", 0.1)
+        assert not logger.isEnabledFor(logging.INFO)
+        assert logger.sample == 0.1
+        configure_route("test_route", sample=0.5)
+        assert logger.logger.level == logging.WARNING
+
+
+class TestPipeline:
+    @pytest.fixture
+    def pipeline(self):
+        # The app starts its pipeline on import; swapped out for one writing here
+        running = log_pipeline._listener is not None
+        stop_log_pipeline()
+        handler = ListHandler()
+        yield handler
+        stop_log_pipeline()
+        configure_route("test_route", logging.NOTSET, 1.0)
+        if running:
+            start_log_pipeline_from_env()
+
+    def test_records_reach_the_handler_through_the_queue(self, pipeline):
+        listener = start_log_pipeline(pipeline, level=logging.INFO)
+        assert start_log_pipeline(pipeline) is listener
+        route_logger("test_route").info("Transfer request for pesel: %s", "89010112345")
+        route_logger("test_route").debug("not logged")
+        stop_log_pipeline()
+        stop_log_pipeline()
+        assert [record.getMessage() for record in pipeline.records] == ["Transfer request for pesel: *******2345"]
+        assert not logging.getLogger("bank_app").handlers
+        assert logging.getLogger("bank_app").propagate
+
+    def test_records_do_not_reach_the_root_logger(self, pipeline):
+        start_log_pipeline(pipeline, level=logging.INFO)
+        assert not logging.getLogger("bank_app").propagate
+        root = logging.getLogger()
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        root.addHandler(handler)
+        try:
+            route_logger("test_route").warning("Not written twice")
+        finally:
+            root.removeHandler(handler)
+        stop_log_pipeline()
+        assert records == []
+        assert [record.getMessage() for record in pipeline.records] == ["Not written twice"]
+
+    def test_settings_from_env(self, pipeline, monkeypatch):
+        monkeypatch.setenv('BANK_APP_LOG_LEVEL', 'warning')
+        monkeypatch.setenv('BANK_APP_LOG_ROUTES', 'test_route=INFO@0.25')
+        start_log_pipeline_from_env()
+        assert logging.getLogger("bank_app").level == logging.WARNING
+        assert route_logger("test_route").logger.level == logging.INFO
+        assert route_logger("test_route").sample == 0.25
+        logging.getLogger("bank_app").setLevel(logging.INFO)
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import src.mf_client as mf_client_mod
+from src.account import Company_Account
+from src.mf_client import MfApiClient, create_mf_client_from_env, get_mf_client
+
+
+class StubMfHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.client_address[1]))
+        if server.failures_left > 0:
+            server.failures_left -= 1
+            self._reply(503, {"message": "try later"})
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        self._reply(200, {"result": {"subject": {"statusVat": server.status_vat}}})
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubMfServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients that time out close the socket before the stub answers
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = StubMfServer(("127.0.0.1", 0), StubMfHandler)
+    server.requests = []
+    server.failures_left = 0
+    server.delay = 0
+    server.status_vat = "Czynny"
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestMfApiClient:
+    def test_search_nip_parses_response(self, stub_server):
+        client = MfApiClient(base_url=stub_server.url)
+        status, data = client.search_nip("8461627563", date="2025-01-02")
+        assert status == 200
+        assert data["result"]["subject"]["statusVat"] == "Czynny"
+        assert stub_server.requests[0][0] == "/api/search/nip/8461627563?date=2025-01-02"
+
+    def test_connections_are_reused(self, stub_server):
+        client = MfApiClient(base_url=stub_server.url)
+        for _ in range(5):
+            client.search_nip("8461627563")
+        client_ports = {port for _, port in stub_server.requests}
+        assert len(stub_server.requests) == 5
+        assert len(client_ports) == 1
+        client.close()
+
+    def test_retries_server_errors(self, stub_server):
+        stub_server.failures_left = 2
+        client = MfApiClient(base_url=stub_server.url, retries=2, backoff=0)
+        status, data = client.search_nip("8461627563")
+        assert status == 200
+        assert len(stub_server.requests) == 3
+
+    def test_gives_up_after_retries(self, stub_server):
+        stub_server.failures_left = 5
+        client = MfApiClient(base_url=stub_server.url, retries=1, backoff=0)
+        status, data = client.search_nip("8461627563")
+        assert status == 503
+        assert data is None
+        assert len(stub_server.requests) == 2
+
+    def test_read_timeout(self, stub_server):
+        stub_server.delay = 0.5
+        client = MfApiClient(base_url=stub_server.url, read_timeout=0.1, retries=0)
+        with pytest.raises(requests.exceptions.RequestException):
+            client.search_nip("8461627563")
+
+    def test_base_url_follows_env(self, monkeypatch):
+        monkeypatch.setenv('BANK_APP_MF_URL', 'http://mf.example/')
+        assert MfApiClient(session=object()).base_url == 'http://mf.example/'
+
+    def test_settings_from_env(self, monkeypatch):
+        monkeypatch.setenv('BANK_APP_MF_CONNECT_TIMEOUT', '1')
+        monkeypatch.setenv('BANK_APP_MF_READ_TIMEOUT', '2')
+        client = create_mf_client_from_env()
+        assert client.timeout == (1, 2)
+
+    def test_shared_client_is_created_once(self, monkeypatch):
+        monkeypatch.setattr(mf_client_mod, '_client', None)
+        assert get_mf_client() is get_mf_client()
+
+
+def test_company_validation_against_stub_server(stub_server, monkeypatch):
+    monkeypatch.setenv('BANK_APP_MF_URL', stub_server.url)
+    company = Company_Account("Co", "8461627563")
+    assert company.NIP == "8461627563"
+    stub_server.status_vat = "Zwolniony"
+    with pytest.raises(ValueError):
+        Company_Account("Co", "1234567890")
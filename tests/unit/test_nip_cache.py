@@ -0,0 +1,101 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from src.account import Company_Account
+from src.nip_cache import NipValidationCache, create_nip_cache_from_env, nip_validation_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNipValidationCache:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, clock):
+        return NipValidationCache(ttl=100, negative_ttl=10, max_size=2, clock=clock)
+
+    def test_miss_then_hit(self, cache):
+        assert cache.get("1234567890") is None
+        cache.put("1234567890", True)
+        assert cache.get("1234567890") is True
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_entries_expire(self, cache, clock):
+        cache.put("1111111111", True)
+        cache.put("2222222222", False)
+        clock.now = 50
+        assert cache.get("1111111111") is True
+        assert cache.get("2222222222") is None
+        clock.now = 150
+        assert cache.get("1111111111") is None
+        assert cache.stats()["size"] == 0
+
+    def test_least_recently_used_is_evicted(self, cache):
+        cache.put("1111111111", True)
+        cache.put("2222222222", True)
+        cache.get("1111111111")
+        cache.put("3333333333", True)
+        assert cache.get("2222222222") is None
+        assert cache.get("1111111111") is True
+        assert cache.get("3333333333") is True
+
+    def test_zero_size_disables_cache(self, clock):
+        cache = NipValidationCache(max_size=0, clock=clock)
+        cache.put("1111111111", True)
+        assert cache.get("1111111111") is None
+
+    def test_clear_resets_counters(self, cache):
+        cache.put("1111111111", True)
+        cache.get("1111111111")
+        cache.clear()
+        assert cache.stats() == {"hits": 0, "misses": 0, "size": 0}
+
+    def test_settings_from_env(self, monkeypatch):
+        monkeypatch.setenv('BANK_APP_NIP_CACHE_TTL', '60')
+        monkeypatch.setenv('BANK_APP_NIP_CACHE_NEGATIVE_TTL', '5')
+        monkeypatch.setenv('BANK_APP_NIP_CACHE_SIZE', '7')
+        cache = create_nip_cache_from_env()
+        assert (cache.ttl, cache.negative_ttl, cache.max_size) == (60, 5, 7)
+
+
+def mf_response(status_vat, status_code=200):
+    response = Mock()
+    response.status_code = status_code
+    response.json.return_value = {"result": {"subject": {"statusVat": status_vat}}}
+    return response
+
+
+class TestCompanyNipValidationCaching:
+    @patch('src.mf_client.requests.Session.get')
+    def test_repeated_validation_hits_network_once(self, mock_get):
+        mock_get.return_value = mf_response('Czynny')
+        Company_Account("Co", "8461627563")
+        Company_Account("Co", "8461627563")
+        assert mock_get.call_count == 1
+        assert nip_validation_cache.stats()["hits"] == 1
+
+    @patch('src.mf_client.requests.Session.get')
+    def test_inactive_result_is_cached(self, mock_get):
+        mock_get.return_value = mf_response('Zwolniony')
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                Company_Account("Co", "8461627563")
+        assert mock_get.call_count == 1
+
+    @patch('src.mf_client.requests.Session.get')
+    def test_errors_are_not_cached(self, mock_get):
+        mock_get.return_value = mf_response('Czynny', status_code=500)
+        with pytest.raises(ValueError):
+            Company_Account("Co", "8461627563")
+        mock_get.return_value = mf_response('Czynny')
+        assert Company_Account("Co", "8461627563").NIP == "8461627563"
+        assert mock_get.call_count == 2
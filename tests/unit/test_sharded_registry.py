@@ -0,0 +1,377 @@
+import random
+import threading
+
+import pytest
+
+from src.account import Account, AccountRegistry
+from src.sharded_registry import ShardedAccountRegistry, ShardedAccountStore, SharedLock
+
+
+def make_pesel(i: int) -> str:
+    return f"{i:011d}"
+
+
+class TestShardedAccountRegistry:
+    @pytest.fixture
+    def registry(self):
+        return ShardedAccountRegistry(shard_count=4)
+
+    def test_registry_create(self, registry):
+        assert registry.accounts == []
+        assert registry.get_accounts_count() == 0
+
+    def test_invalid_shard_count(self):
+        with pytest.raises(ValueError):
+            ShardedAccountStore(0)
+
+    def test_keeps_insertion_order_across_shards(self, registry):
+        accounts = [Account("First", "Last", make_pesel(i)) for i in range(20)]
+        for acc in accounts:
+            registry.add_account(acc)
+        assert registry.get_all_accounts() == accounts
+        assert list(registry) == accounts
+        assert registry.accounts[3] == accounts[3]
+
+    def test_find_and_remove(self, registry):
+        acc = Account("John", "Doe", "12345678911")
+        registry.add_account(acc)
+        assert registry.find_account_by_pesel("12345678911") is acc
+        assert acc in registry.accounts
+        assert registry.accounts.count(acc) == 1
+        assert registry.remove_account(acc) is True
+        assert registry.find_account_by_pesel("12345678911") is None
+        assert registry.remove_account(acc) is False
+
+    def test_clear(self, registry):
+        for i in range(10):
+            registry.add_account(Account("First", "Last", make_pesel(i)))
+        registry.accounts.clear()
+        assert registry.get_accounts_count() == 0
+        assert registry.find_account_by_pesel(make_pesel(1)) is None
+
+    def test_add_account_if_absent(self, registry):
+        assert registry.add_account_if_absent(Account("John", "Doe", "12345678911")) is True
+        assert registry.add_account_if_absent(Account("Jane", "Doe", "12345678911")) is False
+        assert registry.add_account_if_absent("not_an_account") is False
+        assert registry.get_accounts_count() == 1
+
+    def test_plain_registry_add_account_if_absent(self):
+        registry = AccountRegistry()
+        assert registry.add_account_if_absent(Account("John", "Doe", "12345678911")) is True
+        assert registry.add_account_if_absent(Account("Jane", "Doe", "12345678911")) is False
+        with registry.locked("12345678911"):
+            assert registry.get_accounts_count() == 1
+
+
+class TestShardedRegistryStress:
+    THREADS = 16
+
+    def _run(self, worker, count):
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_create_inserts_each_pesel_once(self):
+        registry = ShardedAccountRegistry(shard_count=8)
+        created = []
+
+        def worker(_):
+            for i in range(200):
+                if registry.add_account_if_absent(Account("Stress", "User", make_pesel(i))):
+                    created.append(i)
+
+        self._run(worker, self.THREADS)
+        assert sorted(created) == list(range(200))
+        assert registry.get_accounts_count() == 200
+
+    def test_concurrent_transfers_keep_balance_consistent(self):
+        registry = ShardedAccountRegistry(shard_count=8)
+        pesels = [make_pesel(i) for i in range(32)]
+        for pesel in pesels:
+            registry.add_account(Account("Stress", "User", pesel))
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            for _ in range(2000):
+                pesel = rnd.choice(pesels)
+                with registry.locked(pesel):
+                    account = registry.find_account_by_pesel(pesel)
+                    operation = rnd.choice(("incoming", "outgoing", "express"))
+                    amount = rnd.randint(1, 50)
+                    if operation == "incoming":
+                        account.incoming_transfer(amount)
+                    elif operation == "outgoing":
+                        account.outgoing_transfer(amount)
+                    else:
+                        account.express_transfer(amount)
+
+        self._run(worker, self.THREADS)
+        for account in registry:
+            assert account.balance == sum(account.transaction_history)
+
+
+class TestTransferLocks:
+    def test_shared_holders_run_together_and_exclusive_waits(self):
+        lock = SharedLock()
+        order = []
+
+        def exclusive():
+            with lock.exclusive():
+                order.append("exclusive")
+
+        with lock.shared(), lock.shared():
+            waiter = threading.Thread(target=exclusive)
+            waiter.start()
+            waiter.join(0.05)
+            assert order == []
+            order.append("shared done")
+        waiter.join(5)
+        assert order == ["shared done", "exclusive"]
+
+    def test_waiting_exclusive_holder_goes_before_new_shared_ones(self):
+        lock = SharedLock()
+        order = []
+        first = lock.shared()
+        first.__enter__()
+
+        def exclusive():
+            with lock.exclusive():
+                order.append("exclusive")
+
+        def shared():
+            with lock.shared():
+                order.append("shared")
+
+        writer = threading.Thread(target=exclusive)
+        writer.start()
+        while not lock._waiting_exclusive:
+            threading.Event().wait(0.001)
+        reader = threading.Thread(target=shared)
+        reader.start()
+        reader.join(0.05)
+        assert order == []
+        first.__exit__(None, None, None)
+        writer.join(5)
+        reader.join(5)
+        assert order == ["exclusive", "shared"]
+
+    def test_pair_locks_are_taken_in_shard_order(self):
+        registry = ShardedAccountRegistry(shard_count=8)
+        pesels = [make_pesel(i) for i in range(200)]
+        done = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(300):
+                source, target = rng.sample(pesels, 2)
+                with registry.locked_for_transfer(source, target):
+                    pass
+            done.append(seed)
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert sorted(done) == list(range(8))
+
+    def test_pause_waits_for_transfers_in_progress(self):
+        registry = ShardedAccountRegistry(shard_count=4)
+        events = []
+        def pause():
+            with registry.transfers_paused():
+                events.append("paused")
+
+        with registry.locked_for_transfer(make_pesel(1), make_pesel(2)):
+            pauser = threading.Thread(target=pause)
+            pauser.start()
+            pauser.join(0.05)
+            events.append("transfer done")
+        pauser.join(5)
+        assert events == ["transfer done", "paused"]
+
+    def test_tracking_notes_the_accounts_transfers_touch(self):
+        registry = ShardedAccountRegistry(shard_count=4)
+        with registry.tracking_transfers() as touched, registry.tracking_transfers() as other:
+            with registry.locked_for_transfer(make_pesel(1), make_pesel(2)):
+                pass
+            assert touched == other == {make_pesel(1), make_pesel(2)}
+        with registry.locked_for_transfer(make_pesel(3), make_pesel(4)):
+            pass
+        assert touched == {make_pesel(1), make_pesel(2)}
+        assert registry._trackers == []
+
+    def test_plain_registry_needs_no_locks(self):
+        registry = AccountRegistry()
+        with registry.locked_for_transfer(make_pesel(1), make_pesel(2)), registry.transfers_paused(), \
+                registry.tracking_transfers() as touched:
+            assert touched == set()
+
+
+class TestShardedRegistryPaging:
+    def test_pages_follow_insertion_order(self):
+        registry = ShardedAccountRegistry(shard_count=4)
+        accounts = [Account("First", "Last", make_pesel(i)) for i in range(30)]
+        for acc in accounts:
+            registry.add_account(acc)
+        page, cursor = registry.get_accounts_page(limit=12)
+        assert page == accounts[:12]
+        assert list(registry.iter_accounts(chunk_size=7)) == accounts
+
+
+    def test_full_page_without_limit(self):
+        registry = ShardedAccountRegistry(shard_count=3)
+        accounts = [Account("First", "Last", make_pesel(i)) for i in range(10)]
+        for acc in accounts:
+            registry.add_account(acc)
+        assert [acc for _, acc in registry.accounts.page()] == accounts
+
+    def test_page_stops_at_accounts_added_during_read(self):
+        registry = ShardedAccountRegistry(shard_count=1)
+        registry.add_account(Account("First", "Last", make_pesel(1)))
+        registry.add_account(Account("First", "Last", make_pesel(2)))
+        # Slot 1 was handed out after the page started reading
+        items = list(registry.accounts._shard_page_items(0, None, ceiling=1, batch=5))
+        assert [slot for slot, _ in items] == [0]
+
+    def test_replace_accounts_keeps_shard_count(self):
+        registry = ShardedAccountRegistry(shard_count=3)
+        registry.add_account(Account("Old", "User", make_pesel(99)))
+        accounts = [Account("New", "User", make_pesel(i)) for i in range(5)]
+        assert registry.replace_accounts(accounts) == 5
+        assert registry.accounts.shard_count == 3
+        assert registry.get_all_accounts() == accounts
+
+    def test_export_visits_every_account_once(self):
+        registry = ShardedAccountRegistry(shard_count=3)
+        accounts = [Account("First", "Last", make_pesel(i)) for i in range(20)]
+        registry.add_accounts_if_absent(accounts)
+        exported = list(registry.export(lambda acc: acc.pesel, chunk_size=2))
+        assert sorted(exported) == sorted(acc.pesel for acc in accounts)
+
+    def test_add_accounts_if_absent_reports_added(self):
+        registry = ShardedAccountRegistry(shard_count=3)
+        added = []
+        accounts = [Account("First", "Last", make_pesel(i)) for i in range(3)]
+        assert registry.add_accounts_if_absent(accounts + accounts[:1], added.append) == [True, True, True, False]
+        assert added == accounts
+
+
+class DictRepository:
+    """In-memory repository storing account documents, recording calls."""
+
+    def __init__(self, accounts=()):
+        self.docs = {account.pesel: account.to_dict() for account in accounts}
+        self.calls = []
+
+    def find(self, key):
+        self.calls.append(("find", key))
+        doc = self.docs.get(key)
+        return Account.from_stored(doc) if doc is not None else None
+
+    def save(self, accounts):
+        self.calls.append(("save", sorted(account.pesel for account in accounts)))
+        for account in accounts:
+            self.docs[account.pesel] = account.to_dict()
+            account.mark_clean()
+
+    def delete(self, key):
+        self.calls.append(("delete", key))
+        del self.docs[key]
+
+    def count(self):
+        return len(self.docs)
+
+
+class TestRepositoryCache:
+    @pytest.fixture
+    def repository(self):
+        return DictRepository(Account("Stored", "User", make_pesel(i)) for i in range(100))
+
+    @pytest.fixture
+    def registry(self, repository):
+        registry = ShardedAccountRegistry(shard_count=2)
+        registry.use_repository(repository, capacity=4)
+        return registry
+
+    def test_miss_reads_one_account_and_hit_reads_none(self, registry, repository):
+        account = registry.find_account_by_pesel(make_pesel(7))
+        assert account.first_name == "Stored"
+        assert registry.find_account_by_pesel(make_pesel(7)) is account
+        assert registry.find_account_by_pesel(make_pesel(500)) is None
+        assert registry.find_account_by_pesel(None) is None
+        assert repository.calls == [("find", make_pesel(7)), ("find", make_pesel(500))]
+
+    def test_count_comes_from_the_repository(self, registry, repository):
+        assert registry.get_accounts_count() == 100
+        assert registry.add_account_if_absent(Account("New", "User", make_pesel(200)))
+        assert not registry.add_account_if_absent(Account("Dup", "User", make_pesel(3)))
+        assert registry.get_accounts_count() == 101
+        assert len(registry.accounts.copy()) == 2
+
+    def test_changed_accounts_are_written_back_on_eviction(self, registry, repository):
+        changed = registry.find_account_by_pesel(make_pesel(0))
+        changed.incoming_transfer(100)
+        registry.add_account(Account("New", "User", make_pesel(200)))
+        for i in range(1, 40):
+            registry.find_account_by_pesel(make_pesel(i))
+        assert len(registry.accounts.copy()) <= 4
+        saves = [call for call in repository.calls if call[0] == "save"]
+        assert sorted(saves) == [("save", [make_pesel(0)]), ("save", [make_pesel(200)])]
+        assert repository.docs[make_pesel(0)]["balance"] == 100
+        assert registry.get_accounts_count() == 101
+
+        reloaded = registry.find_account_by_pesel(make_pesel(0))
+        assert reloaded is not changed and reloaded.balance == 100
+
+    def test_recently_used_accounts_stay_cached(self, repository):
+        registry = ShardedAccountRegistry(shard_count=1)
+        registry.use_repository(repository, capacity=2)
+        first = registry.find_account_by_pesel(make_pesel(1))
+        registry.find_account_by_pesel(make_pesel(2))
+        registry.find_account_by_pesel(make_pesel(1))
+        registry.find_account_by_pesel(make_pesel(3))
+        assert registry.find_account_by_pesel(make_pesel(1)) is first
+        assert [account.pesel for account in registry.get_all_accounts()] == [make_pesel(1), make_pesel(3)]
+
+    def test_failed_write_back_keeps_the_account(self, repository):
+        registry = ShardedAccountRegistry(shard_count=1)
+        registry.use_repository(repository, capacity=1)
+        account = registry.find_account_by_pesel(make_pesel(1))
+        account.incoming_transfer(10)
+        registry.find_account_by_pesel(make_pesel(2))
+        repository.save = lambda accounts: (_ for _ in ()).throw(ConnectionError("down"))
+        with pytest.raises(ConnectionError):
+            registry.find_account_by_pesel(make_pesel(3))
+        assert registry.find_account_by_pesel(make_pesel(1)) is account
+
+    def test_write_back_saves_only_changed_accounts(self, repository):
+        registry = ShardedAccountRegistry(shard_count=2)
+        registry.use_repository(repository, capacity=20)
+        registry.find_account_by_pesel(make_pesel(1)).incoming_transfer(5)
+        registry.find_account_by_pesel(make_pesel(2))
+        registry.add_account(Account("New", "User", make_pesel(300)))
+        assert registry.accounts.write_back() == 2
+        assert repository.docs[make_pesel(1)]["balance"] == 5
+        assert registry.get_accounts_count() == 101
+        assert registry.accounts.write_back() == 0
+
+    def test_remove_deletes_from_the_repository(self, registry, repository):
+        assert registry.remove_account(registry.find_account_by_pesel(make_pesel(5)))
+        assert make_pesel(5) not in repository.docs
+        new = Account("New", "User", make_pesel(300))
+        registry.add_account(new)
+        assert registry.remove_account(new)
+        assert ("delete", make_pesel(300)) not in repository.calls
+        assert registry.get_accounts_count() == 99
+        assert not registry.remove_account(Account("Gone", "User", make_pesel(6)))
+
+    def test_clear_drops_cached_accounts(self, registry, repository):
+        registry.find_account_by_pesel(make_pesel(1)).incoming_transfer(5)
+        registry.add_account(Account("New", "User", make_pesel(300)))
+        registry.accounts.clear()
+        assert registry.accounts.copy() == []
+        assert registry.get_accounts_count() == 100
+        assert registry.find_account_by_pesel(make_pesel(1)).balance == 0
@@ -0,0 +1,193 @@
+import io
+import threading
+
+import pytest
+
+from src.account import Account, AccountRegistry
+from src.history import CompactHistory, LazyHistory
+from src.operations import Transfer_operations
+from src.sharded_registry import LazySnapshotStore, ShardedAccountRegistry
+from src.snapshot import SnapshotFile, snapshot_columns, write_snapshot_file
+
+
+def make_pesel(i: int) -> str:
+    return f"{i:011d}"
+
+
+def make_accounts(count):
+    accounts = []
+    for i in range(count):
+        account = Account("Jan", f"Kowalski{i}", make_pesel(count - i))
+        account.incoming_transfer(100 + i)
+        account.outgoing_transfer(10.25)
+        account.journal_seq = i
+        accounts.append(account)
+    return accounts
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    def write(accounts, start_seq=0):
+        path = tmp_path / "snapshot.bin"
+        with open(path, 'wb') as file:
+            write_snapshot_file(file, (snapshot_columns(account) for account in accounts), start_seq)
+        return str(path)
+    return write
+
+
+class TestSnapshotFile:
+    def test_round_trip(self, snapshot_path):
+        accounts = make_accounts(5)
+        accounts[0].first_name = "Zażółć"
+        accounts[1].last_name = None
+        snapshot = SnapshotFile(snapshot_path(accounts, start_seq=42))
+        assert len(snapshot) == 5
+        assert snapshot.start_seq == 42
+        for index, original in enumerate(accounts):
+            account = snapshot.account(index)
+            assert account.pesel == original.pesel
+            assert account.first_name == original.first_name
+            assert account.balance == original.balance
+            assert account.fee == 1
+            assert account.transaction_history == [100 + index, -10.25]
+            assert account.journal_seq == index
+            assert not account.is_dirty
+        assert snapshot.account(1).last_name == ""
+
+    def test_find(self, snapshot_path):
+        accounts = make_accounts(4) + [Account("Dup", "Licate", make_pesel(2))]
+        snapshot = SnapshotFile(snapshot_path(accounts))
+        assert snapshot.find(make_pesel(2)) == [2, 4]
+        assert snapshot.find(make_pesel(4)) == [0]
+        assert snapshot.find(make_pesel(99)) == []
+        assert snapshot.find("ąę") == []
+        assert snapshot.find(None) == []
+
+    def test_compact_history_is_built_from_the_column(self, snapshot_path, monkeypatch):
+        path = snapshot_path(make_accounts(2))
+        monkeypatch.setattr(Transfer_operations, 'history_factory', CompactHistory)
+        account = SnapshotFile(path).account(1)
+        assert isinstance(account.transaction_history, CompactHistory)
+        assert account.transaction_history == [101, -10.25]
+        assert account.balance == 90.75
+
+    def test_unloaded_history_is_fetched_outside_the_lock_and_not_kept(self, tmp_path):
+        registry = ShardedAccountRegistry(shard_count=2)
+        account = Account("Jan", "Kowalski", make_pesel(1))
+        fetched_unlocked = []
+
+        def try_lock():
+            lock = registry.locked(account.pesel)
+            if lock.acquire(blocking=False):
+                lock.release()
+                fetched_unlocked.append(True)
+
+        def load():
+            # Another thread can take the shard lock, so the export is not holding it
+            other = threading.Thread(target=try_lock)
+            other.start()
+            other.join()
+            return iter(range(1, 9))
+
+        account.restore_history(LazyHistory(load, 8, [4, 5, 6, 7, 8]),
+                                {"positive_streak": 8, "zus_payments": 0})
+        account.incoming_transfer(9)
+        registry.add_account(account)
+        path = tmp_path / "snapshot.bin"
+        with open(path, 'wb') as file:
+            write_snapshot_file(file, registry.export(snapshot_columns))
+
+        assert fetched_unlocked == [True]
+        assert not account.transaction_history.loaded
+        assert SnapshotFile(str(path)).account(0).transaction_history == list(range(1, 10))
+
+    def test_empty_snapshot(self, snapshot_path):
+        snapshot = SnapshotFile(snapshot_path([]))
+        assert len(snapshot) == 0
+        assert list(snapshot.accounts()) == []
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "other.bin"
+        path.write_bytes(b"\0" * 64)
+        with pytest.raises(ValueError):
+            SnapshotFile(str(path))
+
+    def test_rejects_long_keys(self):
+        with pytest.raises(ValueError):
+            write_snapshot_file(io.BytesIO(), [("123456789012", "A", "B", 0, 100, 0, [])])
+
+
+class TestLazySnapshotStore:
+    def test_lookup_materializes_one_account(self, snapshot_path):
+        registry = ShardedAccountRegistry(shard_count=4)
+        assert registry.load_snapshot(SnapshotFile(snapshot_path(make_accounts(10)))) == 10
+        assert registry.get_accounts_count() == 10
+        account = registry.find_account_by_pesel(make_pesel(3))
+        assert account.last_name == "Kowalski7"
+        assert registry.find_account_by_pesel(make_pesel(3)) is account
+        assert registry.accounts._pending == 9
+        assert registry.find_account_by_pesel(make_pesel(99)) is None
+
+    def test_removed_accounts_stay_removed(self, snapshot_path):
+        registry = ShardedAccountRegistry(shard_count=4)
+        registry.load_snapshot(SnapshotFile(snapshot_path(make_accounts(3))))
+        assert registry.remove_account(registry.find_account_by_pesel(make_pesel(1)))
+        assert registry.find_account_by_pesel(make_pesel(1)) is None
+        assert registry.get_accounts_count() == 2
+
+    def test_insert_checks_the_snapshot(self, snapshot_path):
+        registry = ShardedAccountRegistry(shard_count=4)
+        registry.load_snapshot(SnapshotFile(snapshot_path(make_accounts(3))))
+        assert not registry.add_account_if_absent(Account("Jan", "Nowak", make_pesel(2)))
+        assert registry.add_accounts_if_absent([Account("Jan", "Nowak", make_pesel(1)),
+                                                Account("Jan", "Nowak", make_pesel(50))]) == [False, True]
+        assert [account.pesel for account in registry.get_all_accounts()] == \
+            [make_pesel(3), make_pesel(2), make_pesel(1), make_pesel(50)]
+
+    def test_pages_materialize_only_what_they_reach(self, snapshot_path):
+        registry = ShardedAccountRegistry(shard_count=4)
+        accounts = make_accounts(10)
+        registry.load_snapshot(SnapshotFile(snapshot_path(accounts)))
+        page, cursor = registry.get_accounts_page(limit=3)
+        assert [account.pesel for account in page] == [account.pesel for account in accounts[:3]]
+        assert registry.accounts._pending == 7
+        page, cursor = registry.get_accounts_page(cursor, 3)
+        assert [account.pesel for account in page] == [account.pesel for account in accounts[3:6]]
+        assert registry.accounts._pending == 4
+        assert len(registry.accounts.page()) == 10
+
+    def test_pages_skip_deleted_accounts(self, snapshot_path):
+        registry = ShardedAccountRegistry(shard_count=4)
+        accounts = make_accounts(10)
+        registry.load_snapshot(SnapshotFile(snapshot_path(accounts)))
+        for account in accounts[:4] + accounts[5:6]:
+            registry.remove_account(registry.find_account_by_pesel(account.pesel))
+        registry.add_account(Account("Jan", "Nowak", make_pesel(50)))
+        expected = [account.pesel for account in accounts[4:5] + accounts[6:]] + [make_pesel(50)]
+
+        page, cursor = registry.get_accounts_page(limit=3)
+        assert [account.pesel for account in page] == expected[:3]
+        assert registry.accounts._pending == 1
+        page, cursor = registry.get_accounts_page(cursor, 3)
+        assert [account.pesel for account in page] == expected[3:]
+        assert [account.pesel for account in registry.iter_accounts(chunk_size=2)] == expected
+        assert registry.get_accounts_count() == 6
+
+    def test_export_and_copy_materialize_everything(self, snapshot_path):
+        registry = ShardedAccountRegistry(shard_count=4)
+        accounts = make_accounts(6)
+        registry.load_snapshot(SnapshotFile(snapshot_path(accounts)))
+        assert sorted(registry.export(lambda account: account.pesel)) == sorted(a.pesel for a in accounts)
+        assert [account.pesel for account in registry.get_all_accounts()] == [a.pesel for a in accounts]
+        assert registry.accounts._pending == 0
+
+    def test_clear_drops_the_snapshot(self, snapshot_path):
+        store = LazySnapshotStore(SnapshotFile(snapshot_path(make_accounts(4))), shard_count=2)
+        store.clear()
+        assert len(store) == 0
+        assert store.first(make_pesel(1)) is None
+
+    def test_plain_registry_loads_everything(self, snapshot_path):
+        registry = AccountRegistry()
+        assert registry.load_snapshot(SnapshotFile(snapshot_path(make_accounts(3)))) == 3
+        assert registry.find_account_by_pesel(make_pesel(1)).balance == 102 - 10.25
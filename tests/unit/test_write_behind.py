@@ -0,0 +1,204 @@
+import threading
+import time
+
+import pytest
+
+from src.account import Account
+from src.sharded_registry import ShardedAccountRegistry
+from src.write_behind import WriteBehind, create_write_behind_from_env
+
+
+def make_pesel(i: int) -> str:
+    return f"{i:011d}"
+
+
+class RecordingRepository:
+    def __init__(self):
+        self.docs = {}
+        self.saves = []
+        self.fail = None
+        self.saved = threading.Event()
+
+    def save(self, accounts):
+        if self.fail is not None:
+            raise self.fail
+        self.saves.append(sorted(account.pesel for account in accounts))
+        for account in accounts:
+            self.docs[account.pesel] = account.to_dict()
+            account.mark_clean()
+        self.saved.set()
+
+    def delete(self, key):
+        self.docs.pop(key, None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class TestWriteBehind:
+    @pytest.fixture
+    def registry(self):
+        registry = ShardedAccountRegistry(shard_count=4)
+        for i in range(5):
+            registry.add_account(Account("Jan", "Kowalski", make_pesel(i)))
+        return registry
+
+    @pytest.fixture
+    def repository(self):
+        return RecordingRepository()
+
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def write_behind(self, registry, repository, clock):
+        # A long interval keeps the flusher out of the way; tests flush by hand
+        write_behind = WriteBehind(registry, repository, interval=60, max_pending=100, clock=clock)
+        yield write_behind
+        repository.fail = None
+        write_behind.close()
+
+    def test_repeated_changes_are_written_once(self, registry, repository, write_behind):
+        account = registry.find_account_by_pesel(make_pesel(1))
+        for _ in range(10):
+            account.incoming_transfer(10)
+            write_behind.mark(account.pesel)
+        assert write_behind.queue_depth == 1
+        assert write_behind.flush() == 1
+        assert repository.saves == [[make_pesel(1)]]
+        assert repository.docs[make_pesel(1)]["balance"] == 100
+        assert not account.is_dirty
+        assert write_behind.queue_depth == 0
+        assert write_behind.flush() == 0
+
+    def test_removed_accounts_are_deleted_and_clean_ones_skipped(self, registry, repository, write_behind):
+        repository.docs[make_pesel(2)] = {}
+        registry.remove_account(registry.find_account_by_pesel(make_pesel(2)))
+        write_behind.mark(make_pesel(2))
+        clean = registry.find_account_by_pesel(make_pesel(3))
+        clean.mark_clean()
+        write_behind.mark(clean.pesel)
+        assert write_behind.flush() == 1
+        assert make_pesel(2) not in repository.docs
+        assert repository.saves == []
+
+    def test_lag_and_queue_depth(self, write_behind, clock):
+        assert write_behind.lag == 0
+        write_behind.mark(make_pesel(1))
+        clock.now += 2
+        write_behind.mark(make_pesel(2))
+        write_behind.mark(make_pesel(1))
+        clock.now += 0.5
+        assert write_behind.stats() == {"queue_depth": 2, "lag_seconds": 2.5, "flushes": 0,
+                                        "written": 0, "errors": 0, "last_error": None}
+
+    def test_failed_flush_is_retried(self, registry, repository, write_behind, clock):
+        account = registry.find_account_by_pesel(make_pesel(1))
+        account.incoming_transfer(10)
+        write_behind.mark(account.pesel)
+        clock.now += 1
+        repository.fail = ConnectionError("repository down")
+        with pytest.raises(ConnectionError):
+            write_behind.flush()
+        assert account.is_dirty
+        write_behind.mark(make_pesel(2))
+        clock.now += 1
+        stats = write_behind.stats()
+        assert (stats["queue_depth"], stats["lag_seconds"]) == (2, 2)
+        assert (stats["errors"], stats["last_error"]) == (1, "repository down")
+
+        repository.fail = None
+        assert write_behind.flush() == 2
+        assert repository.saves == [[make_pesel(1), make_pesel(2)]]
+        assert write_behind.lag == 0
+
+    def test_transfers_go_on_while_a_flush_copies_accounts(self, registry, repository, write_behind):
+        first, second, third = make_pesel(1), make_pesel(2), make_pesel(3)
+        registry.find_account_by_pesel(first).incoming_transfer(100)
+        write_behind.mark(first, second, third)
+        locked = registry.locked
+        transferred = []
+
+        def transfer():
+            with registry.locked_for_transfer(first, third):
+                registry.find_account_by_pesel(first).outgoing_transfer(30)
+                registry.find_account_by_pesel(third).incoming_transfer(30)
+            transferred.append(True)
+
+        def locked_with_a_transfer(key):
+            if key == second and not transferred:
+                # The first account is copied, the third is not yet
+                thread = threading.Thread(target=transfer)
+                thread.start()
+                thread.join(5)
+            return locked(key)
+
+        registry.locked = locked_with_a_transfer
+        write_behind.flush()
+        assert transferred == [True]
+        assert (repository.docs[first]["balance"], repository.docs[third]["balance"]) == (70, 30)
+
+    def test_lag_counts_the_flush_in_progress(self, registry, repository, write_behind, clock):
+        write_behind.mark(make_pesel(1))
+        clock.now += 3
+        seen = []
+        repository.save = lambda accounts: seen.append((write_behind.queue_depth, write_behind.lag))
+        write_behind.flush()
+        assert seen == [(1, 3)]
+
+    def test_size_threshold_wakes_the_flusher(self, registry, repository):
+        write_behind = WriteBehind(registry, repository, interval=60, max_pending=3)
+        for i in range(3):
+            write_behind.mark(make_pesel(i))
+        assert repository.saved.wait(5)
+        assert repository.saves == [[make_pesel(0), make_pesel(1), make_pesel(2)]]
+        write_behind.close()
+
+    def test_interval_flush_survives_errors(self, registry, repository, caplog):
+        repository.fail = ConnectionError("repository down")
+        write_behind = WriteBehind(registry, repository, interval=0.01)
+        write_behind.mark(make_pesel(1))
+        assert wait_until(lambda: write_behind.errors > 0)
+        repository.fail = None
+        assert wait_until(lambda: write_behind.flushes > 0)
+        assert repository.saves == [[make_pesel(1)]]
+        write_behind.close()
+        assert "Write-behind flush failed: repository down" in caplog.messages
+
+    def test_close_writes_what_is_queued(self, registry, repository):
+        write_behind = WriteBehind(registry, repository, interval=60)
+        write_behind.mark(make_pesel(4))
+        write_behind.close()
+        assert repository.saves == [[make_pesel(4)]]
+
+
+class TestWriteBehindFromEnv:
+    def test_disabled_without_interval(self, monkeypatch):
+        monkeypatch.delenv('BANK_APP_WRITE_BEHIND_INTERVAL', raising=False)
+        factory_calls = []
+        assert create_write_behind_from_env(ShardedAccountRegistry(), factory_calls.append) is None
+        assert factory_calls == []
+
+    def test_enabled(self, monkeypatch):
+        import src.write_behind as write_behind_mod
+        registered = []
+        monkeypatch.setattr(write_behind_mod.atexit, 'register', registered.append)
+        monkeypatch.setenv('BANK_APP_WRITE_BEHIND_INTERVAL', '0.5')
+        monkeypatch.setenv('BANK_APP_WRITE_BEHIND_MAX_PENDING', '50')
+        write_behind = create_write_behind_from_env(ShardedAccountRegistry(), RecordingRepository)
+        assert (write_behind.interval, write_behind.max_pending) == (0.5, 50)
+        assert registered == [write_behind.close]
+        write_behind.close()